@@ -1,12 +1,44 @@
 import multiprocessing
 import os
+import shutil
+import tempfile
 
 bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
 
 # Worker configuration
-workers = 2
-worker_class = "sync"
-worker_connections = 1000
+# GUNICORN_PROFILE=gthread (default): a few processes with several threads
+# each, since most requests spend their time waiting on MySQL or HTTP.
+# Every thread needs its own pooled connection, so the thread count and
+# DB_POOL_SIZE go together (a warning is printed if both are set and
+# differ), and the number of workers is capped so that
+# workers * DB_POOL_SIZE stays under DB_MAX_CONNECTIONS.
+# GUNICORN_PROFILE=sync keeps the old one-request-per-process setup.
+# WEB_CONCURRENCY and GUNICORN_THREADS override the computed values.
+profile = os.environ.get("GUNICORN_PROFILE", "gthread")
+cpu_count = multiprocessing.cpu_count()
+db_max_connections = int(os.environ.get("DB_MAX_CONNECTIONS", 40))
+
+if profile == "sync":
+    worker_class = "sync"
+    workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+else:
+    worker_class = "gthread"
+    threads = int(os.environ.get("GUNICORN_THREADS", os.environ.get("DB_POOL_SIZE", 8)))
+    # Workers inherit the environment: without an explicit DB_POOL_SIZE the
+    # app's pool gets one connection per thread. An explicit value is kept.
+    os.environ.setdefault("DB_POOL_SIZE", str(threads))
+    pool_size = int(os.environ["DB_POOL_SIZE"])
+    if pool_size != threads:
+        print(
+            f"WARNING: GUNICORN_THREADS={threads} but DB_POOL_SIZE={pool_size}: "
+            + ("threads will wait for a free connection" if threads > pool_size
+               else "some pooled connections will stay idle")
+        )
+    workers = int(os.environ.get(
+        "WEB_CONCURRENCY",
+        max(1, min(cpu_count + 1, db_max_connections // pool_size))
+    ))
+
 timeout = 120
 keepalive = 5
 
@@ -29,3 +61,13 @@ tmp_upload_dir = None
 # SSL
 keyfile = None
 certfile = None
+
+# Metrics
+# Each worker dumps its counters to METRICAS_DIR/<pid>.json and /metrics
+# sums every file there. Files left by a previous run are removed at
+# startup so a new worker reusing an old pid does not inherit its numbers.
+def on_starting(server):
+    shutil.rmtree(
+        os.environ.get("METRICAS_DIR", os.path.join(tempfile.gettempdir(), "dotaciones_metricas")),
+        ignore_errors=True
+    )
@@ -9,4 +9,4 @@ sleep 2
 
 # Iniciar Gunicorn
 echo "🚀 Iniciando servidor..."
-gunicorn -c gunicorn.conf.py app:app
+gunicorn -c Gunicorn.conf.py app:app
@@ -2,16 +2,41 @@ import time
 import mysql.connector
 import uuid
 import os
+import zipfile
+import atexit
+import bisect
+import csv
+import gzip
+import hashlib
+import heapq
+import hmac
+import io
+import itertools
+import json
+import math
+import multiprocessing
+import queue
+import re
+import tempfile
+import threading
+import unicodedata
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 from io import BytesIO
 from urllib.parse import urlparse
-from flask import Flask, jsonify, request, session, render_template_string, make_response
+from xml.sax.saxutils import escape
+from flask import Flask, jsonify, request, session, make_response, Response, stream_with_context, send_file, g, has_request_context
 from flask_cors import CORS
 from flask_mail import Mail, Message
 from flask_bcrypt import Bcrypt
 from itsdangerous import URLSafeTimedSerializer
 from datetime import datetime, timedelta
+from decimal import Decimal
 from werkzeug.middleware.proxy_fix import ProxyFix
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
+from functools import lru_cache, wraps
 import requests
 
 try:
@@ -19,6 +44,16 @@ try:
 except ImportError:
     pisa = None
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 app = Flask(__name__)
 
 # ============================================
@@ -98,27 +133,1111 @@ def get_connection():
         print("ERROR CONECTANDO A MYSQL:", e)
         return None
 
+
+# ============================================
+# POOL DE CONEXIONES MYSQL
+# ============================================
+# Tamaño por worker de gunicorn: con N workers el máximo de conexiones
+# abiertas contra MySQL es N * DB_POOL_SIZE.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+DB_POOL_MAX_LIFETIME = float(os.environ.get("DB_POOL_MAX_LIFETIME", 1800))
+DB_POOL_PING_INTERVAL = float(os.environ.get("DB_POOL_PING_INTERVAL", 30))
+
+
+class ErrorConexionDB(RuntimeError):
+    pass
+
+
+class PoolConexiones:
+
+    def __init__(self, tamano, timeout, vida_maxima, intervalo_ping):
+        self.tamano = max(1, tamano)
+        self.timeout = timeout
+        self.vida_maxima = vida_maxima
+        self.intervalo_ping = intervalo_ping
+        self._heredadas = []
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._lock = threading.Lock()
+        self._cupos = threading.BoundedSemaphore(self.tamano)
+        # (conexion, creada, ultimo_uso); se reutiliza la más reciente primero
+        self._libres = []
+        self._en_uso = {}
+
+    def reiniciar_tras_fork(self):
+        # Los sockets heredados del proceso padre no se cierran aquí: un
+        # close() enviaría COM_QUIT y mataría la sesión que usa el padre.
+        self._heredadas.extend(conn for conn, _, _ in self._libres)
+        self._heredadas.extend(conn for conn, _ in self._en_uso.values())
+        self._reiniciar()
+
+    def obtener(self):
+        if not self._cupos.acquire(timeout=self.timeout):
+            raise ErrorConexionDB("Pool de conexiones agotado")
+
+        try:
+            conn, creada = self._tomar_libre() or self._crear()
+        except Exception:
+            self._cupos.release()
+            raise
+
+        with self._lock:
+            self._en_uso[id(conn)] = (conn, creada)
+        return conn
+
+    def _tomar_libre(self):
+        while True:
+            with self._lock:
+                if not self._libres:
+                    return None
+                conn, creada, ultimo_uso = self._libres.pop()
+
+            ahora = time.monotonic()
+            if ahora - creada > self.vida_maxima:
+                self._cerrar(conn)
+                continue
+
+            if ahora - ultimo_uso > self.intervalo_ping:
+                try:
+                    conn.ping(reconnect=False)
+                except Exception:
+                    self._cerrar(conn)
+                    continue
+
+            return conn, creada
+
+    def _crear(self):
+        conn = get_connection()
+        if conn is None:
+            raise ErrorConexionDB("No se pudo conectar a la base de datos")
+        return conn, time.monotonic()
+
+    def devolver(self, conn, descartar=False):
+        with self._lock:
+            entrada = self._en_uso.pop(id(conn), None)
+
+        # Conexión prestada antes de un fork: no pertenece a este proceso
+        if entrada is None:
+            return
+
+        try:
+            _, creada = entrada
+            if descartar or time.monotonic() - creada > self.vida_maxima:
+                self._cerrar(conn)
+                return
+
+            # Descarta resultados pendientes y cierra la transacción implícita
+            # para que el siguiente préstamo no vea una instantánea vieja.
+            conn.rollback()
+
+            with self._lock:
+                self._libres.append((conn, creada, time.monotonic()))
+        except Exception:
+            self._cerrar(conn)
+        finally:
+            self._cupos.release()
+
+    def cerrar_todas(self):
+        with self._lock:
+            libres, self._libres = self._libres, []
+
+        for conn, _, _ in libres:
+            self._cerrar(conn)
+
+    @staticmethod
+    def _cerrar(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+pool_db = PoolConexiones(
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_POOL_MAX_LIFETIME,
+    DB_POOL_PING_INTERVAL
+)
+
+# Gunicorn hace fork de los workers: cada proceso arranca con su pool vacío
+os.register_at_fork(after_in_child=pool_db.reiniciar_tras_fork)
+atexit.register(pool_db.cerrar_todas)
+
+
+# ============================================
+# MÉTRICAS
+# ============================================
+# Cada worker acumula sus métricas (y las estadísticas de consultas de la
+# sección siguiente) en memoria y cada METRICAS_INTERVALO segundos las
+# vuelca a METRICAS_DIR/<pid>-<arranque>.json: el momento de arranque evita
+# que un pid reutilizado pise el archivo de otro worker. /metrics suma los
+# archivos de todos los workers. Los de procesos que ya no existen se
+# suman a METRICAS_DIR/terminados.json y se borran, así los contadores no
+# retroceden cuando gunicorn reinicia un worker y el directorio no crece.
+# METRICAS_DIR debe ser local al equipo: se comprueba si el pid sigue vivo.
+METRICAS_DIR = os.environ.get(
+    "METRICAS_DIR",
+    os.path.join(tempfile.gettempdir(), "dotaciones_metricas")
+)
+METRICAS_INTERVALO = float(os.environ.get("METRICAS_INTERVALO", 5))
+METRICAS_TOKEN = os.environ.get("METRICAS_TOKEN")
+
+# Estadísticas por huella de consulta (ver TRAZAS DE CONSULTAS)
+CONSULTA_LENTA_MS = float(os.environ.get("CONSULTA_LENTA_MS", 500))
+CONSULTAS_MAX_HUELLAS = int(os.environ.get("CONSULTAS_MAX_HUELLAS", 500))
+CONSULTAS_LENTAS_MAX = int(os.environ.get("CONSULTAS_LENTAS_MAX", 50))
+CONSULTAS_MAX_TEXTO = 2000
+
+METRICAS_TERMINADOS = "terminados.json"
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTADORES = {
+    "http_requests_total": "Peticiones atendidas por ruta, método y estado",
+    "db_queries_total": "Consultas enviadas a MySQL por ruta",
+}
+
+HISTOGRAMAS = {
+    "http_request_duration_seconds": ("Duración de la petición por ruta", BUCKETS_SEGUNDOS),
+    "http_response_size_bytes": ("Tamaño del cuerpo de la respuesta", BUCKETS_BYTES),
+    "db_request_duration_seconds": ("Tiempo en MySQL por petición", BUCKETS_SEGUNDOS),
+    "db_connection_acquire_seconds": ("Espera para obtener una conexión del pool", BUCKETS_SEGUNDOS),
+}
+
+
+def proceso_vivo(pid):
+    if pid is None:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def pid_archivo_metricas(nombre):
+    # "<pid>-<arranque>.json" (o su .tmp); None si no es de un worker
+    pid = nombre.split("-", 1)[0].split(".", 1)[0]
+    return int(pid) if pid.isdigit() else None
+
+
+class MetricasProceso:
+
+    def __init__(self, directorio, intervalo):
+        self.directorio = directorio
+        self.intervalo = intervalo
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._lock = threading.Lock()
+        # (nombre, etiquetas) -> valor; etiquetas es una tupla de pares
+        self._contadores = defaultdict(float)
+        # (nombre, etiquetas) -> [conteo por cubeta..., conteo +Inf, suma]
+        self._histogramas = {}
+        # huella -> [llamadas, segundos, máximo, filas, ejemplo]
+        self._consultas = {}
+        self._lentas = deque(maxlen=CONSULTAS_LENTAS_MAX)
+        self._volcado = time.monotonic()
+        self._arranque = time.time_ns()
+
+    def reiniciar_tras_fork(self):
+        # Lo contado por el proceso padre ya está en su propio archivo
+        self._reiniciar()
+
+    def contar(self, nombre, etiquetas=(), valor=1):
+        with self._lock:
+            self._contadores[(nombre, etiquetas)] += valor
+
+    def observar(self, nombre, etiquetas, valor):
+        limites = HISTOGRAMAS[nombre][1]
+        with self._lock:
+            cubetas = self._histogramas.get((nombre, etiquetas))
+            if cubetas is None:
+                cubetas = self._histogramas[(nombre, etiquetas)] = [0] * (len(limites) + 2)
+            cubetas[bisect.bisect_left(limites, valor)] += 1
+            cubetas[-1] += valor
+
+    def registrar_consulta(self, huella, duracion, filas, sql):
+        with self._lock:
+            entrada = self._consultas.get(huella)
+            if entrada is None:
+                if len(self._consultas) >= CONSULTAS_MAX_HUELLAS:
+                    # Se olvida la que menos tiempo acumula
+                    del self._consultas[min(self._consultas, key=lambda h: self._consultas[h][1])]
+                entrada = self._consultas[huella] = [0, 0.0, 0.0, 0, sql[:CONSULTAS_MAX_TEXTO]]
+
+            entrada[0] += 1
+            entrada[1] += duracion
+            entrada[2] = max(entrada[2], duracion)
+            entrada[3] += filas
+
+    def registrar_lenta(self, lenta):
+        with self._lock:
+            self._lentas.append(lenta)
+
+    def instantanea(self):
+        with self._lock:
+            return {
+                "contadores": [[n, e, v] for (n, e), v in self._contadores.items()],
+                "histogramas": [[n, e, list(c)] for (n, e), c in self._histogramas.items()],
+                "consultas": [[h] + e for h, e in self._consultas.items()],
+                "lentas": [dict(lenta) for lenta in self._lentas]
+            }
+
+    def _ruta(self):
+        return os.path.join(self.directorio, f"{os.getpid()}-{self._arranque}.json")
+
+    @contextmanager
+    def _bloqueo(self, compartido):
+        # Compartido para leer los archivos, exclusivo para consolidarlos:
+        # quien lee no ve un worker sumado en terminados.json y en su archivo
+        with open(os.path.join(self.directorio, "metricas.lock"), "a") as bloqueo:
+            if fcntl:
+                fcntl.flock(bloqueo, fcntl.LOCK_SH if compartido else fcntl.LOCK_EX)
+            yield
+
+    def volcar(self, forzar=False):
+        ahora = time.monotonic()
+        if not forzar and ahora - self._volcado < self.intervalo:
+            return
+        self._volcado = ahora
+
+        datos = self.instantanea()
+
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            if any(datos.values()):
+                ruta = self._ruta()
+                temporal = f"{ruta}.{threading.get_ident()}.tmp"
+                with open(temporal, "w", encoding="utf-8") as archivo:
+                    json.dump(datos, archivo)
+                os.replace(temporal, ruta)
+
+            self._consolidar_terminados()
+        except OSError as e:
+            print("ERROR GUARDANDO METRICAS:", e)
+
+    def _consolidar_terminados(self):
+        with self._bloqueo(compartido=False):
+            terminados = []
+            with os.scandir(self.directorio) as entradas:
+                for entrada in entradas:
+                    pid = pid_archivo_metricas(entrada.name)
+                    if pid is not None and not proceso_vivo(pid):
+                        terminados.append(entrada)
+
+            if not terminados:
+                return
+
+            ruta_total = os.path.join(self.directorio, METRICAS_TERMINADOS)
+            instantaneas = []
+            for entrada in [ruta_total] + [e.path for e in terminados if e.name.endswith(".json")]:
+                try:
+                    with open(entrada, encoding="utf-8") as archivo:
+                        instantaneas.append(json.load(archivo))
+                except (OSError, ValueError):
+                    continue
+
+            contadores, histogramas, consultas, lentas = self._combinar(instantaneas)
+            # Mismo límite de huellas que cada worker: se quedan las más costosas
+            consultas = sorted(consultas.items(), key=lambda c: c[1][1], reverse=True)
+            datos = {
+                "contadores": [[n, e, v] for (n, e), v in contadores.items()],
+                "histogramas": [[n, e, c] for (n, e), c in histogramas.items()],
+                "consultas": [[h] + e for h, e in consultas[:CONSULTAS_MAX_HUELLAS]],
+                "lentas": lentas
+            }
+
+            temporal = f"{ruta_total}.{os.getpid()}.tmp"
+            with open(temporal, "w", encoding="utf-8") as archivo:
+                json.dump(datos, archivo)
+            os.replace(temporal, ruta_total)
+
+            for entrada in terminados:
+                try:
+                    os.remove(entrada.path)
+                except FileNotFoundError:
+                    pass
+
+    def _instantaneas(self):
+        # Este worker aporta lo que tiene en memoria; los demás, su archivo
+        instantaneas = [self.instantanea()]
+        propio = os.path.basename(self._ruta())
+        try:
+            with self._bloqueo(compartido=True), os.scandir(self.directorio) as entradas:
+                for entrada in entradas:
+                    if entrada.name == propio or not entrada.name.endswith(".json"):
+                        continue
+                    try:
+                        with open(entrada.path, encoding="utf-8") as archivo:
+                            instantaneas.append(json.load(archivo))
+                    except (OSError, ValueError):
+                        continue
+        except FileNotFoundError:
+            pass
+
+        return instantaneas
+
+    @staticmethod
+    def _combinar(instantaneas):
+        contadores = defaultdict(float)
+        histogramas = {}
+        consultas = {}
+        lentas = []
+        for datos in instantaneas:
+            for nombre, etiquetas, valor in datos["contadores"]:
+                contadores[(nombre, tuple(map(tuple, etiquetas)))] += valor
+            for nombre, etiquetas, cubetas in datos["histogramas"]:
+                clave = (nombre, tuple(map(tuple, etiquetas)))
+                if nombre not in HISTOGRAMAS or len(cubetas) != len(HISTOGRAMAS[nombre][1]) + 2:
+                    # Archivo de una versión con otras cubetas
+                    continue
+                if clave in histogramas:
+                    histogramas[clave] = [a + b for a, b in zip(histogramas[clave], cubetas)]
+                else:
+                    histogramas[clave] = list(cubetas)
+            for huella, llamadas, segundos, maximo, filas, ejemplo in datos.get("consultas", []):
+                entrada = consultas.setdefault(huella, [0, 0.0, 0.0, 0, ejemplo])
+                entrada[0] += llamadas
+                entrada[1] += segundos
+                entrada[2] = max(entrada[2], maximo)
+                entrada[3] += filas
+            lentas.extend(datos.get("lentas", []))
+
+        lentas.sort(key=lambda lenta: lenta["fecha"], reverse=True)
+        return contadores, histogramas, consultas, lentas[:CONSULTAS_LENTAS_MAX]
+
+    def agregadas(self):
+        contadores, histogramas, _, _ = self._combinar(self._instantaneas())
+        return contadores, histogramas
+
+    def consultas_agregadas(self):
+        _, _, consultas, lentas = self._combinar(self._instantaneas())
+        return consultas, lentas
+
+
+metricas = MetricasProceso(METRICAS_DIR, METRICAS_INTERVALO)
+
+os.register_at_fork(after_in_child=metricas.reiniciar_tras_fork)
+atexit.register(metricas.volcar, True)
+
+
+def medida_actual():
+    # Acumulados de la petición en curso; None fuera de una petición
+    # (hilos de fondo, comandos CLI, procesos de reportes).
+    return g.get("medida") if has_request_context() else None
+
+
+class CursorMedido:
+    # Envuelve el cursor de mysql-connector para sumar consultas y tiempo
+    # de MySQL (ejecución y lectura de filas) a la petición en curso, si la
+    # hay, y trazar cada sentencia (ver TRAZAS DE CONSULTAS). El resto de
+    # atributos pasa directo al cursor original.
+
+    def __init__(self, cursor, medida=None, traza=None):
+        self._cursor = cursor
+        self._medida = medida
+        # [sql, params, segundos, filas] de la sentencia en curso
+        self._traza = traza
+        self._propia = traza is None
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _sumar(self, duracion, filas=0):
+        if self._medida is not None:
+            self._medida["db"] += duracion
+        if self._traza is not None:
+            self._traza[2] += duracion
+            self._traza[3] += filas
+
+    def _medir(self, func, *args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._sumar(time.perf_counter() - inicio)
+
+    def _iniciar(self, sql, params):
+        self._terminar()
+        self._traza = [sql, params, 0.0, 0]
+        if self._medida is not None:
+            self._medida["consultas"] += 1
+
+    def _terminar(self):
+        traza, self._traza = self._traza, None
+        if traza is None or not self._propia:
+            return
+
+        sql, params, duracion, filas = traza
+        if not filas:
+            # INSERT/UPDATE/DELETE: filas afectadas
+            try:
+                filas = max(0, self._cursor.rowcount or 0)
+            except Exception:
+                filas = 0
+        trazar_consulta(sql, params, duracion, filas)
+
+    def _resultados(self, resultados):
+        # Con multi=True cada sentencia se ejecuta al avanzar el generador
+        while True:
+            inicio = time.perf_counter()
+            try:
+                resultado = next(resultados)
+            except StopIteration:
+                return
+            finally:
+                self._sumar(time.perf_counter() - inicio)
+            yield CursorMedido(resultado, self._medida, self._traza)
+
+    def execute(self, operation, params=None, **kwargs):
+        self._iniciar(operation, params)
+        resultado = self._medir(self._cursor.execute, operation, params, **kwargs)
+        if kwargs.get("multi"):
+            return self._resultados(resultado)
+        return resultado
+
+    def executemany(self, operation, seq_params):
+        # Sin parámetros en la traza: EXPLAIN no aplica a inserciones por lote
+        self._iniciar(operation, None)
+        return self._medir(self._cursor.executemany, operation, seq_params)
+
+    def callproc(self, procname, args=()):
+        self._iniciar(f"CALL {procname}", None)
+        return self._medir(self._cursor.callproc, procname, args)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        fila = self._cursor.fetchone()
+        self._sumar(time.perf_counter() - inicio, 0 if fila is None else 1)
+        return fila
+
+    def fetchmany(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        filas = self._cursor.fetchmany(*args, **kwargs)
+        self._sumar(time.perf_counter() - inicio, len(filas))
+        return filas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        filas = self._cursor.fetchall()
+        self._sumar(time.perf_counter() - inicio, len(filas))
+        return filas
+
+    def close(self):
+        try:
+            self._terminar()
+        except Exception as e:
+            print("ERROR TRAZANDO CONSULTA:", e)
+        return self._cursor.close()
+
+
+@app.before_request
+def iniciar_medida():
+    g.medida = {"inicio": time.perf_counter(), "db": 0.0, "consultas": 0, "conexion": 0.0, "bytes": 0}
+
+
+def contar_bytes(fragmentos, medida):
+    try:
+        for fragmento in fragmentos:
+            if isinstance(fragmento, str):
+                fragmento = fragmento.encode("utf-8")
+            medida["bytes"] += len(fragmento)
+            yield fragmento
+    finally:
+        cerrar = getattr(fragmentos, "close", None)
+        if cerrar:
+            cerrar()
+
+
+def cerrar_medida(medida, etiquetas, estado):
+    duracion = time.perf_counter() - medida["inicio"]
+    metricas.contar("http_requests_total", etiquetas + (("estado", str(estado)),))
+    metricas.contar("db_queries_total", etiquetas, medida["consultas"])
+    metricas.observar("http_request_duration_seconds", etiquetas, duracion)
+    metricas.observar("http_response_size_bytes", etiquetas, medida["bytes"])
+    metricas.observar("db_request_duration_seconds", etiquetas, medida["db"])
+    metricas.volcar()
+
+
+@app.after_request
+def registrar_medida(response):
+    medida = g.pop("medida", None)
+    if medida is None:
+        return response
+
+    # Con la regla y no la URL: /GetProductos?x=1 y ?x=2 cuentan juntas y
+    # las rutas inexistentes no crean series nuevas.
+    ruta = request.url_rule.rule if request.url_rule else "sin_ruta"
+    etiquetas = (("metodo", request.method), ("ruta", ruta))
+
+    # En respuestas en streaming solo cuenta lo ocurrido antes del primer
+    # fragmento; las métricas sí esperan a que termine el envío.
+    total = (time.perf_counter() - medida["inicio"]) * 1000
+    db = medida["db"] * 1000
+    conexion = medida["conexion"] * 1000
+    response.headers["Server-Timing"] = ", ".join([
+        f"conn;dur={conexion:.1f}",
+        f'db;dur={db:.1f};desc="{medida["consultas"]} consultas"',
+        f"app;dur={max(0.0, total - db - conexion):.1f}",
+        f"total;dur={total:.1f}"
+    ])
+
+    if response.is_streamed and response.content_length is None:
+        response.response = contar_bytes(response.response, medida)
+    else:
+        medida["bytes"] = response.content_length or 0
+
+    estado = response.status_code
+    response.call_on_close(lambda: cerrar_medida(medida, etiquetas, estado))
+    return response
+
+
+def formatear_valor_metrica(valor):
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+def escapar_etiqueta(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def formatear_etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{clave}="{escapar_etiqueta(valor)}"' for clave, valor in etiquetas) + "}"
+
+
+def exposicion_prometheus(contadores, histogramas):
+    lineas = []
+
+    for nombre, ayuda in CONTADORES.items():
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} counter")
+        for (n, etiquetas), valor in sorted(contadores.items()):
+            if n == nombre:
+                lineas.append(f"{nombre}{formatear_etiquetas(etiquetas)} {formatear_valor_metrica(valor)}")
+
+    for nombre, (ayuda, limites) in HISTOGRAMAS.items():
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} histogram")
+        for (n, etiquetas), cubetas in sorted(histogramas.items()):
+            if n != nombre:
+                continue
+
+            acumulado = 0
+            for limite, conteo in zip(limites + ("+Inf",), cubetas):
+                acumulado += conteo
+                le = limite if limite == "+Inf" else formatear_valor_metrica(limite)
+                lineas.append(f"{nombre}_bucket{formatear_etiquetas(etiquetas + (('le', le),))} {acumulado}")
+            lineas.append(f"{nombre}_sum{formatear_etiquetas(etiquetas)} {formatear_valor_metrica(cubetas[-1])}")
+            lineas.append(f"{nombre}_count{formatear_etiquetas(etiquetas)} {acumulado}")
+
+    return "\n".join(lineas) + "\n"
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    if METRICAS_TOKEN:
+        enviado = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(enviado.encode(), METRICAS_TOKEN.encode()):
+            return jsonify({"ok": False, "error": "No autorizado"}), 401
+
+    contadores, histogramas = metricas.agregadas()
+    return Response(
+        exposicion_prometheus(contadores, histogramas),
+        mimetype="text/plain; version=0.0.4"
+    )
+
+
+# ============================================
+# TRAZAS DE CONSULTAS
+# ============================================
+# Cada sentencia que pasa por cursor_db se registra al terminar (siguiente
+# execute o cierre del cursor) con su huella: el SQL sin literales y con
+# las listas de marcadores colapsadas, para que IN (%s, %s) e IN (%s, %s,
+# %s) o inserciones de distinto número de filas cuenten juntas. Las que
+# superan CONSULTA_LENTA_MS se escriben en el log con su plan EXPLAIN,
+# obtenido en un hilo aparte con su propia conexión.
+EXPLAIN_INTERVALO = float(os.environ.get("EXPLAIN_INTERVALO", 300))
+EXPLAIN_COLA_MAX = 100
+
+# Usuarios (separados por coma) que pueden ver /EstadisticasConsultas;
+# vacío: cualquier sesión iniciada.
+ADMIN_USUARIOS = {
+    u.strip().lower() for u in os.environ.get("ADMIN_USUARIOS", "").split(",") if u.strip()
+}
+
+RE_SQL_COMENTARIOS = re.compile(r"/\*.*?\*/|--[^\n]*|#[^\n]*", re.S)
+RE_SQL_MARCADORES = re.compile(r"%\(\w+\)s|%s")
+RE_SQL_LITERALES = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|\b\d+(?:\.\d+)?\b")
+RE_SQL_LISTAS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+RE_SQL_FILAS = re.compile(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+")
+RE_SQL_ESPACIOS = re.compile(r"\s+")
+RE_SQL_EXPLICABLE = re.compile(r"^\s*(select|update|delete)\b", re.I)
+
+
+@lru_cache(maxsize=1024)
+def huella_sql(sql):
+    huella = RE_SQL_COMENTARIOS.sub(" ", sql)
+    huella = RE_SQL_MARCADORES.sub("?", huella)
+    huella = RE_SQL_LITERALES.sub("?", huella)
+    huella = RE_SQL_ESPACIOS.sub(" ", huella).strip()
+    huella = RE_SQL_LISTAS.sub("(?+)", huella)
+    return RE_SQL_FILAS.sub("(?+)", huella)
+
+
+def trazar_consulta(sql, params, duracion, filas):
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode("utf-8", "replace")
+
+    huella = huella_sql(sql)
+    metricas.registrar_consulta(huella, duracion, filas, sql)
+
+    if CONSULTA_LENTA_MS > 0 and duracion * 1000 >= CONSULTA_LENTA_MS:
+        lenta = {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "huella": huella,
+            "ms": round(duracion * 1000, 1),
+            "filas": filas,
+            "ruta": request.path if has_request_context() else None,
+            "plan": None
+        }
+        print(f"CONSULTA LENTA {lenta['ms']} ms, {filas} filas, ruta {lenta['ruta']}: {huella}")
+        metricas.registrar_lenta(lenta)
+        explicador_consultas.encolar(lenta, sql, params)
+
+    metricas.volcar()
+
+
+class ExplicadorConsultas:
+
+    def __init__(self, intervalo, max_pendientes):
+        self.intervalo = intervalo
+        self.max_pendientes = max_pendientes
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._lock = threading.Lock()
+        self._cola = queue.Queue(maxsize=self.max_pendientes)
+        self._hilo = None
+        # huella -> último EXPLAIN, para no repetirlo en cada ejecución lenta
+        self._ultimos = {}
+
+    def reiniciar_tras_fork(self):
+        self._reiniciar()
+
+    def encolar(self, lenta, sql, params):
+        if not RE_SQL_EXPLICABLE.match(sql):
+            # CALL e inserciones: MySQL no tiene plan que mostrar
+            return
+
+        ahora = time.monotonic()
+        with self._lock:
+            if ahora - self._ultimos.get(lenta["huella"], -self.intervalo) < self.intervalo:
+                return
+            self._ultimos[lenta["huella"]] = ahora
+
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(
+                    target=self._trabajar,
+                    name="explain-consultas",
+                    daemon=True
+                )
+                self._hilo.start()
+
+        try:
+            self._cola.put_nowait((lenta, sql, params))
+        except queue.Full:
+            pass
+
+    def _trabajar(self):
+        conn = None
+        while True:
+            lenta, sql, params = self._cola.get()
+            try:
+                if conn is None:
+                    conn = get_connection()
+                    if conn is None:
+                        continue
+
+                cursor = conn.cursor(dictionary=True)
+                try:
+                    cursor.execute("EXPLAIN " + sql, params)
+                    plan = [
+                        {clave: valor if isinstance(valor, (int, float, str)) or valor is None else str(valor)
+                         for clave, valor in fila.items()}
+                        for fila in cursor.fetchall()
+                    ]
+                finally:
+                    cursor.close()
+                conn.rollback()
+
+                lenta["plan"] = plan
+                for fila in plan:
+                    print(
+                        f"  EXPLAIN {fila.get('table')}: type={fila.get('type')} "
+                        f"key={fila.get('key')} rows={fila.get('rows')} extra={fila.get('Extra')}"
+                    )
+            except Exception as e:
+                print("ERROR EN EXPLAIN:", e)
+                if conn is not None:
+                    PoolConexiones._cerrar(conn)
+                conn = None
+            finally:
+                self._cola.task_done()
+
+
+explicador_consultas = ExplicadorConsultas(EXPLAIN_INTERVALO, EXPLAIN_COLA_MAX)
+
+os.register_at_fork(after_in_child=explicador_consultas.reiniciar_tras_fork)
+
+
+def requiere_admin(func):
+    @wraps(func)
+    def envoltura(*args, **kwargs):
+        if "idUsuario" not in session:
+            return jsonify({"ok": False, "error": "No autenticado"}), 401
+
+        if ADMIN_USUARIOS and str(session.get("usuario", "")).lower() not in ADMIN_USUARIOS:
+            return jsonify({"ok": False, "error": "No autorizado"}), 403
+
+        return func(*args, **kwargs)
+    return envoltura
+
+
+ORDENES_CONSULTAS = {
+    "total": lambda e: e[1],
+    "media": lambda e: e[1] / e[0],
+    "max": lambda e: e[2],
+    "llamadas": lambda e: e[0],
+    "filas": lambda e: e[3],
+}
+
+
+@app.route("/EstadisticasConsultas", methods=["GET"])
+@requiere_admin
+def estadisticas_consultas():
+    orden = request.args.get("orden", "total")
+    if orden not in ORDENES_CONSULTAS:
+        return jsonify({"ok": False, "error": f"Orden no soportado. Usa {', '.join(ORDENES_CONSULTAS)}"}), 400
+
+    top = max(1, min(request.args.get("top", 20, type=int), CONSULTAS_MAX_HUELLAS))
+
+    consultas, lentas = metricas.consultas_agregadas()
+    ordenadas = sorted(consultas.items(), key=lambda item: ORDENES_CONSULTAS[orden](item[1]), reverse=True)
+
+    return jsonify({
+        "ok": True,
+        "consultas": [
+            {
+                "huella": huella,
+                "llamadas": llamadas,
+                "total_ms": round(segundos * 1000, 1),
+                "media_ms": round(segundos * 1000 / llamadas, 2),
+                "max_ms": round(maximo * 1000, 1),
+                "filas": filas,
+                "ejemplo": ejemplo
+            }
+            for huella, (llamadas, segundos, maximo, filas, ejemplo) in ordenadas[:top]
+        ],
+        "lentas": lentas
+    })
+
+
+@contextmanager
+def conexion_db():
+    inicio = time.perf_counter()
+    try:
+        conn = pool_db.obtener()
+    finally:
+        espera = time.perf_counter() - inicio
+        metricas.observar("db_connection_acquire_seconds", (), espera)
+        medida = medida_actual()
+        if medida is not None:
+            medida["conexion"] += espera
+
+    try:
+        yield conn
+    except GeneratorExit:
+        # Streaming cortado por el cliente: cerrar es más barato que leer
+        # el resto del resultado pendiente para poder reutilizarla.
+        pool_db.devolver(conn, descartar=True)
+        raise
+    except BaseException:
+        pool_db.devolver(conn)
+        raise
+    else:
+        pool_db.devolver(conn)
+
+
+@contextmanager
+def cursor_db(**opciones):
+    with conexion_db() as conn:
+        cursor = conn.cursor(**opciones)
+        cursor = CursorMedido(cursor, medida_actual())
+        try:
+            yield conn, cursor
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+
+# ============================================
+# VERSIONES DE DATOS
+# ============================================
+# Contadores compartidos entre los workers de gunicorn mediante archivos,
+# usados como ETag y para invalidar cachés cuando cambian los datos.
+VERSIONES_DIR = os.environ.get(
+    "VERSIONES_DIR",
+    os.path.join(tempfile.gettempdir(), "dotaciones_versiones")
+)
+
+VERSION_CATALOGO = "catalogo"
+VERSION_REFERENCIAS = "referencias"
+VERSION_BUSQUEDA = "busqueda"
+
+
+class VersionesDatos:
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+
+    def _ruta(self, nombre):
+        return os.path.join(self.directorio, f"{nombre}.version")
+
+    def actual(self, nombre):
+        try:
+            with open(self._ruta(nombre), "r", encoding="utf-8") as archivo:
+                version = archivo.read().strip()
+        except FileNotFoundError:
+            version = ""
+
+        return version or self.incrementar(nombre)
+
+    def incrementar(self, nombre):
+        return self.incrementar_desde(nombre)[1]
+
+    def incrementar_desde(self, nombre):
+        # (versión anterior, versión nueva): quien guardaba la anterior sabe
+        # si nadie más cambió los datos entre medio.
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = self._ruta(nombre)
+
+        with self._lock, open(ruta + ".lock", "a") as bloqueo:
+            if fcntl:
+                fcntl.flock(bloqueo, fcntl.LOCK_EX)
+
+            try:
+                with open(ruta, "r", encoding="utf-8") as archivo:
+                    prefijo, _, contador = archivo.read().strip().partition("-")
+            except FileNotFoundError:
+                prefijo, contador = "", ""
+
+            anterior = f"{prefijo}-{contador}" if prefijo else ""
+
+            # El prefijo aleatorio evita repetir versiones si se borra el
+            # directorio (p. ej. tras un redeploy) y el contador vuelve a 0.
+            if not prefijo or not contador.isdigit():
+                prefijo, contador = uuid.uuid4().hex[:8], "0"
+
+            version = f"{prefijo}-{int(contador) + 1}"
+
+            temporal = f"{ruta}.{os.getpid()}.tmp"
+            with open(temporal, "w", encoding="utf-8") as archivo:
+                archivo.write(version)
+            os.replace(temporal, ruta)
+
+        return anterior, version
+
+
+versiones_datos = VersionesDatos(VERSIONES_DIR)
+
+
+def invalidar_catalogo():
+    try:
+        versiones_datos.incrementar(VERSION_CATALOGO)
+    except Exception as e:
+        print("ERROR INVALIDANDO CATALOGO:", e)
+
+
+def invalidar_referencias():
+    cache_referencias.limpiar()
+    try:
+        versiones_datos.incrementar(VERSION_REFERENCIAS)
+    except Exception as e:
+        print("ERROR INVALIDANDO REFERENCIAS:", e)
+
+
+def invalidar_busqueda():
+    try:
+        versiones_datos.incrementar(VERSION_BUSQUEDA)
+    except Exception as e:
+        print("ERROR INVALIDANDO BUSQUEDA:", e)
+
+
+def respuesta_no_modificada(etag):
+    response = make_response("", 304)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+# ============================================
+# CACHÉ DE TABLAS DE REFERENCIA
+# ============================================
+# Categorías, géneros, colores, tallas y estilos cambian pocas veces al mes:
+# se guarda el cuerpo JSON ya serializado por ruta y parámetros, válido
+# mientras no venza el TTL ni cambie la versión de datos de la que depende.
+CACHE_REFERENCIAS_TTL = float(os.environ.get("CACHE_REFERENCIAS_TTL", 300))
+CACHE_REFERENCIAS_MAX = int(os.environ.get("CACHE_REFERENCIAS_MAX", 256))
+
+
+class CacheReferencias:
+
+    def __init__(self, ttl, max_entradas):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()
+
+    def obtener(self, clave, version):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if not entrada:
+                return None
+
+            expira, version_entrada, valor = entrada
+            if expira < time.monotonic() or version_entrada != version:
+                del self._datos[clave]
+                return None
+
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, version, valor):
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, version, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+
+cache_referencias = CacheReferencias(CACHE_REFERENCIAS_TTL, CACHE_REFERENCIAS_MAX)
+
+
+def marcar_respuesta_cacheable():
+    # El cuerpo sale de una caché compartida y se repetirá para otros
+    # clientes: vale la pena guardar también su versión comprimida
+    if has_request_context():
+        g.respuesta_cacheable = True
+
+
+def cache_referencia(version_nombre):
+    def decorador(func):
+        @wraps(func)
+        def envoltura(*args, **kwargs):
+            marcar_respuesta_cacheable()
+            version = versiones_datos.actual(version_nombre)
+            clave = request.full_path
+
+            cuerpo = cache_referencias.obtener(clave, version)
+            if cuerpo is not None:
+                return Response(cuerpo, mimetype="application/json")
+
+            response = make_response(func(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                cache_referencias.guardar(clave, version, response.get_data())
+            return response
+        return envoltura
+    return decorador
+
+
+# ============================================
+# RESPUESTAS EN STREAMING
+# ============================================
+# Filas leídas por lote con fetchmany: la memoria por petición queda
+# acotada por STREAM_LOTE sin importar el tamaño del resultado.
+STREAM_LOTE = int(os.environ.get("STREAM_LOTE", 500))
+
+
+def leer_lotes(cursor, tamano=None):
+    tamano = tamano or STREAM_LOTE
+    while True:
+        filas = cursor.fetchmany(tamano)
+        if not filas:
+            return
+        yield filas
+
+
+def generar_json_lista(lotes):
+    yield "["
+    primero = True
+    for lote in lotes:
+        texto = ",".join(app.json.dumps(fila) for fila in lote)
+        yield texto if primero else "," + texto
+        primero = False
+    yield "]"
+
+
+# format=columnar: nombres de columna una sola vez y filas como arreglos,
+# leídas con un cursor de tuplas en lugar de un dict por fila.
+FORMATOS_FILAS = ("json", "columnar")
+
+
+def pide_columnar(args):
+    formato = (args.get("format") or "json").strip().lower()
+    if formato not in FORMATOS_FILAS:
+        raise ValueError(f"Formato no soportado. Usa {' o '.join(FORMATOS_FILAS)}")
+    return formato == "columnar"
+
+
+def leer_columnar(cursor):
+    return {"columns": list(cursor.column_names), "rows": cursor.fetchall()}
+
+
+def generar_json_columnar(columnas, lotes):
+    yield '{"columns": ' + app.json.dumps(columnas) + ', "rows": '
+    yield from generar_json_lista(lotes)
+    yield "}"
+
+
+def respuesta_streaming(generador, mimetype="application/json"):
+    # El primer fragmento se produce antes de responder para que los
+    # errores de conexión o de SQL aún puedan devolverse como un 500.
+    primero = next(generador)
+    return Response(
+        stream_with_context(itertools.chain([primero], generador)),
+        mimetype=mimetype
+    )
+
+
 @app.route("/ping", methods=["GET", "HEAD"])
 def ping():
     return "OK", 200
 
 @app.route("/activador")
 def activador():
-    conn = None
-    cursor = None
     try:
-        conn = get_connection()
-        if conn:
-            cursor = conn.cursor()
+        with cursor_db() as (conn, cursor):
             cursor.execute("SELECT 1")
             cursor.fetchone()
     except Exception as e:
         print("DB dormida o error:", e)
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
     return jsonify({"ok": True})
 
@@ -129,7 +1248,7 @@ def activador():
 # ============================================
 
 
-def enviar_correo(email, token):
+def enviar_correo(email, token, sesion=None):
     url = "https://api.resend.com/emails"
 
     payload = {
@@ -151,28 +1270,107 @@ def enviar_correo(email, token):
         "Content-Type": "application/json"
     }
 
-    response = requests.post(url, json=payload, headers=headers, timeout=5)
+    response = (sesion or requests).post(url, json=payload, headers=headers, timeout=5)
 
     if response.status_code not in (200, 201):
         raise Exception(f"Error enviando correo: {response.text}")
 
 
+# Envío de correos en segundo plano: las rutas solo encolan y un hilo por
+# worker hace las llamadas a Resend reutilizando la sesión HTTP, con
+# reintentos y espera exponencial si el proveedor falla o está lento.
+CORREO_REINTENTOS = int(os.environ.get("CORREO_REINTENTOS", 5))
+CORREO_BACKOFF = float(os.environ.get("CORREO_BACKOFF", 2))
+CORREO_COLA_MAX = int(os.environ.get("CORREO_COLA_MAX", 1000))
+
+
+class ColaCorreos:
+
+    def __init__(self, reintentos, backoff, max_pendientes):
+        self.reintentos = max(1, reintentos)
+        self.backoff = backoff
+        self.max_pendientes = max_pendientes
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._lock = threading.Lock()
+        self._cola = queue.Queue(maxsize=self.max_pendientes)
+        self._hilo = None
+
+    def reiniciar_tras_fork(self):
+        # El hilo no sobrevive al fork; los correos pendientes son del padre
+        self._reiniciar()
+
+    def encolar(self, email, token):
+        self._asegurar_hilo()
+        self._cola.put_nowait((email, token, 1))
+
+    def _asegurar_hilo(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(
+                    target=self._trabajar,
+                    name="cola-correos",
+                    daemon=True
+                )
+                self._hilo.start()
+
+    def _trabajar(self):
+        sesion = requests.Session()
+        # (momento, secuencia, tarea) de los reintentos programados
+        reintentos = []
+        secuencia = itertools.count()
+
+        while True:
+            ahora = time.monotonic()
+            if reintentos and reintentos[0][0] <= ahora:
+                _, _, tarea = heapq.heappop(reintentos)
+                desde_cola = False
+            else:
+                espera = reintentos[0][0] - ahora if reintentos else None
+                try:
+                    tarea = self._cola.get(timeout=espera)
+                except queue.Empty:
+                    continue
+                desde_cola = True
+
+            email, token, intento = tarea
+            try:
+                enviar_correo(email, token, sesion)
+            except Exception as e:
+                if intento < self.reintentos:
+                    momento = time.monotonic() + self.backoff * (2 ** (intento - 1))
+                    heapq.heappush(
+                        reintentos,
+                        (momento, next(secuencia), (email, token, intento + 1))
+                    )
+                else:
+                    print("ERROR enviando correo (sin más reintentos):", e)
+            finally:
+                if desde_cola:
+                    self._cola.task_done()
+
+    def esperar_pendientes(self, timeout):
+        limite = time.monotonic() + timeout
+        while self._cola.unfinished_tasks and time.monotonic() < limite:
+            time.sleep(0.05)
+
+
+cola_correos = ColaCorreos(CORREO_REINTENTOS, CORREO_BACKOFF, CORREO_COLA_MAX)
+
+os.register_at_fork(after_in_child=cola_correos.reiniciar_tras_fork)
+atexit.register(cola_correos.esperar_pendientes, 5)
+
+
 # ============================================
 # RUTAS - AUTENTICACIÓN
 # ============================================
-intentos_login = defaultdict(list)
-VENTANA_SEGUNDOS = 300  
-MAX_INTENTOS = 3
-
 def verificar_password(password_plano, password_bd):
     return bcrypt.check_password_hash(password_bd, password_plano)
 
 
 @app.route('/Login', methods=['POST'])
 def login():
-    conn = None
-    cursor = None
-
     try:
         data = request.get_json()
 
@@ -182,17 +1380,12 @@ def login():
         if not usuario or not password:
             return jsonify({'ok': False, 'error': 'Completa todos los campos'}), 400
 
-        conn = get_connection()
-        if not conn:
-            return jsonify({'ok': False, 'error': 'DB no disponible'}), 500
-
-        cursor = conn.cursor(dictionary=True)
-
-        cursor.execute(
-            "SELECT idUsuario, password FROM usuarios WHERE usuario = %s",
-            (usuario,)
-        )
-        user = cursor.fetchone()
+        with cursor_db(dictionary=True) as (conn, cursor):
+            cursor.execute(
+                "SELECT idUsuario, password FROM usuarios WHERE usuario = %s",
+                (usuario,)
+            )
+            user = cursor.fetchone()
 
         if not user or not verificar_password(password, user['password']):
             return jsonify({'ok': False, 'error': 'Credenciales inválidas'}), 401
@@ -202,16 +1395,13 @@ def login():
 
         return jsonify({'ok': True}), 200
 
+    except ErrorConexionDB:
+        return jsonify({'ok': False, 'error': 'DB no disponible'}), 500
+
     except Exception as e:
         print("ERROR LOGIN:", e)
         return jsonify({'ok': False, 'error': str(e)}), 500
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-
 
 @app.route("/CheckSession", methods=["GET"])
 def check_session():
@@ -232,8 +1422,6 @@ def logout():
 @app.route("/RecuperarPassword", methods=["POST"])
 def recuperar_password():
 
-    conn = cursor = None
-
     try:
         data = request.get_json()
         email = data.get("email", "").strip()
@@ -241,57 +1429,45 @@ def recuperar_password():
         if not email:
             return jsonify({"ok": False, "error": "Email requerido"}), 400
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        cursor.execute(
-            "SELECT idUsuario FROM usuarios WHERE email=%s AND id_estado=1",
-            (email,)
-        )
-        user = cursor.fetchone()
+        with cursor_db(dictionary=True) as (conn, cursor):
+            cursor.execute(
+                "SELECT idUsuario FROM usuarios WHERE email=%s AND id_estado=1",
+                (email,)
+            )
+            user = cursor.fetchone()
 
-        # No revelar si existe
-        if not user:
-            return jsonify({"ok": True})
+            # No revelar si existe
+            if not user:
+                return jsonify({"ok": True})
 
-        token = str(uuid.uuid4())
-        expiracion = datetime.utcnow() + timedelta(minutes=5)
+            token = str(uuid.uuid4())
+            expiracion = datetime.utcnow() + timedelta(minutes=5)
 
-        cursor.execute("""
-            INSERT INTO password_resets (idUsuario, token, expira, id_estado)
-            VALUES (%s, %s, %s, 4)
-            ON DUPLICATE KEY UPDATE
-                token = VALUES(token),
-                expira = VALUES(expira),
-                id_estado = 4
-        """, (user["idUsuario"], token, expiracion))
+            cursor.execute("""
+                INSERT INTO password_resets (idUsuario, token, expira, id_estado)
+                VALUES (%s, %s, %s, 4)
+                ON DUPLICATE KEY UPDATE
+                    token = VALUES(token),
+                    expira = VALUES(expira),
+                    id_estado = 4
+            """, (user["idUsuario"], token, expiracion))
 
-        conn.commit()
+            conn.commit()
 
         try:
-            enviar_correo(email, token)
+            cola_correos.encolar(email, token)
         except Exception as mail_error:
             print("ERROR enviando correo:", mail_error)
 
         return jsonify({"ok": True})
 
     except Exception as e:
-        if conn:
-            conn.rollback()
         return jsonify({"ok": False, "error": "Error interno"}), 500
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-
 
 @app.route("/ResetPassword", methods=["POST"])
 def reset_password():
 
-    conn = cursor = None
-
     try:
         data = request.get_json()
         token = data.get("token")
@@ -300,92 +1476,361 @@ def reset_password():
         if not token or not password:
             return jsonify({"ok": False, "error": "Datos incompletos"}), 400
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        cursor.execute("""
-            SELECT * FROM password_resets
-            WHERE token=%s AND id_estado=4 AND expira > NOW()
-        """, (token,))
-        reset = cursor.fetchone()
+        with cursor_db(dictionary=True) as (conn, cursor):
+            cursor.execute("""
+                SELECT * FROM password_resets
+                WHERE token=%s AND id_estado=4 AND expira > NOW()
+            """, (token,))
+            reset = cursor.fetchone()
 
-        if not reset:
-            return jsonify({"ok": False, "error": "Token inválido o expirado"}), 400
+            if not reset:
+                return jsonify({"ok": False, "error": "Token inválido o expirado"}), 400
 
-        hashed = bcrypt.generate_password_hash(password).decode("utf-8")
+            hashed = bcrypt.generate_password_hash(password).decode("utf-8")
 
-        cursor.execute(
-            "UPDATE usuarios SET password=%s WHERE idUsuario=%s",
-            (hashed, reset["idUsuario"])
-        )
+            cursor.execute(
+                "UPDATE usuarios SET password=%s WHERE idUsuario=%s",
+                (hashed, reset["idUsuario"])
+            )
 
-        cursor.execute(
-            "UPDATE password_resets SET id_estado=3 WHERE idPasswordResets=%s",
-            (reset["idPasswordResets"],)
-        )
+            cursor.execute(
+                "UPDATE password_resets SET id_estado=3 WHERE idPasswordResets=%s",
+                (reset["idPasswordResets"],)
+            )
 
-        conn.commit()
+            conn.commit()
 
         return jsonify({"ok": True})
 
     except Exception as e:
-        if conn: 
-            conn.rollback()
+        # El pool hace rollback al devolver la conexión
         return jsonify({"ok": False, "error": str(e)}), 500
 
-    finally:
-        if cursor: 
-            cursor.close()
-        if conn: 
-            conn.close()
-
 
 # ============================================
 # RUTAS - PRODUCTOS
 # ============================================
 
 
-@app.route("/GetProductos", methods=["GET"])
-def get_productos():
-        
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+# Columnas que puede devolver /GetProductos (en el orden original) y la
+# tabla opcional (LEFT JOIN) que necesita cada una.
+COLUMNAS_PRODUCTOS = {
+    "id_producto": ("p.id_producto", None),
+    "nomproducto": ("p.nombre", None),
+    "categoria": ("cat.nombre", None),
+    "id_variante": ("v.id_variante", None),
+    "marca": ("m.nombre", "m"),
+    "estilo": ("e.nombre", "e"),
+    "color": ("c.nombre", "c"),
+    "talla": ("t.valor", "t"),
+    "precio": ("v.precio", None),
+    "stock": ("v.stock", None)
+}
+
+JOINS_PRODUCTOS = {
+    "m": "LEFT JOIN marcas m ON p.id_marca = m.id_marca",
+    "e": "LEFT JOIN estilos e ON p.id_estilo = e.id_estilo",
+    "c": "LEFT JOIN colores c ON v.id_color = c.id_color",
+    "t": "LEFT JOIN tallas t ON v.id_talla = t.id_talla"
+}
+
+def numero_finito(valor):
+    # float() acepta "nan" e "inf", que no sirven para comparar precios
+    numero = float(valor)
+    if not math.isfinite(numero):
+        raise ValueError(valor)
+    return numero
+
+
+# parametro -> (condición, tabla opcional, conversión del valor)
+FILTROS_PRODUCTOS = {
+    "categoria": ("cat.nombre = %s", None, str),
+    "id_categoria": ("p.id_categoria = %s", None, int),
+    "genero": (
+        "p.id_genero IN (SELECT id_genero FROM generos WHERE nombre = %s)",
+        None,
+        str
+    ),
+    "id_genero": ("p.id_genero = %s", None, int),
+    "marca": ("m.nombre = %s", "m", str),
+    "color": ("c.nombre = %s", "c", str),
+    "id_color": ("v.id_color = %s", None, int),
+    "talla": ("t.valor = %s", "t", str),
+    "precio_min": ("v.precio >= %s", None, numero_finito),
+    "precio_max": ("v.precio <= %s", None, numero_finito)
+}
+
+PRODUCTOS_LIMITE_DEFECTO = 100
+PRODUCTOS_LIMITE_MAX = 1000
+
+
+def parametro_activo(valor):
+    return str(valor).strip().lower() in ("1", "true", "si", "sí")
+
+
+def codificar_cursor_productos(id_variante):
+    return serializer.dumps({"v": id_variante}, salt="cursor-productos")
+
+
+def decodificar_cursor_productos(token):
+    try:
+        return int(serializer.loads(token, salt="cursor-productos")["v"])
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def construir_consulta_productos(args):
+    campos = [c.strip() for c in args.get("fields", "").split(",") if c.strip()]
+    if campos:
+        desconocidos = [c for c in campos if c not in COLUMNAS_PRODUCTOS]
+        if desconocidos:
+            raise ValueError(f"Campos no soportados: {', '.join(desconocidos)}")
+    else:
+        campos = list(COLUMNAS_PRODUCTOS)
+
+    joins = set()
+    condiciones = ["p.id_estado = 1 and v.id_estado = 1"]
+    params = []
 
-    cursor.execute("""
-        SELECT
-            p.id_producto AS id_producto,
-            p.nombre AS nomproducto,
-            cat.nombre AS categoria,
-            v.id_variante AS id_variante,
-            m.nombre AS marca,
-            e.nombre AS estilo,
-            c.nombre AS color,
-            t.valor AS talla,
-            v.precio AS precio,
-            v.stock AS stock
+    for nombre, (condicion, join, convertir) in FILTROS_PRODUCTOS.items():
+        valor = clean_report_param(args.get(nombre))
+        if valor is None:
+            continue
+        try:
+            params.append(convertir(valor))
+        except ValueError:
+            raise ValueError(f"Valor inválido para {nombre}")
+        condiciones.append(condicion)
+        if join:
+            joins.add(join)
+
+    if parametro_activo(args.get("en_stock", "")):
+        condiciones.append("v.stock > 0")
+
+    paginado = "limit" in args or "cursor" in args
+    limite = None
+
+    if paginado:
+        try:
+            limite = int(args.get("limit", PRODUCTOS_LIMITE_DEFECTO))
+        except ValueError:
+            raise ValueError("Valor inválido para limit")
+        limite = max(1, min(limite, PRODUCTOS_LIMITE_MAX))
+
+        if args.get("cursor"):
+            condiciones.append("v.id_variante > %s")
+            params.append(decodificar_cursor_productos(args["cursor"]))
+
+    # id_variante siempre se selecciona: es la llave del cursor
+    seleccion = list(campos)
+    if paginado and "id_variante" not in seleccion:
+        seleccion.append("id_variante")
+
+    for campo in seleccion:
+        if COLUMNAS_PRODUCTOS[campo][1]:
+            joins.add(COLUMNAS_PRODUCTOS[campo][1])
+
+    sql = "SELECT\n    " + ",\n    ".join(
+        f"{COLUMNAS_PRODUCTOS[campo][0]} AS {campo}" for campo in seleccion
+    )
+    sql += """
         FROM variantes v
         JOIN productos p ON v.id_producto = p.id_producto
-        LEFT JOIN marcas m ON p.id_marca = m.id_marca
         JOIN categorias cat ON p.id_categoria = cat.id_categoria
-        LEFT JOIN estilos e ON p.id_estilo = e.id_estilo
-        LEFT JOIN colores c ON v.id_color = c.id_color
-        LEFT JOIN tallas t ON v.id_talla = t.id_talla
-        WHERE p.id_estado = 1 and v.id_estado = 1
-    """)
+    """
+    sql += "\n".join(JOINS_PRODUCTOS[alias] for alias in JOINS_PRODUCTOS if alias in joins)
+    sql += "\nWHERE " + " AND ".join(condiciones)
 
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    if paginado:
+        sql += "\nORDER BY v.id_variante\nLIMIT %s"
+        params.append(limite + 1)
 
-    return jsonify(data)
+    return sql, params, campos, limite
 
 
+def stream_productos(sql, params, columnar=False):
+    with cursor_db(dictionary=not columnar) as (conn, cursor):
+        cursor.execute(sql, params)
+        if columnar:
+            yield from generar_json_columnar(list(cursor.column_names), leer_lotes(cursor))
+        else:
+            yield from generar_json_lista(leer_lotes(cursor))
 
-@app.route("/AddProducto", methods=["POST"])
-def add_producto():
-        
-    conn = None
-    cursor = None
+
+def etag_productos(args):
+    etag = f"catalogo-{versiones_datos.actual(VERSION_CATALOGO)}"
+    if not args:
+        return etag
+
+    consulta = "&".join(
+        f"{clave}={valor}" for clave, valor in sorted(args.items(multi=True))
+    )
+    return f"{etag}-{hashlib.sha1(consulta.encode('utf-8')).hexdigest()[:16]}"
+
+
+@app.route("/GetProductos", methods=["GET"])
+def get_productos():
+
+    # La versión se lee antes de consultar: si cambia durante la consulta,
+    # el cliente simplemente volverá a descargar en la siguiente petición.
+    etag = etag_productos(request.args)
+    if request.if_none_match.contains_weak(etag):
+        return respuesta_no_modificada(etag)
+
+    try:
+        sql, params, campos, limite = construir_consulta_productos(request.args)
+        columnar = pide_columnar(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    if limite is None and parametro_activo(request.args.get("stream", "")):
+        response = respuesta_streaming(stream_productos(sql, params, columnar))
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    with cursor_db(dictionary=not columnar) as (conn, cursor):
+        cursor.execute(sql, params)
+        data = cursor.fetchall()
+
+    if limite is None:
+        response = jsonify({"columns": campos, "rows": data} if columnar else data)
+    elif columnar:
+        # Si no se pidió, id_variante viene como última columna
+        posicion = campos.index("id_variante") if "id_variante" in campos else len(campos)
+
+        siguiente = None
+        if len(data) > limite:
+            data = data[:limite]
+            siguiente = codificar_cursor_productos(data[-1][posicion])
+
+        if "id_variante" not in campos:
+            data = [fila[:-1] for fila in data]
+
+        response = jsonify({"columns": campos, "rows": data, "next_cursor": siguiente})
+    else:
+        siguiente = None
+        if len(data) > limite:
+            data = data[:limite]
+            siguiente = codificar_cursor_productos(data[-1]["id_variante"])
+
+        if "id_variante" not in campos:
+            for row in data:
+                del row["id_variante"]
+
+        response = jsonify({"items": data, "next_cursor": siguiente})
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+
+def clave_talla(valor):
+    # Aproxima la comparación de MySQL (sin mayúsculas ni espacios finales)
+    return str(valor).rstrip().lower()
+
+
+def resolver_tallas(cursor, id_categoria, id_genero, valores):
+    # Devuelve {clave_talla: id_talla} creando en un solo INSERT las que
+    # falten, en lugar de una consulta por talla.
+    pendientes = {}
+    for valor in valores:
+        pendientes.setdefault(clave_talla(valor), valor)
+
+    ids = {}
+
+    def buscar(claves):
+        placeholders = ",".join(["%s"] * len(claves))
+        cursor.execute(
+            f"""
+            SELECT id_talla, valor
+            FROM tallas
+            WHERE id_categoria = %s AND id_genero = %s AND id_estado = 1
+              AND valor IN ({placeholders})
+            ORDER BY id_talla
+            """,
+            [id_categoria, id_genero] + [pendientes[c] for c in claves]
+        )
+        for row in cursor.fetchall():
+            ids.setdefault(clave_talla(row["valor"]), row["id_talla"])
+
+    if pendientes:
+        buscar(list(pendientes))
+
+    faltantes = [c for c in pendientes if c not in ids]
+    if faltantes:
+        cursor.executemany(
+            """
+            INSERT INTO tallas (valor, id_categoria, id_genero, id_estado)
+            VALUES (%s, %s, %s, %s)
+            """,
+            [(pendientes[c], id_categoria, id_genero, 1) for c in faltantes]
+        )
+        buscar(faltantes)
+
+    return ids
+
+
+def upsert_variantes(cursor, filas):
+    # filas: (id_producto, id_color, id_talla, precio, stock). Las variantes
+    # existentes se buscan en una consulta y todo se escribe con un único
+    # INSERT multi-fila sobre la llave primaria id_variante.
+    if not filas:
+        return
+
+    existentes = {}
+    por_producto = defaultdict(set)
+    for id_producto, id_color, id_talla, _, _ in filas:
+        por_producto[(id_producto, id_color)].add(id_talla)
+
+    condiciones = []
+    params = []
+    for (id_producto, id_color), tallas in por_producto.items():
+        condiciones.append(
+            f"(id_producto = %s AND id_color = %s AND id_talla IN ({','.join(['%s'] * len(tallas))}))"
+        )
+        params.extend([id_producto, id_color, *tallas])
+
+    filtro = " OR ".join(condiciones)
+    cursor.execute(
+        f"""
+        SELECT id_variante, id_producto, id_color, id_talla
+        FROM variantes
+        WHERE {filtro}
+        ORDER BY id_variante
+        """,
+        params
+    )
+    for row in cursor.fetchall():
+        existentes.setdefault(
+            (row["id_producto"], row["id_color"], row["id_talla"]),
+            row["id_variante"]
+        )
+
+    cursor.executemany(
+        """
+        INSERT INTO variantes
+        (id_variante, id_producto, id_color, id_talla, precio, stock, id_estado)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            id_estado = 1,
+            precio = VALUES(precio),
+            stock = VALUES(stock)
+        """,
+        [
+            (existentes.get((id_producto, id_color, id_talla)),
+             id_producto, id_color, id_talla, precio, stock, 1)
+            for id_producto, id_color, id_talla, precio, stock in filas
+        ]
+    )
+
+    recalcular_resumen(cursor, [fila[0] for fila in filas])
+
+
+@app.route("/AddProducto", methods=["POST"])
+def add_producto():
+        
     try:
         data = request.get_json(force=True)
         
@@ -420,151 +1865,117 @@ def add_producto():
             if estilo == "":
                 estilo = None
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        # MARCA
-        id_marca = None
-        if marca:
-            cursor.execute(
-                "SELECT id_marca FROM marcas WHERE nombre = %s and id_estado = 1",
-                (marca,)
-            )
-            row = cursor.fetchone()
-
-            if row:
-                id_marca = row["id_marca"]
-            else:
-                cursor.execute(
-                    "INSERT INTO marcas (nombre, id_categoria, id_estado) VALUES (%s, %s, %s)",
-                    (marca, id_categoria, 1)
-                )
-                id_marca = cursor.lastrowid
-
-        # ESTILO
-        id_estilo = None
-        if estilo:
-            cursor.execute(
-                "SELECT id_estilo FROM estilos WHERE nombre = %s",
-                (estilo,)
-            )
-            row = cursor.fetchone()
-
-            if row:
-                id_estilo = row["id_estilo"]
-            else:
+        with cursor_db(dictionary=True) as (conn, cursor):
+            # MARCA
+            id_marca = None
+            if marca:
                 cursor.execute(
-                    "INSERT INTO estilos (nombre, id_marca, id_estado) VALUES (%s, %s, %s)",
-                    (estilo, id_marca, 1)
+                    "SELECT id_marca FROM marcas WHERE nombre = %s and id_estado = 1",
+                    (marca,)
                 )
-                id_estilo = cursor.lastrowid
-
-        # PRODUCTO (reutilizar si ya existe)
-        cursor.execute(
-            """
-            SELECT id_producto, id_estado
-            FROM productos
-            WHERE nombre = %s
-              AND id_categoria = %s
-              AND id_genero = %s
-              AND (id_marca <=> %s)
-              AND (id_estilo <=> %s)
-            LIMIT 1
-            """,
-            (nombre, id_categoria, id_genero, id_marca, id_estilo)
-        )
-        existing_product = cursor.fetchone()
+                row = cursor.fetchone()
+
+                if row:
+                    id_marca = row["id_marca"]
+                else:
+                    cursor.execute(
+                        "INSERT INTO marcas (nombre, id_categoria, id_estado) VALUES (%s, %s, %s)",
+                        (marca, id_categoria, 1)
+                    )
+                    id_marca = cursor.lastrowid
 
-        if existing_product:
-            id_producto = existing_product["id_producto"]
-            if existing_product["id_estado"] != 1:
+            # ESTILO
+            id_estilo = None
+            if estilo:
                 cursor.execute(
-                    "UPDATE productos SET id_estado = 1 WHERE id_producto = %s",
-                    (id_producto,)
+                    "SELECT id_estilo FROM estilos WHERE nombre = %s",
+                    (estilo,)
                 )
-        else:
-            cursor.execute(
-                """
-                INSERT INTO productos
-                (nombre, id_marca, id_estilo, id_categoria, id_genero, id_estado)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                """,
-                (nombre, id_marca, id_estilo, id_categoria, id_genero, 1)
-            )
-            id_producto = cursor.lastrowid
-
-        # VARIANTES
-        for v in variantes:
-            talla = v["talla"]
-            precio = v["precio"]
-            stock = v["stock"]
+                row = cursor.fetchone()
+
+                if row:
+                    id_estilo = row["id_estilo"]
+                else:
+                    cursor.execute(
+                        "INSERT INTO estilos (nombre, id_marca, id_estado) VALUES (%s, %s, %s)",
+                        (estilo, id_marca, 1)
+                    )
+                    id_estilo = cursor.lastrowid
 
+            # PRODUCTO (reutilizar si ya existe)
             cursor.execute(
                 """
-                SELECT id_talla
-                FROM tallas
-                WHERE valor = %s AND id_categoria = %s AND id_genero = %s AND id_estado = 1
+                SELECT id_producto, id_estado
+                FROM productos
+                WHERE nombre = %s
+                  AND id_categoria = %s
+                  AND id_genero = %s
+                  AND (id_marca <=> %s)
+                  AND (id_estilo <=> %s)
+                LIMIT 1
                 """,
-                (talla, id_categoria, id_genero)
+                (nombre, id_categoria, id_genero, id_marca, id_estilo)
             )
-            row = cursor.fetchone()
-
-            if row:
-                id_talla = row["id_talla"]
+            existing_product = cursor.fetchone()
+
+            if existing_product:
+                id_producto = existing_product["id_producto"]
+                if existing_product["id_estado"] != 1:
+                    cursor.execute(
+                        "UPDATE productos SET id_estado = 1 WHERE id_producto = %s",
+                        (id_producto,)
+                    )
             else:
                 cursor.execute(
                     """
-                    INSERT INTO tallas (valor, id_categoria, id_genero, id_estado)
-                    VALUES (%s, %s, %s, %s)
+                    INSERT INTO productos
+                    (nombre, id_marca, id_estilo, id_categoria, id_genero, id_estado)
+                    VALUES (%s, %s, %s, %s, %s, %s)
                     """,
-                    (talla, id_categoria, id_genero,1)
+                    (nombre, id_marca, id_estilo, id_categoria, id_genero, 1)
                 )
-                id_talla = cursor.lastrowid
-
-            cursor.execute(
-                """
-                SELECT id_variante, id_estado
-                FROM variantes
-                WHERE id_producto = %s
-                  AND id_color = %s
-                  AND id_talla = %s
-                LIMIT 1
-                """,
-                (id_producto, id_color, id_talla)
+                id_producto = cursor.lastrowid
+
+            # VARIANTES
+            # Tallas repetidas en la petición: se crea la primera y sus
+            # precio/stock quedan con los de la última, como antes
+            por_talla = {}
+            for v in variantes:
+                clave = clave_talla(v["talla"])
+                talla = por_talla[clave]["talla"] if clave in por_talla else v["talla"]
+                por_talla[clave] = dict(v, talla=talla)
+
+            ids_talla = resolver_tallas(
+                cursor,
+                id_categoria,
+                id_genero,
+                [v["talla"] for v in por_talla.values()]
             )
-            existing_variante = cursor.fetchone()
 
-            if existing_variante:
-                cursor.execute(
-                    """
-                    UPDATE variantes
-                    SET id_estado = 1, precio = %s, stock = %s
-                    WHERE id_variante = %s
-                    """,
-                    (precio, stock, existing_variante["id_variante"])
-                )
-            else:
-                cursor.execute("""
-                    INSERT INTO variantes
-                    (id_producto, id_color, id_talla, precio, stock, id_estado)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (id_producto, id_color, id_talla, precio, stock,1)
-                    )
-        conn.commit()
+            upsert_variantes(cursor, [
+                (id_producto, id_color, ids_talla[clave], v["precio"], v["stock"])
+                for clave, v in por_talla.items()
+            ])
+
+            conn.commit()
+
+        invalidar_catalogo()
+        invalidar_referencias()
+        indice_busqueda.actualizar(agregar=[
+            (tipo, id_doc, texto)
+            for tipo, id_doc, texto in (
+                ("producto", id_producto, nombre),
+                ("marca", id_marca, marca),
+                ("estilo", id_estilo, estilo)
+            )
+            if id_doc
+        ])
         return jsonify({"ok": True})
 
     except Exception as e:
-        if conn:
-            conn.rollback()
         print("ERROR AGREGANDO PRODUCTO:", e)
         return jsonify({"ok": False, "error": str(e)}), 500
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-
 
 @app.route("/DeleteProductos", methods=["POST"])
 def delete_productos():
@@ -576,64 +1987,65 @@ def delete_productos():
         if not isinstance(ids, list) or len(ids) == 0:
             return jsonify({"error": "IDs inválidos"}), 400
 
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        placeholders = ",".join(["%s"] * len(ids))
-        cursor.execute(
-            f"""
-            SELECT DISTINCT p.id_producto
-            FROM variantes v
-            JOIN productos p ON v.id_producto = p.id_producto
-            WHERE v.id_variante IN ({placeholders})
-            """,
-            ids
-        )
-        producto_ids = [row["id_producto"] for row in cursor.fetchall()]
-
-        sql = f"""
-            UPDATE variantes
-            SET id_estado = 2
-            WHERE id_variante IN ({placeholders})
-        """
-
-        cursor.execute(sql, ids)
-        conn.commit()
-
-        eliminados = cursor.rowcount
-
-        # Desactivar productos que ya no tengan variantes activas
-        if producto_ids:
-            placeholders_prod = ",".join(["%s"] * len(producto_ids))
+        with cursor_db(dictionary=True) as (conn, cursor):
+            placeholders = ",".join(["%s"] * len(ids))
             cursor.execute(
                 f"""
-                SELECT p.id_producto
-                FROM productos p
-                LEFT JOIN variantes v
-                  ON v.id_producto = p.id_producto
-                 AND v.id_estado = 1
-                WHERE p.id_producto IN ({placeholders_prod})
-                GROUP BY p.id_producto
-                HAVING COUNT(v.id_variante) = 0
+                SELECT DISTINCT p.id_producto
+                FROM variantes v
+                JOIN productos p ON v.id_producto = p.id_producto
+                WHERE v.id_variante IN ({placeholders})
                 """,
-                producto_ids
+                ids
             )
-            productos_sin_variantes = [row["id_producto"] for row in cursor.fetchall()]
+            producto_ids = [row["id_producto"] for row in cursor.fetchall()]
+
+            sql = f"""
+                UPDATE variantes
+                SET id_estado = 2
+                WHERE id_variante IN ({placeholders})
+            """
+
+            cursor.execute(sql, ids)
+            eliminados = cursor.rowcount
+
+            recalcular_resumen(cursor, producto_ids)
+            conn.commit()
 
-            if productos_sin_variantes:
-                placeholders_disable = ",".join(["%s"] * len(productos_sin_variantes))
+            # Desactivar productos que ya no tengan variantes activas
+            if producto_ids:
+                placeholders_prod = ",".join(["%s"] * len(producto_ids))
                 cursor.execute(
                     f"""
-                    UPDATE productos
-                    SET id_estado = 2
-                    WHERE id_producto IN ({placeholders_disable})
+                    SELECT p.id_producto
+                    FROM productos p
+                    LEFT JOIN variantes v
+                      ON v.id_producto = p.id_producto
+                     AND v.id_estado = 1
+                    WHERE p.id_producto IN ({placeholders_prod})
+                    GROUP BY p.id_producto
+                    HAVING COUNT(v.id_variante) = 0
                     """,
-                    productos_sin_variantes
+                    producto_ids
                 )
-                conn.commit()
+                productos_sin_variantes = [row["id_producto"] for row in cursor.fetchall()]
+
+                if productos_sin_variantes:
+                    placeholders_disable = ",".join(["%s"] * len(productos_sin_variantes))
+                    cursor.execute(
+                        f"""
+                        UPDATE productos
+                        SET id_estado = 2
+                        WHERE id_producto IN ({placeholders_disable})
+                        """,
+                        productos_sin_variantes
+                    )
+                    conn.commit()
+                    indice_busqueda.actualizar(quitar=[
+                        ("producto", id_producto) for id_producto in productos_sin_variantes
+                    ])
 
-        cursor.close()
-        conn.close()
+        invalidar_catalogo()
 
         return jsonify({
             "ok": True,
@@ -645,6 +2057,55 @@ def delete_productos():
         return jsonify({"error": str(e)}), 500
 
 
+def leer_cantidad(valor):
+    # Entero mayor que cero (acepta "3" desde formularios); None si no lo es
+    if isinstance(valor, bool) or (isinstance(valor, float) and not valor.is_integer()):
+        return None
+    try:
+        cantidad = int(valor)
+    except (TypeError, ValueError):
+        return None
+    return cantidad if cantidad > 0 else None
+
+
+def descontar_stock(cursor, id_variante, cantidad):
+    # Un único UPDATE condicional: sin leer antes el stock no hay carrera
+    # entre ventas concurrentes. LAST_INSERT_ID(expr) deja el stock
+    # resultante en lastrowid sin otra consulta. None = no se descontó.
+    cursor.execute("""
+        UPDATE variantes
+        SET stock = LAST_INSERT_ID(stock - %s)
+        WHERE id_variante = %s AND id_estado = 1 AND stock >= %s
+    """, (cantidad, id_variante, cantidad))
+
+    if cursor.rowcount != 1:
+        return None
+    return cursor.lastrowid or 0
+
+
+def error_salida_rechazada(cursor, id_variante):
+    cursor.execute(
+        "SELECT stock FROM variantes WHERE id_variante = %s AND id_estado = 1",
+        (id_variante,)
+    )
+    if not cursor.fetchone():
+        return {"ok": False, "error": "Variante no encontrada", "id_variante": id_variante}, 404
+    return {"ok": False, "error": "Cantidad inválida", "id_variante": id_variante}, 400
+
+
+def registrar_salidas(cursor, movimientos):
+    # movimientos: (id_variante, cantidad, stock_anterior, stock_nuevo,
+    # precio_venta, total_venta), escritos en un solo INSERT multi-fila
+    cursor.executemany("""
+        INSERT INTO movimientos_inventario
+        (id_variante, tipo, cantidad, stock_anterior, stock_nuevo,
+         fecha, precio_venta, fecha_venta, total_venta)
+        VALUES (%s, 'SALIDA', %s, %s, %s, NOW(), %s, NOW(), %s)
+    """, movimientos)
+
+    sumar_resumen(cursor, [(mov[0], -mov[1]) for mov in movimientos])
+
+
 @app.route("/ActualizarStock", methods=["POST"])
 def actualizar_stock():
     data = request.get_json()
@@ -656,61 +2117,176 @@ def actualizar_stock():
     if None in (id_variante, cantidad, precio_venta):
         return jsonify({"ok": False, "error": "Datos incompletos"}), 400
 
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-
     try:
-        cursor.execute(
-            "SELECT stock FROM variantes WHERE id_variante = %s AND id_estado = 1",
-            (id_variante,)
-        )
-        row = cursor.fetchone()
+        id_variante = int(id_variante)
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Variante inválida"}), 400
 
-        if not row:
-            return jsonify({"ok": False, "error": "Variante no encontrada"}), 404
+    cantidad = leer_cantidad(cantidad)
+    if cantidad is None:
+        return jsonify({"ok": False, "error": "Cantidad inválida"}), 400
 
-        stock_anterior = row["stock"]
+    with cursor_db(dictionary=True) as (conn, cursor):
+        try:
+            stock_nuevo = descontar_stock(cursor, id_variante, cantidad)
+
+            if stock_nuevo is None:
+                error, status = error_salida_rechazada(cursor, id_variante)
+                del error["id_variante"]
+                return jsonify(error), status
+
+            total_venta = cantidad * precio_venta
+
+            registrar_salidas(cursor, [(
+                id_variante,
+                cantidad,
+                stock_nuevo + cantidad,
+                stock_nuevo,
+                precio_venta,
+                total_venta
+            )])
+
+            conn.commit()
+            invalidar_catalogo()
+            return jsonify({"ok": True})
 
-        if cantidad <= 0 or cantidad > stock_anterior:
-            return jsonify({"ok": False, "error": "Cantidad inválida"}), 400
+        except Exception as e:
+            conn.rollback()
+            print("ERROR ACTUALIZAR STOCK:", e)
+            return jsonify({"ok": False, "error": str(e)}), 500
 
-        stock_nuevo = stock_anterior - cantidad
-        total_venta = cantidad * precio_venta
+@app.route("/RegistrarVenta", methods=["POST"])
+def registrar_venta():
+    data = request.get_json(force=True)
+    if not isinstance(data, dict):
+        return jsonify({"ok": False, "error": "Datos incompletos"}), 400
 
-        cursor.execute(
-            "UPDATE variantes SET stock = %s WHERE id_variante = %s",
-            (stock_nuevo, id_variante)
-        )
+    items = data.get("items")
 
-        cursor.execute("""
-            INSERT INTO movimientos_inventario
-            (id_variante, tipo, cantidad, stock_anterior, stock_nuevo,
-             fecha, precio_venta, fecha_venta, total_venta)
-            VALUES (%s, 'SALIDA', %s, %s, %s, NOW(), %s, NOW(), %s)
-        """, (
-            id_variante,
-            cantidad,
-            stock_anterior,
-            stock_nuevo,
-            precio_venta,
-            total_venta
-        ))
+    if not isinstance(items, list) or len(items) == 0:
+        return jsonify({"ok": False, "error": "La venta no tiene productos"}), 400
 
-        conn.commit()
-        return jsonify({"ok": True})
+    lineas = []
+    for item in items:
+        if not isinstance(item, dict):
+            return jsonify({"ok": False, "error": "Datos incompletos"}), 400
 
-    except Exception as e:
-        conn.rollback()
-        print("ERROR ACTUALIZAR STOCK:", e)
-        return jsonify({"ok": False, "error": str(e)}), 500
+        id_variante  = item.get("id_variante")
+        cantidad     = item.get("cantidad")
+        precio_venta = item.get("precio_venta")
+
+        if None in (id_variante, cantidad, precio_venta):
+            return jsonify({"ok": False, "error": "Datos incompletos"}), 400
+
+        # Ids como enteros: el orden de bloqueo no puede mezclar tipos
+        try:
+            id_variante = int(id_variante)
+        except (TypeError, ValueError):
+            return jsonify({
+                "ok": False,
+                "error": "Variante inválida",
+                "id_variante": id_variante
+            }), 400
+
+        cantidad = leer_cantidad(cantidad)
+        if cantidad is None:
+            return jsonify({
+                "ok": False,
+                "error": "Cantidad inválida",
+                "id_variante": id_variante
+            }), 400
+
+        lineas.append((id_variante, cantidad, precio_venta))
+
+    # Mismo orden de bloqueo en todas las ventas para evitar deadlocks
+    lineas.sort(key=lambda linea: linea[0])
+
+    with cursor_db(dictionary=True) as (conn, cursor):
+        try:
+            movimientos = []
+            total = 0
+
+            for id_variante, cantidad, precio_venta in lineas:
+                stock_nuevo = descontar_stock(cursor, id_variante, cantidad)
+
+                if stock_nuevo is None:
+                    error, status = error_salida_rechazada(cursor, id_variante)
+                    conn.rollback()
+                    return jsonify(error), status
+
+                total_venta = cantidad * precio_venta
+                total += total_venta
+                movimientos.append((
+                    id_variante,
+                    cantidad,
+                    stock_nuevo + cantidad,
+                    stock_nuevo,
+                    precio_venta,
+                    total_venta
+                ))
+
+            registrar_salidas(cursor, movimientos)
+
+            conn.commit()
+            invalidar_catalogo()
+            return jsonify({"ok": True, "lineas": len(movimientos), "total_venta": total})
+
+        except Exception as e:
+            conn.rollback()
+            print("ERROR REGISTRAR VENTA:", e)
+            return jsonify({"ok": False, "error": str(e)}), 500
+
+def aplicar_entradas(cursor, entradas):
+    # entradas: [(id_variante, cantidad)]. Bloquea las variantes en una
+    # consulta, suma el stock con un solo UPDATE y escribe todos los
+    # movimientos con un INSERT multi-fila. Devuelve los ids inexistentes.
+    ids = sorted({id_variante for id_variante, _ in entradas})
+    placeholders = ",".join(["%s"] * len(ids))
+
+    cursor.execute(
+        f"SELECT id_variante, stock FROM variantes WHERE id_variante IN ({placeholders}) FOR UPDATE",
+        ids
+    )
+    stock = {row["id_variante"]: row["stock"] for row in cursor.fetchall()}
+
+    faltantes = [id_variante for id_variante in ids if id_variante not in stock]
+    if faltantes:
+        return faltantes
+
+    sumas = defaultdict(int)
+    movimientos = []
+    for id_variante, cantidad in entradas:
+        sumas[id_variante] += cantidad
+        stock_anterior = stock[id_variante]
+        stock[id_variante] = stock_anterior + cantidad
+        movimientos.append((id_variante, cantidad, stock_anterior, stock[id_variante]))
+
+    casos = " ".join(["WHEN %s THEN %s"] * len(sumas))
+    params = [valor for par in sumas.items() for valor in par]
+    cursor.execute(
+        f"""
+        UPDATE variantes
+        SET stock = stock + CASE id_variante {casos} END
+        WHERE id_variante IN ({placeholders})
+        """,
+        params + ids
+    )
+
+    cursor.executemany("""
+        INSERT INTO movimientos_inventario
+        (id_variante, tipo, cantidad, stock_anterior, stock_nuevo, fecha)
+        VALUES (%s, 'ENTRADA', %s, %s, %s, NOW())
+    """, movimientos)
+
+    sumar_resumen(cursor, entradas)
+    return []
 
-    finally:
-        cursor.close()
-        conn.close()
 
 @app.route("/EntradaStock", methods=["POST"])
 def entrada_stock():
     data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"ok": False, "error": "Datos incompletos"}), 400
 
     id_variante = data.get("id_variante")
     cantidad    = data.get("cantidad")
@@ -718,205 +2294,1402 @@ def entrada_stock():
     if None in (id_variante, cantidad):
         return jsonify({"ok": False, "error": "Datos incompletos"}), 400
 
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-
+    # El stock leído se indexa con los ids enteros que devuelve MySQL
     try:
-        cursor.execute(
-            "SELECT stock FROM variantes WHERE id_variante = %s",
-            (id_variante,)
-        )
-        row = cursor.fetchone()
+        id_variante = int(id_variante)
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Variante inválida"}), 400
 
-        stock_anterior = row["stock"]
-        stock_nuevo = stock_anterior + cantidad
+    cantidad = leer_cantidad(cantidad)
+    if cantidad is None:
+        return jsonify({"ok": False, "error": "Cantidad inválida"}), 400
 
-        cursor.execute(
-            "UPDATE variantes SET stock = %s WHERE id_variante = %s",
-            (stock_nuevo, id_variante)
-        )
-
-        cursor.execute("""
-            INSERT INTO movimientos_inventario
-            (id_variante, tipo, cantidad, stock_anterior, stock_nuevo, fecha)
-            VALUES (%s, 'ENTRADA', %s, %s, %s, NOW())
-        """, (
-            id_variante,
-            cantidad,
-            stock_anterior,
-            stock_nuevo
-        ))
-
-        conn.commit()
-        return jsonify({"ok": True})
+    with cursor_db(dictionary=True) as (conn, cursor):
+        try:
+            if aplicar_entradas(cursor, [(id_variante, cantidad)]):
+                conn.rollback()
+                return jsonify({"ok": False, "error": "Variante no encontrada"}), 404
 
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"ok": False, "error": str(e)}), 500
+            conn.commit()
+            invalidar_catalogo()
+            return jsonify({"ok": True})
 
+        except Exception as e:
+            conn.rollback()
+            return jsonify({"ok": False, "error": str(e)}), 500
 
 
+@app.route("/EntradaStockLote", methods=["POST"])
+def entrada_stock_lote():
+    data = request.get_json(force=True)
+    if not isinstance(data, dict):
+        return jsonify({"ok": False, "error": "Datos incompletos"}), 400
 
-# ============================================
-# RUTAS - CATÁLOGOS
-# ============================================
+    items = data.get("items")
 
-@app.route("/GetCategorias", methods=["GET"])
-def get_categorias():
-        
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+    if not isinstance(items, list) or len(items) == 0:
+        return jsonify({"ok": False, "error": "La entrada no tiene productos"}), 400
 
-    cursor.execute("""
-        SELECT id_categoria, nombre
-        FROM categorias
-        WHERE id_estado = 1
-        ORDER BY nombre
-    """)
+    entradas = []
+    for item in items:
+        if not isinstance(item, dict):
+            return jsonify({"ok": False, "error": "Datos incompletos"}), 400
 
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
+        id_variante = item.get("id_variante")
+        cantidad    = item.get("cantidad")
 
-    return jsonify(data)
+        if None in (id_variante, cantidad):
+            return jsonify({"ok": False, "error": "Datos incompletos"}), 400
 
+        try:
+            id_variante = int(id_variante)
+        except (TypeError, ValueError):
+            return jsonify({
+                "ok": False,
+                "error": "Variante inválida",
+                "id_variante": id_variante
+            }), 400
 
-@app.route("/AddCategoria", methods=["POST"])
-def add_categoria():
-        
-    data = request.get_json()
-    nombre = data.get("nombre", "").strip()
+        cantidad = leer_cantidad(cantidad)
+        if cantidad is None:
+            return jsonify({
+                "ok": False,
+                "error": "Cantidad inválida",
+                "id_variante": id_variante
+            }), 400
 
-    if not nombre:
-        return jsonify({"ok": False, "error": "Nombre requerido"}), 400
+        entradas.append((id_variante, cantidad))
 
-    conn = get_connection()
-    cursor = conn.cursor()
+    with cursor_db(dictionary=True) as (conn, cursor):
+        try:
+            faltantes = aplicar_entradas(cursor, entradas)
+            if faltantes:
+                conn.rollback()
+                return jsonify({
+                    "ok": False,
+                    "error": "Variante no encontrada",
+                    "ids": faltantes
+                }), 404
+
+            conn.commit()
+            invalidar_catalogo()
+            return jsonify({"ok": True, "lineas": len(entradas)})
+
+        except Exception as e:
+            conn.rollback()
+            print("ERROR ENTRADA STOCK LOTE:", e)
+            return jsonify({"ok": False, "error": str(e)}), 500
 
-    try:
-        cursor.execute(
-            "INSERT INTO categorias (nombre, id_estado) VALUES (%s, %s)",
-            (nombre, 1)
-        )
-        conn.commit()
-        return jsonify({"ok": True})
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"ok": False, "error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 
-@app.route("/GetGeneros", methods=["GET"])
-def get_generos():
-        
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
 
+# ============================================
+# RESUMEN DE INVENTARIO
+# ============================================
+# Tabla resumen_inventario con cantidad y valor por producto y talla (con
+# su categoría, género y estilo), sobre variantes y productos activos. Se
+# actualiza en la misma transacción que cada movimiento de stock o cambio
+# de productos, así los reportes leen filas ya agregadas.
+#
+#   flask --app app resumen-reconstruir   crea la tabla y la llena de cero
+#   flask --app app resumen-verificar     la compara con las variantes
+#
+# Mientras RESUMEN_INVENTARIO no esté activo no se escribe ni se lee.
+RESUMEN_INVENTARIO = parametro_activo(os.environ.get("RESUMEN_INVENTARIO", ""))
+
+SQL_CREAR_RESUMEN = """
+    CREATE TABLE IF NOT EXISTS resumen_inventario (
+        id_producto INT NOT NULL,
+        id_talla INT NOT NULL,
+        id_categoria INT NULL,
+        id_genero INT NULL,
+        id_estilo INT NULL,
+        cantidad BIGINT NOT NULL DEFAULT 0,
+        valor DECIMAL(16, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (id_producto, id_talla),
+        KEY idx_resumen_categoria (id_categoria, id_genero)
+    )
+"""
+
+SQL_AGREGADO_RESUMEN = """
+    SELECT p.id_producto, COALESCE(v.id_talla, 0) AS id_talla,
+           p.id_categoria, p.id_genero, p.id_estilo,
+           SUM(v.stock) AS cantidad, SUM(v.stock * v.precio) AS valor
+    FROM variantes v
+    JOIN productos p ON v.id_producto = p.id_producto
+    WHERE v.id_estado = 1 AND p.id_estado = 1 {filtro}
+    GROUP BY p.id_producto, COALESCE(v.id_talla, 0)
+"""
+
+
+def sumar_resumen(cursor, deltas):
+    # deltas: [(id_variante, cantidad)], negativa en las salidas. Las filas
+    # del resumen se escriben ordenadas por llave para que dos transacciones
+    # concurrentes las bloqueen siempre en el mismo orden.
+    if not RESUMEN_INVENTARIO or not deltas:
+        return
+
+    ids = sorted({id_variante for id_variante, _ in deltas})
+    placeholders = ",".join(["%s"] * len(ids))
+    cursor.execute(
+        f"""
+        SELECT v.id_variante, v.id_producto, COALESCE(v.id_talla, 0) AS id_talla, v.precio,
+               p.id_categoria, p.id_genero, p.id_estilo
+        FROM variantes v
+        JOIN productos p ON v.id_producto = p.id_producto
+        WHERE v.id_variante IN ({placeholders}) AND v.id_estado = 1 AND p.id_estado = 1
+        """,
+        ids
+    )
+    variantes = {row["id_variante"]: row for row in cursor.fetchall()}
+
+    acumulado = {}
+    for id_variante, cantidad in deltas:
+        variante = variantes.get(id_variante)
+        if variante is None:
+            continue
+
+        clave = (variante["id_producto"], variante["id_talla"])
+        fila = acumulado.setdefault(clave, [
+            variante["id_categoria"], variante["id_genero"], variante["id_estilo"], 0, 0
+        ])
+        fila[3] += cantidad
+        fila[4] += cantidad * variante["precio"]
+
+    if not acumulado:
+        return
+
+    cursor.executemany(
+        """
+        INSERT INTO resumen_inventario
+        (id_producto, id_talla, id_categoria, id_genero, id_estilo, cantidad, valor)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            cantidad = cantidad + VALUES(cantidad),
+            valor = valor + VALUES(valor)
+        """,
+        [clave + tuple(fila) for clave, fila in sorted(acumulado.items())]
+    )
+
+
+def recalcular_resumen(cursor, ids_producto=None):
+    # Rehace las filas de los productos indicados (o todas con None): se usa
+    # cuando cambian precios, categoría o estado, no solo el stock
+    if ids_producto is None:
+        cursor.execute("DELETE FROM resumen_inventario")
+        cursor.execute(f"""
+            INSERT INTO resumen_inventario
+            (id_producto, id_talla, id_categoria, id_genero, id_estilo, cantidad, valor)
+            {SQL_AGREGADO_RESUMEN.format(filtro="")}
+        """)
+        return
+
+    ids_producto = sorted(set(ids_producto))
+    if not RESUMEN_INVENTARIO or not ids_producto:
+        return
+
+    placeholders = ",".join(["%s"] * len(ids_producto))
+    cursor.execute(
+        f"DELETE FROM resumen_inventario WHERE id_producto IN ({placeholders})",
+        ids_producto
+    )
+    cursor.execute(
+        f"""
+        INSERT INTO resumen_inventario
+        (id_producto, id_talla, id_categoria, id_genero, id_estilo, cantidad, valor)
+        {SQL_AGREGADO_RESUMEN.format(filtro=f"AND p.id_producto IN ({placeholders})")}
+        """,
+        ids_producto
+    )
+
+
+def consultar_resumen_inventario(cursor, filtros):
+    # Mismas columnas de nombre que el reporte, con Cantidad y Total numéricos
+    condiciones = []
+    params = []
+    for valor, condicion in zip(filtros, (
+        "cat.nombre = %s", "g.nombre = %s", "p.nombre = %s", "t.valor = %s", "e.nombre = %s"
+    )):
+        if valor is not None:
+            condiciones.append(condicion)
+            params.append(valor)
+
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    cursor.execute(
+        f"""
+        SELECT cat.nombre AS Categoria, g.nombre AS Genero, p.nombre AS Producto,
+               e.nombre AS Estilo, t.valor AS Talla,
+               r.cantidad AS Cantidad, r.valor AS Total
+        FROM resumen_inventario r
+        JOIN productos p ON r.id_producto = p.id_producto
+        LEFT JOIN categorias cat ON r.id_categoria = cat.id_categoria
+        LEFT JOIN generos g ON r.id_genero = g.id_genero
+        LEFT JOIN estilos e ON r.id_estilo = e.id_estilo
+        LEFT JOIN tallas t ON r.id_talla = t.id_talla
+        {where}
+        ORDER BY cat.nombre, g.nombre, p.nombre, t.valor
+        """,
+        params
+    )
+    columns = list(cursor.column_names)
+    rows = cursor.fetchall()
+
+    # DECIMAL llega como Decimal y jsonify lo volvería texto
+    if rows and not isinstance(rows[0], dict):
+        total = columns.index("Total")
+        rows = [fila[:total] + (float(fila[total]),) + fila[total + 1:] for fila in rows]
+    else:
+        for row in rows:
+            row["Total"] = float(row["Total"])
+
+    return columns, rows
+
+
+def leer_resumen_calculado(cursor):
+    cursor.execute(SQL_AGREGADO_RESUMEN.format(filtro=""))
+    return {(row["id_producto"], row["id_talla"]): row for row in cursor.fetchall()}
+
+
+def leer_resumen_guardado(cursor):
     cursor.execute("""
-        SELECT id_genero, nombre
-        FROM generos
-        WHERE id_estado = 1
+        SELECT id_producto, id_talla, id_categoria, id_genero, id_estilo, cantidad, valor
+        FROM resumen_inventario
     """)
+    return {(row["id_producto"], row["id_talla"]): row for row in cursor.fetchall()}
 
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
 
-    return jsonify(data)
+def diferencias_resumen(calculado, guardado):
+    # Filas guardadas en cero sin variantes activas detrás no son error
+    campos = ("id_categoria", "id_genero", "id_estilo", "cantidad", "valor")
+    diferencias = []
 
+    for clave in sorted(calculado.keys() | guardado.keys()):
+        esperado = calculado.get(clave)
+        actual = guardado.get(clave)
 
-@app.route("/GetColores", methods=["GET"])
-def get_colores():
-        
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+        if esperado is None and actual["cantidad"] == 0 and actual["valor"] == 0:
+            continue
 
-    cursor.execute("SELECT id_color, nombre FROM colores WHERE id_estado = 1 ORDER BY nombre")
-    data = cursor.fetchall()
+        if esperado is None or actual is None or any(
+            esperado[campo] != actual[campo] for campo in campos
+        ):
+            diferencias.append((clave, esperado, actual))
 
-    cursor.close()
-    conn.close()
+    return diferencias
 
-    return jsonify(data)
 
+@app.cli.command("resumen-reconstruir")
+def resumen_reconstruir():
+    with cursor_db(dictionary=True) as (conn, cursor):
+        cursor.execute(SQL_CREAR_RESUMEN)
+        recalcular_resumen(cursor)
+        conn.commit()
 
-@app.route("/AddColor", methods=["POST",])
-def add_color():
+        cursor.execute("SELECT COUNT(*) AS filas FROM resumen_inventario")
+        print(f"Resumen de inventario reconstruido: {cursor.fetchone()['filas']} filas")
 
-    data = request.get_json()
-    nombre = data.get("nombre", "").strip()
 
-    if not nombre:
-        return jsonify({"ok": False, "error": "Nombre requerido"}), 400
+@app.cli.command("resumen-verificar")
+def resumen_verificar():
+    with cursor_db(dictionary=True) as (conn, cursor):
+        diferencias = diferencias_resumen(
+            leer_resumen_calculado(cursor),
+            leer_resumen_guardado(cursor)
+        )
 
-    conn = get_connection()
-    cursor = conn.cursor()
+    if not diferencias:
+        print("Resumen de inventario consistente")
+        return
 
-    try:
-        cursor.execute(
-            "INSERT INTO colores (nombre, id_estado) VALUES (%s, %s)",
-            (nombre, 1)
-        )
-        conn.commit()
+    for (id_producto, id_talla), esperado, actual in diferencias[:50]:
+        print(f"producto {id_producto} talla {id_talla}: esperado {esperado} guardado {actual}")
+    print(f"{len(diferencias)} diferencias; corregir con: flask --app app resumen-reconstruir")
+    raise SystemExit(1)
 
-        return jsonify({
-            "ok": True,
-            "id_color": cursor.lastrowid
-        })
-    except Exception as e:
-        conn.rollback()
-        return jsonify({"ok": False, "error": str(e)}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
+# ============================================
+# BÚSQUEDA DE PRODUCTOS, ESTILOS Y MARCAS
+# ============================================
+# Índice en memoria por worker para el autocompletado: una lista ordenada
+# de palabras (búsqueda por prefijo con bisect) y un índice de trigramas
+# para tolerar errores de tipeo. Los nombres se agrupan como en
+# /GetNombresProductos y /GetEstilosUnicos (sin mayúsculas, tildes ni
+# espacios de más) y cada resultado lleva los ids que comparten el nombre.
+# AddProducto y DeleteProductos lo actualizan en el worker que atiende la
+# petición; los demás ven otra versión de VERSION_BUSQUEDA y lo
+# reconstruyen completo en la siguiente búsqueda.
+BUSQUEDA_LIMITE_DEFECTO = 10
+BUSQUEDA_LIMITE_MAX = 50
+BUSQUEDA_MAX_CANDIDATOS = int(os.environ.get("BUSQUEDA_MAX_CANDIDATOS", 200))
+BUSQUEDA_SIMILITUD = float(os.environ.get("BUSQUEDA_SIMILITUD", 0.25))
+BUSQUEDA_VERIFICAR = float(os.environ.get("BUSQUEDA_VERIFICAR", 1))
+
+CONSULTAS_BUSQUEDA = {
+    "producto": "SELECT id_producto AS id, nombre FROM productos WHERE id_estado = 1",
+    "estilo": "SELECT id_estilo AS id, nombre FROM estilos WHERE id_estado = 1",
+    "marca": "SELECT id_marca AS id, nombre FROM marcas WHERE id_estado = 1",
+}
+
+# exacto > el nombre empieza por la consulta > alguna palabra empieza por
+# ella; las coincidencias por trigramas puntúan con su similitud (< 1).
+PUNTAJE_EXACTO = 4
+PUNTAJE_PREFIJO_NOMBRE = 3
+PUNTAJE_PREFIJO_PALABRA = 2
+
+
+def normalizar_busqueda(texto):
+    texto = unicodedata.normalize("NFD", str(texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.split())
+
+
+@lru_cache(maxsize=65536)
+def trigramas_palabra(palabra):
+    relleno = f"  {palabra} "
+    return frozenset(relleno[i:i + 3] for i in range(len(relleno) - 2))
+
+
+class IndiceBusqueda:
+
+    def __init__(self):
+        self._reiniciar()
+        self._vaciar()
+
+    def _reiniciar(self):
+        self._lock = threading.Lock()
+        self._reconstruyendo = threading.Lock()
+
+    def reiniciar_tras_fork(self):
+        self._reiniciar()
+
+    def _vaciar(self):
+        self._version = None
+        self._verificado = 0
+        self._construido = False
+        # (tipo, normalizado) -> [nombre, {ids}]
+        self._docs = {}
+        # (tipo, id) -> (tipo, normalizado)
+        self._claves = {}
+        # (normalizado, tipo) ordenado, para el prefijo del nombre completo
+        self._nombres = []
+        # palabra -> {(tipo, normalizado)}; _vocabulario son sus claves
+        # ordenadas, para el prefijo de cada palabra
+        self._palabras = {}
+        self._vocabulario = []
+        # trigrama -> {palabra}, para corregir palabras mal escritas
+        self._trigramas = defaultdict(set)
+
+    @staticmethod
+    def _insertar(lista, valor, ordenar):
+        if ordenar:
+            bisect.insort(lista, valor)
+        else:
+            lista.append(valor)
+
+    @staticmethod
+    def _eliminar(lista, valor):
+        i = bisect.bisect_left(lista, valor)
+        if i < len(lista) and lista[i] == valor:
+            del lista[i]
+
+    def _indexar(self, tipo, id_doc, nombre, ordenar=True):
+        normal = normalizar_busqueda(nombre)
+        if not normal:
+            return
+
+        clave = (tipo, normal)
+        self._claves[(tipo, id_doc)] = clave
+        doc = self._docs.get(clave)
+        if doc is not None:
+            doc[1].add(id_doc)
+            return
+
+        self._docs[clave] = [" ".join(str(nombre).split()), {id_doc}]
+        self._insertar(self._nombres, (normal, tipo), ordenar)
+
+        for palabra in set(normal.split()):
+            if palabra not in self._palabras:
+                self._palabras[palabra] = set()
+                self._insertar(self._vocabulario, palabra, ordenar)
+                for tri in trigramas_palabra(palabra):
+                    self._trigramas[tri].add(palabra)
+            self._palabras[palabra].add(clave)
+
+    def _desindexar(self, tipo, id_doc):
+        clave = self._claves.pop((tipo, id_doc), None)
+        if clave is None:
+            return
+
+        ids = self._docs[clave][1]
+        ids.discard(id_doc)
+        if ids:
+            return
+
+        del self._docs[clave]
+        normal = clave[1]
+        self._eliminar(self._nombres, (normal, tipo))
+
+        for palabra in set(normal.split()):
+            claves = self._palabras[palabra]
+            claves.discard(clave)
+            if claves:
+                continue
+
+            del self._palabras[palabra]
+            self._eliminar(self._vocabulario, palabra)
+            for tri in trigramas_palabra(palabra):
+                self._trigramas[tri].discard(palabra)
+
+    def reconstruir(self):
+        # La versión se lee antes de consultar: un cambio durante la
+        # consulta dejará el índice desactualizado y se reconstruirá otra vez.
+        version = versiones_datos.actual(VERSION_BUSQUEDA)
+
+        filas = []
+        with cursor_db(dictionary=True) as (conn, cursor):
+            for tipo, sql in CONSULTAS_BUSQUEDA.items():
+                cursor.execute(sql)
+                filas.extend((tipo, fila["id"], fila["nombre"]) for fila in cursor.fetchall())
+
+        nuevo = IndiceBusqueda()
+        for tipo, id_doc, nombre in filas:
+            nuevo._indexar(tipo, id_doc, nombre, ordenar=False)
+        nuevo._nombres.sort()
+        nuevo._vocabulario.sort()
+
+        with self._lock:
+            self._docs = nuevo._docs
+            self._claves = nuevo._claves
+            self._nombres = nuevo._nombres
+            self._palabras = nuevo._palabras
+            self._vocabulario = nuevo._vocabulario
+            self._trigramas = nuevo._trigramas
+            self._version = version
+            self._construido = True
+
+    def _al_dia(self):
+        actual = versiones_datos.actual(VERSION_BUSQUEDA)
+        with self._lock:
+            return self._construido and self._version == actual
+
+    def _sincronizar(self):
+        ahora = time.monotonic()
+        if self._construido and ahora - self._verificado < BUSQUEDA_VERIFICAR:
+            return
+        self._verificado = ahora
+
+        if self._al_dia():
+            return
+
+        # Mientras otro hilo reconstruye se responde con el índice anterior;
+        # solo se espera si todavía no hay ninguno.
+        if not self._reconstruyendo.acquire(blocking=not self._construido):
+            return
+        try:
+            if not self._al_dia():
+                self.reconstruir()
+        finally:
+            self._reconstruyendo.release()
+
+    def actualizar(self, agregar=(), quitar=()):
+        # agregar: (tipo, id, nombre); quitar: (tipo, id). El cambio y la
+        # versión van en la misma sección crítica: ninguna búsqueda o
+        # reconstrucción de otro hilo ve el índice cambiado con la versión
+        # anterior, ni dos actualizaciones cruzan sus versiones.
+        with self._lock:
+            try:
+                if self._construido:
+                    for tipo, id_doc, nombre in agregar:
+                        self._indexar(tipo, id_doc, nombre)
+                    for tipo, id_doc in quitar:
+                        self._desindexar(tipo, id_doc)
+
+                # Si otro worker cambió los datos entre medio, a este índice
+                # le falta su cambio: se reconstruye en la siguiente búsqueda.
+                anterior, nueva = versiones_datos.incrementar_desde(VERSION_BUSQUEDA)
+                self._version = nueva if self._version == anterior else None
+            except Exception as e:
+                print("ERROR ACTUALIZANDO BUSQUEDA:", e)
+                self._version = None
+
+    def _docs_palabra(self, palabra):
+        # Documentos con alguna palabra que empieza por la dada (similitud
+        # 1); si no hay ninguna, los de las palabras más parecidas.
+        claves = set()
+        i = bisect.bisect_left(self._vocabulario, palabra)
+        fin = min(len(self._vocabulario), i + BUSQUEDA_MAX_CANDIDATOS)
+        while i < fin and self._vocabulario[i].startswith(palabra):
+            claves.update(self._palabras[self._vocabulario[i]])
+            i += 1
+
+        if claves or len(palabra) < 3:
+            return claves, 1
+
+        tris = trigramas_palabra(palabra)
+        comunes = defaultdict(int)
+        for tri in tris:
+            for candidata in self._trigramas.get(tri, ()):
+                comunes[candidata] += 1
+
+        similitud = 0
+        for candidata, n in comunes.items():
+            actual = n / (len(tris) + len(trigramas_palabra(candidata)) - n)
+            if actual >= BUSQUEDA_SIMILITUD:
+                claves.update(self._palabras[candidata])
+                similitud = max(similitud, actual)
+
+        return claves, similitud
+
+    def buscar(self, texto, tipos, limite):
+        consulta = normalizar_busqueda(texto)
+        if not consulta:
+            return []
+
+        self._sincronizar()
+
+        with self._lock:
+            puntajes = {}
+
+            # 1. Nombres que empiezan por la consulta, en orden alfabético
+            i = bisect.bisect_left(self._nombres, (consulta,))
+            while i < len(self._nombres) and len(puntajes) < BUSQUEDA_MAX_CANDIDATOS:
+                normal, tipo = self._nombres[i]
+                if not normal.startswith(consulta):
+                    break
+                i += 1
+                if tipo in tipos:
+                    puntajes[(tipo, normal)] = PUNTAJE_EXACTO if normal == consulta else PUNTAJE_PREFIJO_NOMBRE
+
+            # 2. Todas las palabras de la consulta, en cualquier orden, como
+            #    prefijo de alguna palabra del nombre o corregidas
+            if len(puntajes) < limite:
+                comunes = None
+                similitud = 1
+                for palabra in sorted(set(consulta.split()), key=len, reverse=True):
+                    claves, parecido = self._docs_palabra(palabra)
+                    comunes = claves if comunes is None else comunes & claves
+                    similitud = min(similitud, parecido)
+                    if not comunes:
+                        break
+
+                puntaje = PUNTAJE_PREFIJO_PALABRA if similitud == 1 else similitud
+                for clave in comunes or ():
+                    if len(puntajes) >= BUSQUEDA_MAX_CANDIDATOS:
+                        break
+                    if clave[0] in tipos and clave not in puntajes:
+                        puntajes[clave] = puntaje
+
+            mejores = heapq.nsmallest(
+                limite,
+                puntajes.items(),
+                key=lambda item: (-item[1], len(item[0][1]), item[0][1])
+            )
 
-@app.route("/GetTallas", methods=["GET"])
-def get_tallas():
-        
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+            return [
+                {
+                    "tipo": tipo,
+                    "nombre": self._docs[(tipo, normal)][0],
+                    "ids": sorted(self._docs[(tipo, normal)][1]),
+                    "puntaje": round(puntaje, 3)
+                }
+                for (tipo, normal), puntaje in mejores
+            ]
 
-    cursor.execute("SELECT id_talla, valor, id_genero FROM tallas ORDER BY valor")
-    data = cursor.fetchall()
 
-    cursor.close()
-    conn.close()
+indice_busqueda = IndiceBusqueda()
 
-    return jsonify(data)
+os.register_at_fork(after_in_child=indice_busqueda.reiniciar_tras_fork)
 
 
-@app.route("/GetTallasPorCategoriaGenero", methods=["GET"])
-def get_tallas_por_categoria_genero():
-        
+@app.route("/BuscarCatalogo", methods=["GET"])
+def buscar_catalogo():
+    tipos = [t.strip() for t in request.args.get("tipo", "").split(",") if t.strip()] or list(CONSULTAS_BUSQUEDA)
+    desconocidos = [t for t in tipos if t not in CONSULTAS_BUSQUEDA]
+    if desconocidos:
+        return jsonify({
+            "ok": False,
+            "error": f"Tipo no soportado: {', '.join(desconocidos)}. Usa {', '.join(CONSULTAS_BUSQUEDA)}"
+        }), 400
+
+    try:
+        limite = int(request.args.get("limit", BUSQUEDA_LIMITE_DEFECTO))
+    except ValueError:
+        return jsonify({"ok": False, "error": "Valor inválido para limit"}), 400
+    limite = max(1, min(limite, BUSQUEDA_LIMITE_MAX))
+
+    try:
+        return jsonify(indice_busqueda.buscar(request.args.get("q", ""), set(tipos), limite))
+    except Exception as e:
+        print("ERROR BUSCANDO:", e)
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+
+# ============================================
+# FACETAS DEL CATÁLOGO
+# ============================================
+# Índice invertido en memoria por worker sobre las variantes activas: cada
+# variante es un bit (su posición en la lista de filas) y cada valor de
+# faceta un entero de Python usado como mapa de bits. Filtrar es un AND
+# entre mapas y contar un bit_count(), sin volver a MySQL. Se reconstruye
+# con una sola consulta cuando cambia la versión del catálogo.
+FACETAS_LIMITE_DEFECTO = 100
+FACETAS_LIMITE_MAX = 1000
+FACETAS_VERIFICAR = float(os.environ.get("FACETAS_VERIFICAR", 1))
+
+FACETAS = ("categoria", "genero", "marca", "estilo", "color", "talla")
+
+COLUMNAS_FACETAS = (
+    "id_variante", "id_producto", "nomproducto", "categoria", "genero",
+    "marca", "estilo", "color", "talla", "precio", "stock"
+)
+
+SQL_FACETAS = """
+    SELECT
+        v.id_variante, p.id_producto, p.nombre AS nomproducto,
+        cat.nombre AS categoria, g.nombre AS genero, m.nombre AS marca,
+        e.nombre AS estilo, c.nombre AS color, t.valor AS talla,
+        v.precio, v.stock
+    FROM variantes v
+    JOIN productos p ON v.id_producto = p.id_producto
+    JOIN categorias cat ON p.id_categoria = cat.id_categoria
+    LEFT JOIN generos g ON p.id_genero = g.id_genero
+    LEFT JOIN marcas m ON p.id_marca = m.id_marca
+    LEFT JOIN estilos e ON p.id_estilo = e.id_estilo
+    LEFT JOIN colores c ON v.id_color = c.id_color
+    LEFT JOIN tallas t ON v.id_talla = t.id_talla
+    WHERE p.id_estado = 1 and v.id_estado = 1
+    ORDER BY v.id_variante
+"""
+
+
+def posiciones_bits(mapa):
+    # bin() recorre el entero una sola vez; ir apagando el bit más bajo
+    # costaría una operación sobre todo el entero por cada resultado.
+    binario = bin(mapa)[:1:-1]
+    i = binario.find("1")
+    while i != -1:
+        yield i
+        i = binario.find("1", i + 1)
+
+
+class IndiceFacetas:
+
+    def __init__(self):
+        self._reiniciar()
+        self.version = None
+        self._verificado = 0
+        self._filas = []
+        # faceta -> {valor normalizado: [valor, mapa]}
+        self._mapas = {}
+        self._todas = 0
+        self._con_stock = 0
+
+    def _reiniciar(self):
+        self._lock = threading.Lock()
+        self._reconstruyendo = threading.Lock()
+
+    def reiniciar_tras_fork(self):
+        self._reiniciar()
+
+    def reconstruir(self):
+        version = versiones_datos.actual(VERSION_CATALOGO)
+
+        with cursor_db() as (conn, cursor):
+            cursor.execute(SQL_FACETAS)
+            filas = cursor.fetchall()
+
+        posicion = {columna: i for i, columna in enumerate(COLUMNAS_FACETAS)}
+        mapas = {faceta: {} for faceta in FACETAS}
+        con_stock = 0
+
+        for bit, fila in enumerate(filas):
+            marca = 1 << bit
+            for faceta in FACETAS:
+                valor = fila[posicion[faceta]]
+                if valor is None:
+                    continue
+                entrada = mapas[faceta].get(clave_talla(valor))
+                if entrada is None:
+                    mapas[faceta][clave_talla(valor)] = [valor, marca]
+                else:
+                    entrada[1] |= marca
+            if (fila[posicion["stock"]] or 0) > 0:
+                con_stock |= marca
+
+        with self._lock:
+            self._filas = filas
+            self._mapas = mapas
+            self._todas = (1 << len(filas)) - 1
+            self._con_stock = con_stock
+            self.version = version
+
+    def _sincronizar(self):
+        ahora = time.monotonic()
+        if self.version is not None and ahora - self._verificado < FACETAS_VERIFICAR:
+            return
+        self._verificado = ahora
+
+        if self.version is not None and versiones_datos.actual(VERSION_CATALOGO) == self.version:
+            return
+
+        # Como en la búsqueda: solo se espera si aún no hay índice
+        if not self._reconstruyendo.acquire(blocking=self.version is None):
+            return
+        try:
+            if self.version is None or versiones_datos.actual(VERSION_CATALOGO) != self.version:
+                self.reconstruir()
+        finally:
+            self._reconstruyendo.release()
+
+    def consultar(self, seleccion, en_stock, offset, limite, columnar=False):
+        # seleccion: faceta -> valores pedidos (OR dentro de la faceta, AND
+        # entre facetas). Los conteos de cada faceta ignoran su propia
+        # selección para que se vean las alternativas.
+        self._sincronizar()
+
+        with self._lock:
+            filas, mapas, version = self._filas, self._mapas, self.version
+            base = self._todas & self._con_stock if en_stock else self._todas
+
+        elegidos = {}
+        for faceta, valores in seleccion.items():
+            mapa = 0
+            for valor in valores:
+                entrada = mapas[faceta].get(clave_talla(valor))
+                if entrada:
+                    mapa |= entrada[1]
+            elegidos[faceta] = mapa
+
+        resultado = base
+        for mapa in elegidos.values():
+            resultado &= mapa
+
+        facetas = {}
+        for faceta in FACETAS:
+            mascara = base
+            for otra, mapa in elegidos.items():
+                if otra != faceta:
+                    mascara &= mapa
+
+            pedidos = {clave_talla(v): v for v in seleccion.get(faceta, ())}
+            conteos = {}
+            for clave, (valor, mapa) in mapas[faceta].items():
+                cantidad = (mapa & mascara).bit_count()
+                if cantidad or clave in pedidos:
+                    conteos[valor] = cantidad
+            # Lo pedido siempre aparece, aunque no exista en el catálogo
+            for clave, valor in pedidos.items():
+                if clave not in mapas[faceta]:
+                    conteos[valor] = 0
+            facetas[faceta] = dict(sorted(conteos.items(), key=lambda item: (-item[1], str(item[0]))))
+
+        pagina = [filas[bit] for bit in itertools.islice(posiciones_bits(resultado), offset, offset + limite)]
+        if columnar:
+            return version, {
+                "total": resultado.bit_count(),
+                "columns": list(COLUMNAS_FACETAS),
+                "rows": pagina,
+                "facetas": facetas
+            }
+
+        return version, {
+            "total": resultado.bit_count(),
+            "items": [dict(zip(COLUMNAS_FACETAS, fila)) for fila in pagina],
+            "facetas": facetas
+        }
+
+
+indice_facetas = IndiceFacetas()
+
+os.register_at_fork(after_in_child=indice_facetas.reiniciar_tras_fork)
+
+
+@app.route("/GetProductosFacetas", methods=["GET"])
+def get_productos_facetas():
+    seleccion = {}
+    for faceta in FACETAS:
+        valores = [v for v in (clean_report_param(v) for v in request.args.getlist(faceta)) if v is not None]
+        if valores:
+            seleccion[faceta] = valores
+
+    try:
+        offset = max(0, int(request.args.get("offset", 0)))
+        limite = int(request.args.get("limit", FACETAS_LIMITE_DEFECTO))
+    except ValueError:
+        return jsonify({"ok": False, "error": "Valor inválido para offset o limit"}), 400
+    limite = max(1, min(limite, FACETAS_LIMITE_MAX))
+
+    try:
+        columnar = pide_columnar(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    try:
+        version, data = indice_facetas.consultar(
+            seleccion,
+            parametro_activo(request.args.get("en_stock", "")),
+            offset,
+            limite,
+            columnar
+        )
+    except Exception as e:
+        print("ERROR CONSULTANDO FACETAS:", e)
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+    response = jsonify(data)
+    consulta = "&".join(f"{clave}={valor}" for clave, valor in sorted(request.args.items(multi=True)))
+    response.set_etag(f"facetas-{version}-{hashlib.sha1(consulta.encode('utf-8')).hexdigest()[:16]}")
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+# ============================================
+# RUTAS - IMPORTACIÓN MASIVA
+# ============================================
+# Carga de catálogos de proveedor (CSV o NDJSON, una variante por fila).
+# El archivo se lee en streaming, los nombres se resuelven contra mapas en
+# memoria y cada lote de IMPORT_LOTE filas se escribe y confirma junto.
+IMPORT_LOTE = int(os.environ.get("IMPORT_LOTE", 1000))
+IMPORT_MAX_ERRORES = int(os.environ.get("IMPORT_MAX_ERRORES", 1000))
+
+
+def clave_nombre(valor):
+    return str(valor).strip().lower()
+
+
+def formato_importacion(nombre, tipo):
+    # La extensión del archivo manda; si no la hay, el content type
+    extension = os.path.splitext(nombre or "")[1].lower()
+    if extension in (".ndjson", ".jsonl", ".json"):
+        return "ndjson"
+    if extension == ".csv":
+        return "csv"
+    return "ndjson" if "json" in (tipo or "") else "csv"
+
+
+def leer_filas_importacion(archivo, formato):
+    # Produce (numero_fila, datos, error) sin cargar el archivo completo
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+
+    if formato == "ndjson":
+        for numero, linea in enumerate(texto, start=1):
+            if not linea.strip():
+                continue
+            try:
+                datos = json.loads(linea)
+            except ValueError:
+                yield numero, None, "JSON inválido"
+                continue
+            if not isinstance(datos, dict):
+                yield numero, None, "Se esperaba un objeto JSON"
+                continue
+            yield numero, datos, None
+        return
+
+    encabezado = texto.readline()
+    delimitador = ";" if encabezado.count(";") > encabezado.count(",") else ","
+    columnas = [
+        c.strip().lower()
+        for c in next(csv.reader([encabezado], delimiter=delimitador), [])
+    ]
+
+    lector = csv.DictReader(texto, fieldnames=columnas, delimiter=delimitador)
+    # La fila 1 es el encabezado
+    for numero, datos in enumerate(lector, start=2):
+        if not any((v or "").strip() for v in datos.values() if isinstance(v, str)):
+            continue
+        yield numero, datos, None
+
+
+class ImportadorProductos:
+
+    def __init__(self, conn, cursor):
+        self.conn = conn
+        self.cursor = cursor
+        self.importadas = 0
+        self.errores = []
+        self.total_errores = 0
+        self._cargar_mapas()
+
+    def _cargar_mapas(self):
+        cursor = self.cursor
+
+        def mapa(sql, llave, valor="id"):
+            cursor.execute(sql)
+            resultado = {}
+            for row in cursor.fetchall():
+                resultado.setdefault(clave_nombre(row[llave]), row[valor])
+            return resultado
+
+        self.categorias = mapa(
+            "SELECT id_categoria AS id, nombre FROM categorias WHERE id_estado = 1 ORDER BY id_categoria",
+            "nombre"
+        )
+        self.generos = mapa(
+            "SELECT id_genero AS id, nombre FROM generos WHERE id_estado = 1 ORDER BY id_genero",
+            "nombre"
+        )
+        self.colores = mapa(
+            "SELECT id_color AS id, nombre FROM colores WHERE id_estado = 1 ORDER BY id_color",
+            "nombre"
+        )
+        self.marcas = mapa(
+            "SELECT id_marca AS id, nombre FROM marcas WHERE id_estado = 1 ORDER BY id_marca",
+            "nombre"
+        )
+        self.estilos = mapa(
+            "SELECT id_estilo AS id, nombre FROM estilos ORDER BY id_estilo",
+            "nombre"
+        )
+
+        cursor.execute("""
+            SELECT id_talla, valor, id_categoria, id_genero
+            FROM tallas
+            WHERE id_estado = 1
+            ORDER BY id_talla
+        """)
+        self.tallas = {}
+        for row in cursor.fetchall():
+            self.tallas.setdefault(
+                (clave_talla(row["valor"]), row["id_categoria"], row["id_genero"]),
+                row["id_talla"]
+            )
+
+        self.productos = {}
+        self._cargar_productos(
+            """
+            SELECT id_producto, nombre, id_categoria, id_genero, id_marca, id_estilo, id_estado
+            FROM productos
+            ORDER BY id_producto
+            """,
+            []
+        )
+
+    def _cargar_productos(self, sql, params):
+        self.cursor.execute(sql, params)
+        for row in self.cursor.fetchall():
+            llave = (
+                clave_nombre(row["nombre"]),
+                row["id_categoria"],
+                row["id_genero"],
+                row["id_marca"],
+                row["id_estilo"]
+            )
+            self.productos.setdefault(llave, [row["id_producto"], row["id_estado"]])
+
+    def registrar_error(self, numero, mensaje):
+        self.total_errores += 1
+        if len(self.errores) < IMPORT_MAX_ERRORES:
+            self.errores.append({"fila": numero, "error": mensaje})
+
+    def _resolver_id(self, datos, campo_id, campo_nombre, mapa, requerido):
+        valor_id = clean_report_param(datos.get(campo_id))
+        if valor_id is not None:
+            # El id debe ser de un registro activo, igual que al buscar por nombre
+            try:
+                id_registro = int(valor_id)
+            except (TypeError, ValueError, OverflowError):
+                id_registro = None
+            if id_registro is None or id_registro not in mapa.values():
+                raise ValueError(f"Valor inválido para {campo_id}: {valor_id}")
+            return id_registro
+
+        nombre = clean_report_param(datos.get(campo_nombre))
+        if nombre is None:
+            raise ValueError(requerido)
+
+        if clave_nombre(nombre) not in mapa:
+            raise ValueError(f"Valor inválido para {campo_nombre}: {nombre}")
+        return mapa[clave_nombre(nombre)]
+
+    def validar(self, datos):
+        nombre = str(datos.get("nombre") or "").strip()
+        if not nombre:
+            raise ValueError("Nombre requerido")
+
+        talla = str(datos.get("talla") or "").strip()
+        if not talla:
+            raise ValueError("Talla requerida")
+
+        # int(float("inf")) lanza OverflowError y "nan" no es menor que 0
+        try:
+            precio = numero_finito(datos.get("precio"))
+            stock = int(numero_finito(datos.get("stock")))
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError("Precio o stock inválido")
+
+        if precio < 0 or stock < 0:
+            raise ValueError("Precio o stock inválido")
+
+        id_color = 0
+        if clean_report_param(datos.get("id_color")) is not None:
+            try:
+                id_color = int(datos.get("id_color"))
+            except (TypeError, ValueError, OverflowError):
+                raise ValueError("Color inválido")
+
+        return {
+            "nombre": nombre,
+            "id_categoria": self._resolver_id(datos, "id_categoria", "categoria", self.categorias, "Categoría requerida"),
+            "id_genero": self._resolver_id(datos, "id_genero", "genero", self.generos, "Género requerido"),
+            "marca": str(datos.get("marca") or "").strip() or None,
+            "estilo": str(datos.get("estilo") or "").strip() or None,
+            "color": str(datos.get("color") or "").strip() or None,
+            "id_color": id_color,
+            "talla": talla,
+            "precio": precio,
+            "stock": stock
+        }
+
+    def _crear_faltantes(self, mapa, tabla, columna_id, nuevos):
+        # nuevos: {clave: fila a insertar}; se insertan en un solo INSERT
+        # y se releen para conocer los ids asignados (solo activos, como en
+        # _cargar_mapas: un inactivo con el mismo nombre no debe quedar mapeado).
+        if not nuevos:
+            return
+
+        columnas = list(next(iter(nuevos.values())))
+        self.cursor.executemany(
+            f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join(['%s'] * len(columnas))})",
+            [tuple(fila[c] for c in columnas) for fila in nuevos.values()]
+        )
+
+        nombres = [fila["nombre"] for fila in nuevos.values()]
+        self.cursor.execute(
+            f"""
+            SELECT {columna_id} AS id, nombre
+            FROM {tabla}
+            WHERE nombre IN ({','.join(['%s'] * len(nombres))})
+              AND id_estado = 1
+            ORDER BY {columna_id}
+            """,
+            nombres
+        )
+        for row in self.cursor.fetchall():
+            mapa.setdefault(clave_nombre(row["nombre"]), row["id"])
+
+    def procesar_lote(self, lote):
+        filas = []
+        for numero, datos in lote:
+            try:
+                filas.append((numero, self.validar(datos)))
+            except ValueError as e:
+                self.registrar_error(numero, str(e))
+
+        if not filas:
+            return
+
+        try:
+            self._escribir_lote(filas)
+            self.conn.commit()
+            self.importadas += len(filas)
+        except Exception as e:
+            self.conn.rollback()
+            # Los ids creados en el lote fallido ya no existen
+            self._cargar_mapas()
+            for numero, _ in filas:
+                self.registrar_error(numero, f"Error guardando lote: {e}")
+
+    def _escribir_lote(self, filas):
+        # COLORES y MARCAS
+        self._crear_faltantes(self.colores, "colores", "id_color", {
+            clave_nombre(f["color"]): {"nombre": f["color"], "id_estado": 1}
+            for _, f in filas
+            if f["color"] and clave_nombre(f["color"]) not in self.colores
+        })
+        self._crear_faltantes(self.marcas, "marcas", "id_marca", {
+            clave_nombre(f["marca"]): {"nombre": f["marca"], "id_categoria": f["id_categoria"], "id_estado": 1}
+            for _, f in filas
+            if f["marca"] and clave_nombre(f["marca"]) not in self.marcas
+        })
+
+        for _, f in filas:
+            if f["color"]:
+                f["id_color"] = self.colores[clave_nombre(f["color"])]
+            f["id_marca"] = self.marcas[clave_nombre(f["marca"])] if f["marca"] else None
+
+        # ESTILOS
+        self._crear_faltantes(self.estilos, "estilos", "id_estilo", {
+            clave_nombre(f["estilo"]): {"nombre": f["estilo"], "id_marca": f["id_marca"], "id_estado": 1}
+            for _, f in filas
+            if f["estilo"] and clave_nombre(f["estilo"]) not in self.estilos
+        })
+
+        for _, f in filas:
+            f["id_estilo"] = self.estilos[clave_nombre(f["estilo"])] if f["estilo"] else None
+            f["producto"] = (
+                clave_nombre(f["nombre"]),
+                f["id_categoria"],
+                f["id_genero"],
+                f["id_marca"],
+                f["id_estilo"]
+            )
+
+        # TALLAS (una consulta por combinación categoría/género nueva)
+        faltantes = defaultdict(list)
+        for _, f in filas:
+            llave = (clave_talla(f["talla"]), f["id_categoria"], f["id_genero"])
+            if llave not in self.tallas:
+                faltantes[(f["id_categoria"], f["id_genero"])].append(f["talla"])
+
+        for (id_categoria, id_genero), valores in faltantes.items():
+            for clave, id_talla in resolver_tallas(self.cursor, id_categoria, id_genero, valores).items():
+                self.tallas[(clave, id_categoria, id_genero)] = id_talla
+
+        # PRODUCTOS
+        nuevos = {}
+        for _, f in filas:
+            if f["producto"] not in self.productos:
+                nuevos.setdefault(f["producto"], f)
+
+        if nuevos:
+            self.cursor.executemany(
+                """
+                INSERT INTO productos
+                (nombre, id_marca, id_estilo, id_categoria, id_genero, id_estado)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                """,
+                [
+                    (f["nombre"], f["id_marca"], f["id_estilo"], f["id_categoria"], f["id_genero"], 1)
+                    for f in nuevos.values()
+                ]
+            )
+            nombres = list({f["nombre"] for f in nuevos.values()})
+            self._cargar_productos(
+                f"""
+                SELECT id_producto, nombre, id_categoria, id_genero, id_marca, id_estilo, id_estado
+                FROM productos
+                WHERE nombre IN ({','.join(['%s'] * len(nombres))})
+                ORDER BY id_producto
+                """,
+                nombres
+            )
+
+        inactivos = {
+            self.productos[f["producto"]][0]
+            for _, f in filas
+            if self.productos[f["producto"]][1] != 1
+        }
+        if inactivos:
+            self.cursor.execute(
+                f"UPDATE productos SET id_estado = 1 WHERE id_producto IN ({','.join(['%s'] * len(inactivos))})",
+                list(inactivos)
+            )
+            for producto in self.productos.values():
+                if producto[0] in inactivos:
+                    producto[1] = 1
+
+        # VARIANTES (la última fila repetida del lote es la que queda)
+        variantes = {}
+        for _, f in filas:
+            id_producto = self.productos[f["producto"]][0]
+            id_talla = self.tallas[(clave_talla(f["talla"]), f["id_categoria"], f["id_genero"])]
+            variantes[(id_producto, f["id_color"], id_talla)] = (f["precio"], f["stock"])
+
+        upsert_variantes(self.cursor, [
+            (id_producto, id_color, id_talla, precio, stock)
+            for (id_producto, id_color, id_talla), (precio, stock) in variantes.items()
+        ])
+
+
+@app.route("/ImportarProductos", methods=["POST"])
+def importar_productos():
+
+    # request.files solo con multipart: en otro caso leerlo consume
+    # request.stream y el cuerpo llegaría vacío
+    archivo = None
+    if request.mimetype == "multipart/form-data":
+        archivo = request.files.get("archivo") or next(iter(request.files.values()), None)
+        if archivo is None:
+            return jsonify({"ok": False, "error": "Archivo requerido"}), 400
+
+    formato = (request.args.get("format") or "").strip().lower()
+    if not formato:
+        if archivo is not None:
+            formato = formato_importacion(archivo.filename, archivo.mimetype)
+        else:
+            formato = formato_importacion(None, request.mimetype)
+
+    if formato not in ("csv", "ndjson"):
+        return jsonify({"ok": False, "error": "Formato no soportado. Usa csv o ndjson"}), 400
+
+    if archivo is not None:
+        stream = archivo.stream
+    else:
+        stream = io.BufferedReader(request.stream)
+
+    try:
+        with cursor_db(dictionary=True) as (conn, cursor):
+            importador = ImportadorProductos(conn, cursor)
+            lote = []
+
+            for numero, datos, error in leer_filas_importacion(stream, formato):
+                if error:
+                    importador.registrar_error(numero, error)
+                    continue
+
+                lote.append((numero, datos))
+                if len(lote) >= IMPORT_LOTE:
+                    importador.procesar_lote(lote)
+                    lote = []
+
+            importador.procesar_lote(lote)
+
+        if importador.importadas:
+            invalidar_catalogo()
+            invalidar_referencias()
+            invalidar_busqueda()
+
+        return jsonify({
+            "ok": importador.total_errores == 0,
+            "importadas": importador.importadas,
+            "total_errores": importador.total_errores,
+            "errores": importador.errores
+        })
+
+    except Exception as e:
+        print("ERROR IMPORTANDO PRODUCTOS:", e)
+        return jsonify({"ok": False, "error": str(e)}), 500
+
+
+
+
+# ============================================
+# RUTAS - CATÁLOGOS
+# ============================================
+
+@app.route("/GetCategorias", methods=["GET"])
+@cache_referencia(VERSION_REFERENCIAS)
+def get_categorias():
+        
+    with cursor_db(dictionary=True) as (conn, cursor):
+        cursor.execute("""
+            SELECT id_categoria, nombre
+            FROM categorias
+            WHERE id_estado = 1
+            ORDER BY nombre
+        """)
+
+        data = cursor.fetchall()
+
+    return jsonify(data)
+
+
+@app.route("/AddCategoria", methods=["POST"])
+def add_categoria():
+        
+    data = request.get_json()
+    nombre = data.get("nombre", "").strip()
+
+    if not nombre:
+        return jsonify({"ok": False, "error": "Nombre requerido"}), 400
+
+    with cursor_db() as (conn, cursor):
+        try:
+            cursor.execute(
+                "INSERT INTO categorias (nombre, id_estado) VALUES (%s, %s)",
+                (nombre, 1)
+            )
+            conn.commit()
+            invalidar_referencias()
+            return jsonify({"ok": True})
+        except Exception as e:
+            conn.rollback()
+            return jsonify({"ok": False, "error": str(e)}), 500
+
+
+@app.route("/GetGeneros", methods=["GET"])
+@cache_referencia(VERSION_REFERENCIAS)
+def get_generos():
+        
+    with cursor_db(dictionary=True) as (conn, cursor):
+        cursor.execute("""
+            SELECT id_genero, nombre
+            FROM generos
+            WHERE id_estado = 1
+        """)
+
+        data = cursor.fetchall()
+
+    return jsonify(data)
+
+
+@app.route("/GetColores", methods=["GET"])
+@cache_referencia(VERSION_REFERENCIAS)
+def get_colores():
+        
+    with cursor_db(dictionary=True) as (conn, cursor):
+        cursor.execute("SELECT id_color, nombre FROM colores WHERE id_estado = 1 ORDER BY nombre")
+        data = cursor.fetchall()
+
+    return jsonify(data)
+
+
+@app.route("/AddColor", methods=["POST",])
+def add_color():
+
+    data = request.get_json()
+    nombre = data.get("nombre", "").strip()
+
+    if not nombre:
+        return jsonify({"ok": False, "error": "Nombre requerido"}), 400
+
+    with cursor_db() as (conn, cursor):
+        try:
+            cursor.execute(
+                "INSERT INTO colores (nombre, id_estado) VALUES (%s, %s)",
+                (nombre, 1)
+            )
+            conn.commit()
+            invalidar_referencias()
+
+            return jsonify({
+                "ok": True,
+                "id_color": cursor.lastrowid
+            })
+        except Exception as e:
+            conn.rollback()
+            return jsonify({"ok": False, "error": str(e)}), 500
+
+
+@app.route("/GetTallas", methods=["GET"])
+@cache_referencia(VERSION_REFERENCIAS)
+def get_tallas():
+        
+    with cursor_db(dictionary=True) as (conn, cursor):
+        cursor.execute("SELECT id_talla, valor, id_genero FROM tallas ORDER BY valor")
+        data = cursor.fetchall()
+
+    return jsonify(data)
+
+
+@app.route("/GetTallasPorCategoriaGenero", methods=["GET"])
+@cache_referencia(VERSION_REFERENCIAS)
+def get_tallas_por_categoria_genero():
+        
     id_categoria = request.args.get("id_categoria")
     id_genero = request.args.get("id_genero")
 
     if not id_categoria or not id_genero:
         return jsonify([])
 
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+    with cursor_db(dictionary=True) as (conn, cursor):
+        cursor.execute("""
+            SELECT DISTINCT valor, id_talla 
+            FROM tallas
+            WHERE id_categoria = %s
+              AND id_genero = %s
+              AND id_estado = 1
+            ORDER BY id_talla
+        """, (id_categoria, id_genero))
 
-    cursor.execute("""
-        SELECT DISTINCT valor, id_talla 
-        FROM tallas
-        WHERE id_categoria = %s
-          AND id_genero = %s
-          AND id_estado = 1
-        ORDER BY id_talla
-    """, (id_categoria, id_genero))
-
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
+        data = cursor.fetchall()
 
     return jsonify(data)
 
 
 @app.route("/GetTallasPorCategoria", methods=["GET"])
+@cache_referencia(VERSION_REFERENCIAS)
 def get_tallas_por_categoria():
         
     id_categoria = request.args.get("id_categoria")
@@ -924,51 +3697,47 @@ def get_tallas_por_categoria():
     if not id_categoria:
         return jsonify([])
 
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    cursor.execute("""
-        SELECT DISTINCT valor AS talla
-        FROM tallas
-        WHERE id_categoria = %s
-          AND id_estado = 1
-        ORDER BY valor
-    """, (id_categoria,))
+    with cursor_db(dictionary=True) as (conn, cursor):
+        cursor.execute("""
+            SELECT DISTINCT valor AS talla
+            FROM tallas
+            WHERE id_categoria = %s
+              AND id_estado = 1
+            ORDER BY valor
+        """, (id_categoria,))
 
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
+        data = cursor.fetchall()
 
     return jsonify(data)
 
 
 @app.route("/GetEstilosUnicos", methods=["GET"])
+@cache_referencia(VERSION_REFERENCIAS)
 def get_estilos_unicos():
         
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+    try:
+        columnar = pide_columnar(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
 
-    cursor.execute("""
-        SELECT DISTINCT
-            TRIM(LOWER(nombre)) AS nombre
-        FROM estilos
-        WHERE id_estado = 1
-        ORDER BY nombre
-    """)
+    with cursor_db(dictionary=not columnar) as (conn, cursor):
+        cursor.execute("""
+            SELECT DISTINCT
+                TRIM(LOWER(nombre)) AS nombre
+            FROM estilos
+            WHERE id_estado = 1
+            ORDER BY nombre
+        """)
 
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
+        data = leer_columnar(cursor) if columnar else cursor.fetchall()
 
     return jsonify(data)
 
 
 @app.route("/GetTallasValidas", methods=["GET"])
+@cache_referencia(VERSION_CATALOGO)
 def get_tallas_validas():
         
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-
     id_categoria = request.args.get("id_categoria", type=int)
 
     query = """
@@ -985,33 +3754,34 @@ def get_tallas_validas():
 
     query += " ORDER BY t.valor"
 
-    cursor.execute(query, params)
+    with cursor_db(dictionary=True) as (conn, cursor):
+        cursor.execute(query, params)
 
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
+        data = cursor.fetchall()
 
     return jsonify(data)
 
 
 @app.route("/GetNombresProductos", methods=["GET"])
+@cache_referencia(VERSION_CATALOGO)
 def get_nombres_productos():
         
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+    try:
+        columnar = pide_columnar(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
 
-    cursor.execute("""
-        SELECT
-            TRIM(LOWER(nombre)) AS nombre
-        FROM productos
-        WHERE id_estado = 1
-        GROUP BY TRIM(LOWER(nombre))
-        ORDER BY nombre
-    """)
+    with cursor_db(dictionary=not columnar) as (conn, cursor):
+        cursor.execute("""
+            SELECT
+                TRIM(LOWER(nombre)) AS nombre
+            FROM productos
+            WHERE id_estado = 1
+            GROUP BY TRIM(LOWER(nombre))
+            ORDER BY nombre
+        """)
 
-    data = cursor.fetchall()
-    cursor.close()
-    conn.close()
+        data = leer_columnar(cursor) if columnar else cursor.fetchall()
 
     return jsonify(data)
 
@@ -1019,56 +3789,151 @@ def get_nombres_productos():
 @app.route("/InformationGeneral", methods=["GET"])
 def reporte_general():
     try:        
-        data = obtener_reporte_general_data()
+        filtros = obtener_filtros_reporte(request.args)
+        fuente = obtener_fuente_reporte(request.args)
+        columnar = pide_columnar(request.args)
+
+        # Si el resultado ya está en caché no hace falta leerlo por partes;
+        # el resumen ya viene agregado y nunca se lee por partes
+        if (
+            parametro_activo(request.args.get("stream", ""))
+            and fuente == FUENTE_PROCEDIMIENTO
+            and leer_cache_reporte(filtros, columnar=columnar) is None
+        ):
+            return respuesta_streaming(stream_reporte_general(filtros, columnar))
+
+        data = obtener_reporte_general_data(filtros, fuente, columnar)
         return jsonify(data)
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"DEBUG ERROR: {str(e)}") 
         return jsonify({"error": str(e)}), 500
 
-def clean_report_param(val):
-    return None if val in [None, "", "null", "undefined"] else val
+FUENTE_PROCEDIMIENTO = "procedimiento"
+FUENTE_RESUMEN = "resumen"
 
 
-def obtener_reporte_general_data():
-    conn = get_connection()
-    if conn is None:
-        raise RuntimeError("No se pudo conectar a la base de datos")
+def obtener_fuente_reporte(args):
+    fuente = args.get("fuente", FUENTE_PROCEDIMIENTO).strip().lower()
 
-    cursor = conn.cursor(dictionary=True)
+    if fuente not in (FUENTE_PROCEDIMIENTO, FUENTE_RESUMEN):
+        raise ValueError("Fuente no soportada. Usa procedimiento o resumen")
 
-    try:
-        args = (
-            clean_report_param(request.args.get('categoria')),
-            clean_report_param(request.args.get('genero')),
-            clean_report_param(request.args.get('producto')),
-            clean_report_param(request.args.get('talla')),
-            clean_report_param(request.args.get('estilo'))
-        )
+    if fuente == FUENTE_RESUMEN and not RESUMEN_INVENTARIO:
+        raise ValueError("El resumen de inventario no está activo")
 
-        cursor.callproc("InformationGeneral", args)
+    return fuente
 
+
+def clean_report_param(val):
+    return None if val in [None, "", "null", "undefined"] else val
+
+
+def obtener_filtros_reporte(args):
+    return (
+        clean_report_param(args.get('categoria')),
+        clean_report_param(args.get('genero')),
+        clean_report_param(args.get('producto')),
+        clean_report_param(args.get('talla')),
+        clean_report_param(args.get('estilo'))
+    )
+
+
+def iterar_reporte_general(cursor, filtros):
+    # A diferencia de callproc (que guarda cada resultado completo en un
+    # cursor con buffer), CALL con multi=True deja leer las filas por lote.
+    # Se usa el primer conjunto con filas; el resto solo se consume.
+    entregado = False
+    for resultado in cursor.execute(
+        "CALL InformationGeneral(%s, %s, %s, %s, %s)",
+        filtros,
+        multi=True
+    ):
+        if not resultado.with_rows:
+            continue
+
+        if entregado:
+            for _ in leer_lotes(resultado):
+                pass
+            continue
+
+        entregado = True
+        yield list(resultado.column_names), leer_lotes(resultado)
+
+    if not entregado:
+        yield [], iter(())
+
+
+def stream_reporte_general(filtros, columnar=False):
+    with cursor_db(dictionary=not columnar) as (conn, cursor):
+        for columns, lotes in iterar_reporte_general(cursor, filtros):
+            yield from generar_json_columnar(columns, lotes)
+
+
+# Resultado de InformationGeneral por filtros (la tupla normalizada de
+# obtener_filtros_reporte), compartido por las rutas JSON y PDF. Cualquier
+# movimiento de stock o cambio de productos sube la versión del catálogo y
+# deja sin efecto lo guardado. Los resultados muy grandes no se guardan.
+CACHE_REPORTE_TTL = float(os.environ.get("CACHE_REPORTE_TTL", 600))
+CACHE_REPORTE_MAX = int(os.environ.get("CACHE_REPORTE_MAX", 32))
+CACHE_REPORTE_MAX_FILAS = int(os.environ.get("CACHE_REPORTE_MAX_FILAS", 20000))
+
+cache_reporte_datos = CacheReferencias(CACHE_REPORTE_TTL, CACHE_REPORTE_MAX)
+
+
+def leer_cache_reporte(filtros, fuente=FUENTE_PROCEDIMIENTO, columnar=False):
+    return cache_reporte_datos.obtener(
+        (fuente, filtros, columnar),
+        versiones_datos.actual(VERSION_CATALOGO)
+    )
+
+
+def obtener_reporte_general_data(filtros=None, fuente=FUENTE_PROCEDIMIENTO, columnar=False):
+    # columnar: filas como tuplas (cursor sin dict), guardadas aparte en la
+    # caché; el PDF y las exportaciones usan siempre las filas como dict
+    if filtros is None:
+        filtros = obtener_filtros_reporte(request.args)
+
+    # La versión se lee antes de consultar: si hay una escritura mientras
+    # corre el procedimiento, lo guardado ya nace vencido
+    version = versiones_datos.actual(VERSION_CATALOGO)
+    data = cache_reporte_datos.obtener((fuente, filtros, columnar), version)
+    if data is not None:
+        marcar_respuesta_cacheable()
+        return data
+
+    with cursor_db(dictionary=not columnar) as (conn, cursor):
         rows = []
         columns = []
 
-        for result in cursor.stored_results():
-            columns = list(result.column_names)
-            rows = result.fetchall()
+        if fuente == FUENTE_RESUMEN:
+            columns, rows = consultar_resumen_inventario(cursor, filtros)
+        else:
+            cursor.callproc("InformationGeneral", filtros)
 
-        return {
-            "columns": columns,
-            "rows": rows
-        }
-    finally:
-        cursor.close()
-        conn.close()
+            for result in cursor.stored_results():
+                columns = list(result.column_names)
+                rows = result.fetchall()
+
+    data = {
+        "columns": columns,
+        "rows": rows
+    }
+
+    if len(rows) <= CACHE_REPORTE_MAX_FILAS:
+        cache_reporte_datos.guardar((fuente, filtros, columnar), version, data)
+        marcar_respuesta_cacheable()
+
+    return data
 
 
 def parse_report_number(value):
     if value is None:
         return 0
 
-    if isinstance(value, (int, float)):
+    if isinstance(value, (int, float, Decimal)):
         return float(value)
 
     text = str(value).strip()
@@ -1087,14 +3952,19 @@ def format_currency_es(value):
     return f"$ {format_number_es(value)}"
 
 
-def calcular_totales_reporte(rows):
-    cantidad_total = 0
-    valor_total = 0
-
+def sumar_totales_reporte(rows, cantidad_total=0, valor_total=0):
     for row in rows:
         cantidad_total += parse_report_number(row.get("Cantidad"))
         valor_total += parse_report_number(row.get("Total"))
 
+    return cantidad_total, valor_total
+
+
+def calcular_totales_reporte(rows):
+    return formatear_totales_reporte(*sumar_totales_reporte(rows))
+
+
+def formatear_totales_reporte(cantidad_total, valor_total):
     return {
         "cantidad_total_num": int(cantidad_total),
         "cantidad_total": format_number_es(cantidad_total),
@@ -1103,17 +3973,8 @@ def calcular_totales_reporte(rows):
     }
 
 
-def build_reporte_pdf_context():
-    data = obtener_reporte_general_data()
-    totals = calcular_totales_reporte(data["rows"])
-
-    filtros = {
-        "Categoria": clean_report_param(request.args.get("categoria")) or "Todos",
-        "Genero": clean_report_param(request.args.get("genero")) or "Todos",
-        "Producto": clean_report_param(request.args.get("producto")) or "Todos",
-        "Talla": clean_report_param(request.args.get("talla")) or "Todos",
-        "Estilo": clean_report_param(request.args.get("estilo")) or "Todos"
-    }
+def build_reporte_encabezado(filtros):
+    categoria, genero, producto, talla, estilo = filtros
 
     return {
         "empresa_nombre": os.environ.get("REPORT_COMPANY_NAME", "Nombre de la empresa"),
@@ -1121,60 +3982,1195 @@ def build_reporte_pdf_context():
         "empresa_direccion": os.environ.get("REPORT_COMPANY_ADDRESS", "Direccion de la empresa"),
         "empresa_celular": os.environ.get("REPORT_COMPANY_PHONE", "Numero de celular"),
         "fecha_generacion": datetime.now().strftime("%d/%m/%Y %H:%M"),
-        "filtros": filtros,
+        "filtros": {
+            "Categoria": categoria or "Todos",
+            "Genero": genero or "Todos",
+            "Producto": producto or "Todos",
+            "Talla": talla or "Todos",
+            "Estilo": estilo or "Todos"
+        }
+    }
+
+
+def build_reporte_pdf_context(filtros=None, fuente=FUENTE_PROCEDIMIENTO):
+    if filtros is None:
+        filtros = obtener_filtros_reporte(request.args)
+
+    data = obtener_reporte_general_data(filtros, fuente)
+    totals = calcular_totales_reporte(data["rows"])
+
+    context = build_reporte_encabezado(filtros)
+    context.update({
         "columnas": data["columns"],
         "filas": data["rows"],
         "cantidad_total": totals["cantidad_total"],
         "valor_total": totals["valor_total"]
-    }
+    })
+    return context
 
 
-def load_report_template():
-    template_path = os.path.join(
-        os.path.dirname(__file__),
-        "information_general_pdf.html"
-    )
+REPORT_TEMPLATE_PATH = os.path.join(
+    os.path.dirname(__file__),
+    "information_general_pdf.html"
+)
 
-    with open(template_path, "r", encoding="utf-8") as template_file:
+
+def load_report_template():
+    with open(REPORT_TEMPLATE_PATH, "r", encoding="utf-8") as template_file:
         return template_file.read()
 
 
+class PlantillaReporte:
+    # Compila la plantilla una sola vez y solo la recarga si el archivo
+    # cambia en disco (se compara la fecha de modificación).
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._plantilla = None
+
+    def obtener(self):
+        mtime = os.stat(self.ruta).st_mtime_ns
+
+        with self._lock:
+            if self._plantilla is None or mtime != self._mtime:
+                self._plantilla = app.jinja_env.from_string(load_report_template())
+                self._mtime = mtime
+            return self._plantilla
+
+
+plantilla_reporte = PlantillaReporte(REPORT_TEMPLATE_PATH)
+
+
+class CacheBytes:
+    # LRU acotado por el tamaño total de los valores (bytes) guardados
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._datos = OrderedDict()
+        self._total = 0
+
+    def obtener(self, clave):
+        with self._lock:
+            valor = self._datos.get(clave)
+            if valor is not None:
+                self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor):
+        if len(valor) > self.max_bytes:
+            return
+
+        with self._lock:
+            anterior = self._datos.pop(clave, None)
+            if anterior is not None:
+                self._total -= len(anterior)
+
+            self._datos[clave] = valor
+            self._total += len(valor)
+
+            while self._total > self.max_bytes:
+                _, descartado = self._datos.popitem(last=False)
+                self._total -= len(descartado)
+
+
+# PDFs/HTML ya generados por (formato, filtros, versión del catálogo): una
+# venta o entrada de stock cambia la versión y deja de usarse lo anterior.
+REPORTE_CACHE_MB = float(os.environ.get("REPORTE_CACHE_MB", 32))
+cache_reportes = CacheBytes(int(REPORTE_CACHE_MB * 1024 * 1024))
+
+
+class ErrorGenerandoReporte(RuntimeError):
+    pass
+
+
+def render_reporte_html(context):
+    return plantilla_reporte.obtener().render(**context)
+
+
+def convertir_html_a_pdf(html):
+    pdf_buffer = BytesIO()
+    pdf = pisa.CreatePDF(html, dest=pdf_buffer, encoding="utf-8")
+
+    if pdf.err:
+        raise ErrorGenerandoReporte("No se pudo generar el PDF")
+
+    return pdf_buffer.getvalue()
+
+
+# Motor "directo": el reporte es solo encabezado, filtros, totales y una
+# tabla, así que se escribe el PDF a mano (Helvetica estándar, sin fuentes
+# incrustadas) en lugar de generar HTML y que xhtml2pdf lo interprete.
+# Cada página se entrega como bytes apenas se completa.
+MOTORES_REPORTE_PDF = ("html", "directo")
+
+PDF_ANCHO = 595.28
+PDF_ALTO = 841.89
+PDF_MARGEN_X = 34
+PDF_MARGEN_Y = 45
+PDF_TAMANO_TABLA = 7.5
+PDF_ALTO_FILA = 15
+PDF_RELLENO_CELDA = 4
+PDF_MUESTRA_ANCHOS = 200
+
+PDF_COLOR_TEXTO = (0.086, 0.125, 0.2)
+PDF_COLOR_SUAVE = (0.365, 0.424, 0.502)
+PDF_COLOR_ETIQUETA = (0.482, 0.541, 0.616)
+PDF_COLOR_ACENTO = (0.059, 0.608, 0.843)
+PDF_COLOR_BORDE = (0.859, 0.894, 0.933)
+PDF_COLOR_CABECERA = (0.929, 0.957, 0.98)
+PDF_COLOR_CAJA = (0.973, 0.98, 0.988)
+
+# Anchos (por 1000 unidades) de los caracteres 32-126 de Helvetica y
+# Helvetica-Bold; las letras con tilde usan el ancho de la letra base.
+ANCHOS_HELVETICA = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584
+)
+ANCHOS_HELVETICA_BOLD = (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584
+)
+
+
+def tabla_anchos_pdf(anchos):
+    tabla = {}
+    for codigo in range(32, 256):
+        caracter = chr(codigo)
+        base = ord(unicodedata.normalize("NFD", caracter)[0]) - 32
+        tabla[caracter] = anchos[base] if 0 <= base < len(anchos) else 556
+    return tabla
+
+
+TABLA_ANCHOS_PDF = {
+    False: tabla_anchos_pdf(ANCHOS_HELVETICA),
+    True: tabla_anchos_pdf(ANCHOS_HELVETICA_BOLD)
+}
+
+
+@lru_cache(maxsize=4096)
+def ancho_texto_pdf(texto, tamano, negrita=False):
+    tabla = TABLA_ANCHOS_PDF[negrita]
+    return sum(tabla.get(caracter, 556) for caracter in texto) * tamano / 1000
+
+
+def recortar_texto_pdf(texto, ancho, tamano, negrita=False):
+    # Si ni con el carácter más ancho (1015) se pasa, no hace falta medirlo
+    if len(texto) * tamano * 1.015 <= ancho or ancho_texto_pdf(texto, tamano, negrita) <= ancho:
+        return texto
+
+    while texto and ancho_texto_pdf(texto + "...", tamano, negrita) > ancho:
+        texto = texto[:-1]
+    return texto + "..."
+
+
+def escapar_texto_pdf(texto):
+    # WinAnsi (cp1252) cubre tildes y eñes; lo demás se reemplaza por "?"
+    texto = texto.encode("cp1252", "replace").decode("latin-1")
+    return texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def valor_celda_pdf(valor):
+    return "N/A" if valor is None else str(valor)
+
+
+class LienzoPdf:
+    # Acumula los operadores de dibujo de una página
+
+    def __init__(self):
+        self.operaciones = []
+
+    def texto(self, x, y, texto, tamano, negrita=False, color=PDF_COLOR_TEXTO):
+        self.operaciones.append(
+            "BT /F%d %.2f Tf %.3f %.3f %.3f rg %.2f %.2f Td (%s) Tj ET" % (
+                2 if negrita else 1, tamano, *color, x, y, escapar_texto_pdf(texto)
+            )
+        )
+
+    def texto_derecha(self, x, y, texto, tamano, negrita=False, color=PDF_COLOR_TEXTO):
+        self.texto(x - ancho_texto_pdf(texto, tamano, negrita), y, texto, tamano, negrita, color)
+
+    def rectangulo(self, x, y, ancho, alto, relleno=None, borde=None):
+        if relleno:
+            self.operaciones.append("%.3f %.3f %.3f rg" % relleno)
+        if borde:
+            self.operaciones.append("%.3f %.3f %.3f RG 0.6 w" % borde)
+
+        operador = "B" if relleno and borde else ("f" if relleno else "S")
+        self.operaciones.append("%.2f %.2f %.2f %.2f re %s" % (x, y, ancho, alto, operador))
+
+    def linea(self, x1, y1, x2, y2, color=PDF_COLOR_BORDE):
+        self.operaciones.append(
+            "%.3f %.3f %.3f RG 0.6 w %.2f %.2f m %.2f %.2f l S" % (*color, x1, y1, x2, y2)
+        )
+
+    def vaciar(self):
+        contenido = "\n".join(self.operaciones)
+        self.operaciones = []
+        return contenido
+
+
+class EscritorPdf:
+    # Escribe el archivo objeto por objeto y devuelve los bytes de cada
+    # parte; de lo ya enviado solo recuerda los offsets para la tabla xref.
+    # Objetos fijos: 1 catálogo, 2 árbol de páginas, 3-4 fuentes.
+
+    def __init__(self):
+        self._posicion = 0
+        self._offsets = {}
+        self._paginas = []
+        self._siguiente = 5
+
+    def _objeto(self, numero, cuerpo):
+        self._offsets[numero] = self._posicion
+        datos = b"%d 0 obj\n" % numero + cuerpo + b"\nendobj\n"
+        self._posicion += len(datos)
+        return datos
+
+    def inicio(self):
+        cabecera = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self._posicion = len(cabecera)
+
+        return b"".join([
+            cabecera,
+            self._objeto(1, b"<< /Type /Catalog /Pages 2 0 R >>"),
+            self._objeto(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"),
+            self._objeto(4, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+        ])
+
+    def pagina(self, operaciones):
+        flujo = zlib.compress(operaciones.encode("latin-1"))
+        contenido, pagina = self._siguiente, self._siguiente + 1
+        self._siguiente += 2
+        self._paginas.append(pagina)
+
+        return self._objeto(
+            contenido,
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(flujo) + flujo + b"\nendstream"
+        ) + self._objeto(
+            pagina,
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] "
+            b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>" % (
+                PDF_ANCHO, PDF_ALTO, contenido
+            )
+        )
+
+    def fin(self):
+        hijos = " ".join(f"{numero} 0 R" for numero in self._paginas)
+        paginas = self._objeto(
+            2,
+            f"<< /Type /Pages /Kids [{hijos}] /Count {len(self._paginas)} >>".encode("ascii")
+        )
+
+        inicio_xref = self._posicion
+        lineas = [b"xref\n0 %d\n" % self._siguiente, b"0000000000 65535 f \n"]
+        lineas.extend(
+            b"%010d 00000 n \n" % self._offsets[numero]
+            for numero in range(1, self._siguiente)
+        )
+        lineas.append(
+            b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+                self._siguiente, inicio_xref
+            )
+        )
+        return paginas + b"".join(lineas)
+
+
+def calcular_anchos_columnas(columnas, muestra, ancho_total):
+    # Ancho según el texto más largo de cada columna en la muestra. Si no
+    # alcanza el espacio se recortan primero las columnas más anchas, nunca
+    # por debajo del ancho de su título.
+    minimos = []
+    deseados = []
+    for columna in columnas:
+        minimo = ancho_texto_pdf(columna, PDF_TAMANO_TABLA, True) + 2 * PDF_RELLENO_CELDA
+        deseado = max(
+            [ancho_texto_pdf(valor_celda_pdf(fila.get(columna)), PDF_TAMANO_TABLA) for fila in muestra],
+            default=0
+        ) + 2 * PDF_RELLENO_CELDA
+        minimos.append(minimo)
+        deseados.append(max(minimo, deseado))
+
+    if sum(deseados) > ancho_total:
+        bajo, alto = 0, max(deseados)
+        for _ in range(30):
+            tope = (bajo + alto) / 2
+            if sum(max(m, min(d, tope)) for m, d in zip(minimos, deseados)) > ancho_total:
+                alto = tope
+            else:
+                bajo = tope
+        deseados = [max(m, min(d, bajo)) for m, d in zip(minimos, deseados)]
+
+    escala = ancho_total / (sum(deseados) or 1)
+    return [deseado * escala for deseado in deseados]
+
+
+class PaginadorReporte:
+    # Reparte el encabezado y las filas en páginas A4 y devuelve cada página
+    # terminada como bytes del PDF
+
+    def __init__(self, escritor, context):
+        self.escritor = escritor
+        self.context = context
+        self.lienzo = LienzoPdf()
+        self.numero_pagina = 1
+        self.x = PDF_MARGEN_X
+        self.ancho = PDF_ANCHO - 2 * PDF_MARGEN_X
+        self.y = PDF_ALTO - PDF_MARGEN_Y
+        self.columnas = []
+        self.anchos = []
+        self.inicio_tabla = self.y
+
+    def cerrar_pagina(self):
+        self.lienzo.texto_derecha(
+            self.x + self.ancho, PDF_MARGEN_Y / 2, f"Página {self.numero_pagina}", 7,
+            color=PDF_COLOR_ETIQUETA
+        )
+        datos = self.escritor.pagina(self.lienzo.vaciar())
+        self.numero_pagina += 1
+        self.y = PDF_ALTO - PDF_MARGEN_Y
+        return datos
+
+    def espacio(self, alto):
+        # Bytes de la página cerrada si no cabe un bloque de este alto
+        if self.y - alto < PDF_MARGEN_Y:
+            return self.cerrar_pagina()
+        return b""
+
+    def encabezado(self):
+        context = self.context
+        lienzo = self.lienzo
+        x, ancho = self.x, self.ancho
+
+        lienzo.rectangulo(x, self.y - 4.5, ancho, 4.5, relleno=PDF_COLOR_ACENTO)
+        self.y -= 18
+        lienzo.texto(x, self.y, "RESUMEN GENERAL", 8, True, PDF_COLOR_ACENTO)
+        self.y -= 20
+        lienzo.texto(x, self.y, context.get("empresa_nombre") or "Nombre de la empresa", 16, True)
+        self.y -= 13
+        lienzo.texto(x, self.y, "Reporte consolidado de inventario", 9, color=PDF_COLOR_SUAVE)
+        self.y -= 7
+        lienzo.linea(x, self.y, x + ancho, self.y)
+
+        for etiqueta, clave, defecto in (
+            ("Direccion:", "empresa_direccion", "Direccion"),
+            ("Celular:", "empresa_celular", "Celular"),
+            ("Fecha:", "fecha_generacion", "Sin fecha")
+        ):
+            self.y -= 12
+            lienzo.texto(x, self.y, etiqueta, 8, True)
+            lienzo.texto(x + ancho_texto_pdf(etiqueta + " ", 8, True), self.y,
+                         context.get(clave) or defecto, 8, color=PDF_COLOR_SUAVE)
+
+        self.y -= 24
+        lienzo.texto(x, self.y, "Filtros aplicados", 9, True)
+        self.y -= 8
+
+        mitad = (ancho - 8) / 2
+        filtros = list(context.get("filtros", {}).items())
+        for indice in range(0, len(filtros), 2):
+            self.y -= 28
+            for columna, (etiqueta, valor) in enumerate(filtros[indice:indice + 2]):
+                caja_x = x + columna * (mitad + 8)
+                lienzo.rectangulo(caja_x, self.y, mitad, 26, PDF_COLOR_CAJA, PDF_COLOR_BORDE)
+                lienzo.texto(caja_x + 8, self.y + 16, etiqueta.upper(), 6.5, True, PDF_COLOR_ETIQUETA)
+                lienzo.texto(caja_x + 8, self.y + 5, str(valor or "Todos"), 9, True)
+            self.y -= 2
+
+    def totales(self, cantidad_total, valor_total):
+        lienzo = self.lienzo
+        mitad = (self.ancho - 8) / 2
+        self.y -= 52
+
+        for columna, (etiqueta, valor) in enumerate((
+            ("CANTIDAD TOTAL", cantidad_total or "0"),
+            ("VALOR TOTAL", valor_total or "$ 0")
+        )):
+            caja_x = self.x + columna * (mitad + 8)
+            lienzo.rectangulo(caja_x, self.y, mitad, 44, (1, 1, 1), PDF_COLOR_BORDE)
+            lienzo.rectangulo(caja_x, self.y + 41, mitad, 3, relleno=PDF_COLOR_ACENTO)
+            lienzo.texto(caja_x + 10, self.y + 27, etiqueta, 7, True, PDF_COLOR_ETIQUETA)
+            lienzo.texto(caja_x + 10, self.y + 8, str(valor), 16, True)
+
+    def titulo_tabla(self, subtitulo):
+        self.y -= 22
+        self.lienzo.texto(self.x, self.y, "Detalle del resumen", 9, True)
+        if subtitulo:
+            self.y -= 11
+            self.lienzo.texto(self.x, self.y, subtitulo, 7.5, color=PDF_COLOR_SUAVE)
+        self.y -= 6
+
+    def fila(self, valores, negrita=False, relleno=None):
+        self.y -= PDF_ALTO_FILA
+        lienzo = self.lienzo
+        if relleno:
+            lienzo.rectangulo(self.x, self.y, self.ancho, PDF_ALTO_FILA, relleno=relleno)
+
+        x = self.x
+        for valor, ancho in zip(valores, self.anchos):
+            texto = recortar_texto_pdf(valor, ancho - 2 * PDF_RELLENO_CELDA, PDF_TAMANO_TABLA, negrita)
+            lienzo.texto(x + PDF_RELLENO_CELDA, self.y + 5, texto, PDF_TAMANO_TABLA, negrita)
+            x += ancho
+        lienzo.linea(self.x, self.y, self.x + self.ancho, self.y)
+
+    def cabecera_tabla(self):
+        self.inicio_tabla = self.y
+        lienzo = self.lienzo
+        lienzo.linea(self.x, self.y, self.x + self.ancho, self.y)
+        self.fila(self.columnas, True, PDF_COLOR_CABECERA)
+
+    def cerrar_tabla(self):
+        # Líneas verticales del tramo de tabla de la página actual
+        x = self.x
+        for ancho in [0] + self.anchos:
+            x += ancho
+            self.lienzo.linea(x, self.inicio_tabla, x, self.y)
+
+    def tabla(self, columnas, lotes):
+        # Generador: entrega bytes cada vez que se llena una página
+        self.columnas = columnas
+        filas = iter(lotes)
+        primer_lote = next(filas, [])
+
+        self.anchos = calcular_anchos_columnas(
+            columnas,
+            primer_lote[:PDF_MUESTRA_ANCHOS],
+            self.ancho
+        )
+
+        yield self.espacio(2 * PDF_ALTO_FILA)
+        self.cabecera_tabla()
+
+        for lote in itertools.chain([primer_lote], filas):
+            for fila in lote:
+                if self.y - PDF_ALTO_FILA < PDF_MARGEN_Y:
+                    self.cerrar_tabla()
+                    yield self.cerrar_pagina()
+                    self.cabecera_tabla()
+
+                self.fila([valor_celda_pdf(fila.get(columna)) for columna in columnas])
+
+        self.cerrar_tabla()
+
+    def vacio(self):
+        self.y -= 50
+        self.lienzo.rectangulo(self.x, self.y, self.ancho, 44, (1, 1, 1), PDF_COLOR_BORDE)
+        texto = "No hay datos para este resumen."
+        self.lienzo.texto(
+            self.x + (self.ancho - ancho_texto_pdf(texto, 9)) / 2, self.y + 18, texto, 9,
+            color=PDF_COLOR_SUAVE
+        )
+
+
+def generar_pdf_tabular(context, lotes=None):
+    # Mismo contenido que la plantilla HTML (sin el logo), en partes de bytes.
+    # Con lotes (filas leídas por partes) los totales y el número de
+    # registros solo se conocen al final, así que van después de la tabla.
+    escritor = EscritorPdf()
+    paginador = PaginadorReporte(escritor, context)
+
+    yield escritor.inicio()
+    paginador.encabezado()
+
+    if lotes is None:
+        filas = context["filas"]
+        paginador.totales(context["cantidad_total"], context["valor_total"])
+
+        if filas:
+            paginador.titulo_tabla(f"{len(filas)} registros generados")
+            yield from paginador.tabla(context["columnas"], [filas])
+        else:
+            paginador.vacio()
+    else:
+        acumulado = {"registros": 0, "totales": (0, 0)}
+
+        def contar(lotes):
+            for lote in lotes:
+                acumulado["registros"] += len(lote)
+                acumulado["totales"] = sumar_totales_reporte(lote, *acumulado["totales"])
+                yield lote
+
+        lotes = (lote for lote in lotes if lote)
+        primero = next(lotes, None)
+
+        if primero is None:
+            paginador.vacio()
+        else:
+            paginador.titulo_tabla(None)
+            yield from paginador.tabla(
+                context["columnas"],
+                contar(itertools.chain([primero], lotes))
+            )
+
+        totales = formatear_totales_reporte(*acumulado["totales"])
+        yield paginador.espacio(80)
+        paginador.y -= 14
+        paginador.lienzo.texto(
+            paginador.x, paginador.y, f"{acumulado['registros']} registros generados", 7.5,
+            color=PDF_COLOR_SUAVE
+        )
+        paginador.totales(totales["cantidad_total"], totales["valor_total"])
+
+    yield paginador.cerrar_pagina()
+    yield escritor.fin()
+
+
+def iterar_datos_reporte(filtros, fuente=FUENTE_PROCEDIMIENTO):
+    # (columnas, lotes de filas) para las salidas en streaming: de memoria
+    # si el resultado está en caché o viene del resumen (ya agregado), si no
+    # leyendo el procedimiento de a STREAM_LOTE filas
+    if fuente == FUENTE_RESUMEN:
+        data = obtener_reporte_general_data(filtros, fuente)
+    else:
+        data = leer_cache_reporte(filtros)
+
+    if data is not None:
+        yield data["columns"], [data["rows"]]
+        return
+
+    with cursor_db(dictionary=True) as (conn, cursor):
+        yield from iterar_reporte_general(cursor, filtros)
+
+
+def stream_reporte_pdf(filtros, fuente=FUENTE_PROCEDIMIENTO):
+    # La memoria no depende del total de filas: cada página se envía al
+    # cliente en cuanto se completa
+    context = build_reporte_encabezado(filtros)
+
+    for columns, lotes in iterar_datos_reporte(filtros, fuente):
+        context["columnas"] = columns
+        yield from generar_pdf_tabular(context, lotes)
+
+
+# Exportaciones para hojas de cálculo: filas tal como las devuelve el
+# procedimiento y al final los totales como números, no como texto con
+# formato de moneda. Se escriben por lote, sin armar el archivo en memoria.
+EXPORT_CSV_SEPARADOR = ";"
+
+
+def filas_totales_exportacion(totales):
+    # valor_total_num de formatear_totales_reporte es entero; aquí se
+    # conservan los centavos (y sin ".0" cuando no los hay)
+    cantidad_total, valor_total = totales
+    valor_total = round(float(valor_total), 2)
+    return [
+        [],
+        ["Cantidad total", int(cantidad_total)],
+        ["Valor total", int(valor_total) if valor_total.is_integer() else valor_total]
+    ]
+
+
+def stream_reporte_csv(filtros, fuente=FUENTE_PROCEDIMIENTO):
+    salida = io.StringIO()
+    escritor = csv.writer(salida, delimiter=EXPORT_CSV_SEPARADOR)
+
+    def vaciar():
+        texto = salida.getvalue()
+        salida.seek(0)
+        salida.truncate()
+        return texto
+
+    for columns, lotes in iterar_datos_reporte(filtros, fuente):
+        # BOM para que Excel reconozca UTF-8 (tildes y eñes)
+        salida.write("\ufeff")
+        escritor.writerow(columns)
+        totales = (0, 0)
+
+        for lote in lotes:
+            escritor.writerows([fila.get(columna) for columna in columns] for fila in lote)
+            totales = sumar_totales_reporte(lote, *totales)
+            yield vaciar()
+
+        escritor.writerows(filas_totales_exportacion(totales))
+        yield vaciar()
+
+
+class SalidaZip:
+    # Destino de solo escritura para zipfile: sin seek, zipfile escribe los
+    # tamaños al final de cada archivo y lo ya escrito se puede ir enviando
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b"".join(self._partes)
+        self._partes = []
+        return datos
+
+
+XLSX_TIPOS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>"""
+
+XLSX_RELACIONES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+XLSX_LIBRO = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Resumen general" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+XLSX_RELACIONES_LIBRO = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>"""
+
+RE_CONTROL_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def celda_xlsx(valor):
+    if valor is None:
+        return "<c/>"
+
+    if isinstance(valor, (int, float, Decimal)) and not isinstance(valor, bool):
+        return f"<c><v>{valor}</v></c>"
+
+    texto = escape(RE_CONTROL_XML.sub("", str(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def fila_xlsx(valores):
+    return "<row>" + "".join(celda_xlsx(valor) for valor in valores) + "</row>"
+
+
+def stream_reporte_xlsx(filtros, fuente=FUENTE_PROCEDIMIENTO):
+    # Textos en línea (sin sharedStrings), así cada fila se escribe apenas
+    # se lee y no hace falta conocer todas las cadenas de antemano
+    salida = SalidaZip()
+
+    for columns, lotes in iterar_datos_reporte(filtros, fuente):
+        with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as libro:
+            libro.writestr("[Content_Types].xml", XLSX_TIPOS)
+            libro.writestr("_rels/.rels", XLSX_RELACIONES)
+            libro.writestr("xl/workbook.xml", XLSX_LIBRO)
+            libro.writestr("xl/_rels/workbook.xml.rels", XLSX_RELACIONES_LIBRO)
+
+            with libro.open("xl/worksheets/sheet1.xml", "w") as hoja:
+                hoja.write(
+                    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                    b"<sheetData>"
+                )
+                hoja.write(fila_xlsx(columns).encode("utf-8"))
+                totales = (0, 0)
+
+                for lote in lotes:
+                    hoja.write("".join(
+                        fila_xlsx([fila.get(columna) for columna in columns]) for fila in lote
+                    ).encode("utf-8"))
+                    totales = sumar_totales_reporte(lote, *totales)
+                    yield salida.vaciar()
+
+                hoja.write("".join(
+                    fila_xlsx(fila) for fila in filas_totales_exportacion(totales)
+                ).encode("utf-8"))
+                hoja.write(b"</sheetData></worksheet>")
+
+        yield salida.vaciar()
+
+
+FORMATOS_EXPORTACION = {
+    "csv": ("text/csv", stream_reporte_csv),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", stream_reporte_xlsx)
+}
+
+
+def adjunto_reporte(extension):
+    return f'attachment; filename="resumen_general_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}"'
+
+
+def generar_reporte_general(output_format, filtros, engine="html", fuente=FUENTE_PROCEDIMIENTO):
+    # La fecha de generación del documento guardado es la de la primera vez
+    clave = (output_format, engine, fuente, filtros, versiones_datos.actual(VERSION_CATALOGO))
+
+    contenido = cache_reportes.obtener(clave)
+    if contenido is None:
+        context = build_reporte_pdf_context(filtros, fuente)
+
+        if output_format == "pdf" and engine == "directo":
+            contenido = b"".join(generar_pdf_tabular(context))
+        else:
+            html = render_reporte_html(context)
+
+            if output_format == "html":
+                contenido = html.encode("utf-8")
+            else:
+                contenido = convertir_html_a_pdf(html)
+
+        cache_reportes.guardar(clave, contenido)
+
+    return contenido
+
+
 @app.route("/InformationGeneralPdf", methods=["GET"])
 def reporte_general_pdf():
     try:
-        context = build_reporte_pdf_context()
-        html = render_template_string(load_report_template(), **context)
-
         output_format = request.args.get("format", "pdf").strip().lower()
 
-        if output_format == "html":
-            return html
+        if output_format in FORMATOS_EXPORTACION:
+            mimetype, generador = FORMATOS_EXPORTACION[output_format]
+            response = respuesta_streaming(
+                generador(
+                    obtener_filtros_reporte(request.args),
+                    obtener_fuente_reporte(request.args)
+                ),
+                mimetype
+            )
+            response.headers["Content-Disposition"] = adjunto_reporte(output_format)
+            return response
+
+        stream = parametro_activo(request.args.get("stream", ""))
+        engine = request.args.get("engine", "directo" if stream else "html").strip().lower()
+
+        if output_format not in ("html", "pdf"):
+            return jsonify({"error": "Formato no soportado. Usa html, pdf, csv o xlsx"}), 400
 
-        if output_format != "pdf":
-            return jsonify({"error": "Formato no soportado. Usa html o pdf"}), 400
+        if engine not in MOTORES_REPORTE_PDF:
+            return jsonify({"error": "Motor no soportado. Usa html o directo"}), 400
 
-        if pisa is None:
+        if stream and (output_format != "pdf" or engine != "directo"):
+            return jsonify({
+                "error": "El modo stream solo está disponible para PDF con engine=directo"
+            }), 400
+
+        if output_format == "pdf" and engine == "html" and pisa is None:
             return jsonify({
                 "error": "La libreria xhtml2pdf no esta instalada en el servidor"
             }), 500
 
-        pdf_buffer = BytesIO()
-        pdf = pisa.CreatePDF(html, dest=pdf_buffer, encoding="utf-8")
+        filtros = obtener_filtros_reporte(request.args)
+        fuente = obtener_fuente_reporte(request.args)
 
-        if pdf.err:
-            return jsonify({"error": "No se pudo generar el PDF"}), 500
+        if stream:
+            response = respuesta_streaming(stream_reporte_pdf(filtros, fuente), "application/pdf")
+        else:
+            contenido = generar_reporte_general(output_format, filtros, engine, fuente)
 
-        response = make_response(pdf_buffer.getvalue())
-        response.headers["Content-Type"] = "application/pdf"
-        response.headers["Content-Disposition"] = (
-            f'attachment; filename="resumen_general_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
-        )
+            if output_format == "html":
+                return contenido
+
+            response = make_response(contenido)
+            response.headers["Content-Type"] = "application/pdf"
+
+        response.headers["Content-Disposition"] = adjunto_reporte("pdf")
         return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except ErrorGenerandoReporte as e:
+        return jsonify({"error": str(e)}), 500
     except Exception as e:
         print(f"DEBUG PDF ERROR: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
+# ============================================
+# REPORTES EN SEGUNDO PLANO
+# ============================================
+# Los reportes pesados se generan en un pool de procesos aparte para no
+# ocupar los workers de gunicorn. Estado y resultado se guardan en
+# REPORTES_DIR, así cualquier worker puede responder la consulta o descarga.
+REPORTES_DIR = os.environ.get(
+    "REPORTES_DIR",
+    os.path.join(tempfile.gettempdir(), "dotaciones_reportes")
+)
+REPORTE_PROCESOS = int(os.environ.get("REPORTE_PROCESOS", 1))
+REPORTE_MAX_PENDIENTES = int(os.environ.get("REPORTE_MAX_PENDIENTES", 10))
+REPORTE_TTL = float(os.environ.get("REPORTE_TTL", 3600))
+# Un trabajo sin terminar tras este tiempo se da por perdido
+REPORTE_TIEMPO_MAX = float(os.environ.get("REPORTE_TIEMPO_MAX", 1800))
+
+RE_ID_TRABAJO = re.compile(r"^[0-9a-f]{32}$")
+
+MIMETYPES_REPORTE = {
+    "pdf": "application/pdf",
+    "html": "text/html"
+}
+
+
+def ruta_trabajo(id_trabajo, extension):
+    return os.path.join(REPORTES_DIR, f"{id_trabajo}.{extension}")
+
+
+def escribir_estado_trabajo(id_trabajo, **estado):
+    temporal = ruta_trabajo(id_trabajo, f"{os.getpid()}.tmp")
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(estado, archivo)
+    os.replace(temporal, ruta_trabajo(id_trabajo, "json"))
+
+
+def leer_estado_trabajo(id_trabajo):
+    try:
+        with open(ruta_trabajo(id_trabajo, "json"), "r", encoding="utf-8") as archivo:
+            return json.load(archivo)
+    except FileNotFoundError:
+        return None
+
+
+def estado_trabajo_vigente(id_trabajo):
+    # Mientras está pendiente el estado lleva el pid del worker que lo
+    # encoló; al procesarse, el del proceso hijo. Si ese proceso murió
+    # (SIGKILL, OOM, reinicio del worker) nadie va a actualizarlo, así que
+    # se marca como error para que el cliente deje de consultar.
+    estado = leer_estado_trabajo(id_trabajo)
+    if estado is None or estado["estado"] not in ("pendiente", "procesando"):
+        return estado
+
+    vencido = time.time() - estado["creado"] > REPORTE_TIEMPO_MAX
+    if vencido or not proceso_vivo(estado.get("pid")):
+        estado = {**estado, "estado": "error", "error": "El trabajo se interrumpió"}
+        estado.pop("pid", None)
+        escribir_estado_trabajo(id_trabajo, **estado)
+    return estado
+
+
+def ejecutar_trabajo_reporte(id_trabajo, output_format, filtros, creado):
+    # Corre en el proceso hijo: obtiene sus propias conexiones del pool
+    base = {"format": output_format, "creado": creado}
+    try:
+        escribir_estado_trabajo(id_trabajo, estado="procesando", pid=os.getpid(), **base)
+
+        contenido = generar_reporte_general(output_format, filtros)
+
+        temporal = ruta_trabajo(id_trabajo, f"{output_format}.tmp")
+        with open(temporal, "wb") as archivo:
+            archivo.write(contenido)
+        os.replace(temporal, ruta_trabajo(id_trabajo, output_format))
+
+        escribir_estado_trabajo(id_trabajo, estado="listo", **base)
+    except Exception as e:
+        print(f"ERROR TRABAJO REPORTE {id_trabajo}: {e}")
+        escribir_estado_trabajo(id_trabajo, estado="error", error=str(e), **base)
+
+
+class PoolReportes:
+
+    def __init__(self, procesos, max_pendientes):
+        self.procesos = max(1, procesos)
+        self.max_pendientes = max_pendientes
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pendientes = set()
+
+    def reiniciar_tras_fork(self):
+        self._reiniciar()
+
+    def enviar(self, id_trabajo, output_format, filtros, creado):
+        with self._lock:
+            self._pendientes = {f for f in self._pendientes if not f.done()}
+            if len(self._pendientes) >= self.max_pendientes:
+                return False
+
+            args = (id_trabajo, output_format, filtros, creado)
+            try:
+                futuro = self._obtener_executor().submit(ejecutar_trabajo_reporte, *args)
+            except BrokenProcessPool:
+                # Un hijo murió (OOM, kill): se descarta el pool y se crea otro
+                self._executor.shutdown(wait=False)
+                self._executor = None
+                futuro = self._obtener_executor().submit(ejecutar_trabajo_reporte, *args)
+            self._pendientes.add(futuro)
+
+        futuro.add_done_callback(
+            lambda f: self._al_terminar(f, id_trabajo, output_format, creado)
+        )
+        return True
+
+    def _obtener_executor(self):
+        if self._executor is None:
+            # spawn: los hijos importan la app desde cero en lugar de
+            # heredar por fork los hilos y sockets del worker
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _al_terminar(self, futuro, id_trabajo, output_format, creado):
+        # Errores dentro del trabajo ya quedan en su estado; aquí solo
+        # llegan los del pool (p. ej. un proceso hijo que murió).
+        error = "Cancelado" if futuro.cancelled() else futuro.exception()
+        if error is None:
+            return
+
+        escribir_estado_trabajo(
+            id_trabajo,
+            estado="error",
+            error=str(error),
+            format=output_format,
+            creado=creado
+        )
+
+    def cerrar(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+pool_reportes = PoolReportes(REPORTE_PROCESOS, REPORTE_MAX_PENDIENTES)
+
+os.register_at_fork(after_in_child=pool_reportes.reiniciar_tras_fork)
+atexit.register(pool_reportes.cerrar)
+
+
+def limpiar_trabajos_vencidos():
+    limite = time.time() - REPORTE_TTL
+    try:
+        with os.scandir(REPORTES_DIR) as entradas:
+            for entrada in entradas:
+                try:
+                    if entrada.is_file() and entrada.stat().st_mtime < limite:
+                        os.remove(entrada.path)
+                except FileNotFoundError:
+                    # Otro hilo o worker lo borró primero
+                    pass
+    except OSError as e:
+        print("ERROR LIMPIANDO REPORTES:", e)
+
+
+@app.route("/SolicitarReporte", methods=["POST"])
+def solicitar_reporte():
+    datos = request.get_json(silent=True) or request.args
+
+    output_format = str(datos.get("format", "pdf")).strip().lower()
+    if output_format not in MIMETYPES_REPORTE:
+        return jsonify({"ok": False, "error": "Formato no soportado. Usa html o pdf"}), 400
+
+    if output_format == "pdf" and pisa is None:
+        return jsonify({
+            "ok": False,
+            "error": "La libreria xhtml2pdf no esta instalada en el servidor"
+        }), 500
+
+    os.makedirs(REPORTES_DIR, exist_ok=True)
+    limpiar_trabajos_vencidos()
+
+    id_trabajo = uuid.uuid4().hex
+    filtros = obtener_filtros_reporte(datos)
+    creado = time.time()
+
+    escribir_estado_trabajo(
+        id_trabajo,
+        estado="pendiente",
+        format=output_format,
+        creado=creado,
+        pid=os.getpid()
+    )
+
+    if not pool_reportes.enviar(id_trabajo, output_format, filtros, creado):
+        os.remove(ruta_trabajo(id_trabajo, "json"))
+        return jsonify({"ok": False, "error": "Demasiados reportes en proceso"}), 429
+
+    return jsonify({"ok": True, "id_trabajo": id_trabajo}), 202
+
+
+@app.route("/EstadoReporte", methods=["GET"])
+def estado_reporte():
+    id_trabajo = request.args.get("id", "")
+    estado = estado_trabajo_vigente(id_trabajo) if RE_ID_TRABAJO.match(id_trabajo) else None
+
+    if estado is None:
+        return jsonify({"ok": False, "error": "Trabajo no encontrado"}), 404
+
+    estado.pop("pid", None)
+    return jsonify({"ok": True, "id_trabajo": id_trabajo, **estado})
+
+
+@app.route("/DescargarReporte", methods=["GET"])
+def descargar_reporte():
+    id_trabajo = request.args.get("id", "")
+    estado = estado_trabajo_vigente(id_trabajo) if RE_ID_TRABAJO.match(id_trabajo) else None
+
+    if estado is None:
+        return jsonify({"ok": False, "error": "Trabajo no encontrado"}), 404
+
+    # Un trabajo fallido no se va a completar: 500 con el error guardado
+    # para que el cliente deje de consultar
+    if estado["estado"] == "error":
+        return jsonify({
+            "ok": False,
+            "error": estado.get("error") or "Error generando el reporte",
+            "estado": estado["estado"]
+        }), 500
+
+    if estado["estado"] != "listo":
+        return jsonify({"ok": False, "error": "El reporte aún no está listo", "estado": estado["estado"]}), 409
+
+    output_format = estado["format"]
+    return send_file(
+        ruta_trabajo(id_trabajo, output_format),
+        mimetype=MIMETYPES_REPORTE[output_format],
+        as_attachment=output_format == "pdf",
+        download_name=f"resumen_general_{datetime.fromtimestamp(estado['creado']).strftime('%Y%m%d_%H%M%S')}.{output_format}"
+    )
+
+
+# ============================================
+# COMPRESIÓN DE RESPUESTAS
+# ============================================
+# gzip o brotli (si está instalado) según Accept-Encoding, para JSON, CSV y
+# texto por encima de COMPRESION_MIN_BYTES; PDF y XLSX ya van comprimidos.
+# Los cuerpos comprimidos se guardan por hash del original solo para
+# respuestas cacheables (con ETag o servidas desde cache_referencia o
+# cache_reporte_datos): el mismo catálogo no se vuelve a comprimir para
+# cada cliente, y las respuestas por usuario o de error no desplazan esos
+# cuerpos de la caché. Las respuestas en streaming se comprimen al
+# vuelo. Un cuerpo codificado no tiene los mismos bytes que el original,
+# así que su ETag pasa a débil (W/): los If-None-Match se comparan en forma
+# débil y siguen produciendo 304, pero ningún caché ni Range mezcla bytes
+# gzip con los del original.
+COMPRESION_MIN_BYTES = int(os.environ.get("COMPRESION_MIN_BYTES", 1024))
+COMPRESION_NIVEL_GZIP = int(os.environ.get("COMPRESION_NIVEL_GZIP", 6))
+COMPRESION_CALIDAD_BR = int(os.environ.get("COMPRESION_CALIDAD_BR", 5))
+COMPRESION_CACHE_MB = float(os.environ.get("COMPRESION_CACHE_MB", 16))
+# En streaming se vacía el compresor cada tantos bytes de entrada para que
+# el cliente reciba datos sin esperar al final
+COMPRESION_VACIAR_BYTES = 64 * 1024
+
+TIPOS_COMPRIMIBLES = ("application/json", "text/", "application/xml", "application/javascript")
+
+cache_comprimidos = CacheBytes(int(COMPRESION_CACHE_MB * 1024 * 1024))
+
+
+def elegir_codificacion():
+    aceptadas = request.accept_encodings
+    calidad_br = aceptadas["br"] if brotli else 0
+    calidad_gzip = aceptadas["gzip"]
+
+    if calidad_br and calidad_br >= calidad_gzip:
+        return "br"
+    if calidad_gzip:
+        return "gzip"
+    return None
+
+
+def comprimir(cuerpo, codificacion):
+    if codificacion == "br":
+        return brotli.compress(cuerpo, quality=COMPRESION_CALIDAD_BR)
+    return gzip.compress(cuerpo, compresslevel=COMPRESION_NIVEL_GZIP, mtime=0)
+
+
+def comprimir_cacheado(cuerpo, codificacion):
+    clave = (codificacion, hashlib.blake2b(cuerpo, digest_size=16).digest())
+    comprimido = cache_comprimidos.obtener(clave)
+    if comprimido is None:
+        comprimido = comprimir(cuerpo, codificacion)
+        cache_comprimidos.guardar(clave, comprimido)
+    return comprimido
+
+
+def debilitar_etag(response):
+    etag, debil = response.get_etag()
+    if etag and not debil:
+        response.set_etag(etag, weak=True)
+
+
+def comprimir_fragmentos(fragmentos, codificacion):
+    if codificacion == "br":
+        compresor = brotli.Compressor(quality=COMPRESION_CALIDAD_BR)
+        agregar, vaciar, terminar = compresor.process, compresor.flush, compresor.finish
+    else:
+        compresor = zlib.compressobj(COMPRESION_NIVEL_GZIP, zlib.DEFLATED, 31)
+        agregar, terminar = compresor.compress, compresor.flush
+        vaciar = lambda: compresor.flush(zlib.Z_SYNC_FLUSH)  # noqa: E731
+
+    pendientes = 0
+    try:
+        for fragmento in fragmentos:
+            if isinstance(fragmento, str):
+                fragmento = fragmento.encode("utf-8")
+
+            salida = agregar(fragmento)
+            pendientes += len(fragmento)
+            if pendientes >= COMPRESION_VACIAR_BYTES:
+                salida += vaciar()
+                pendientes = 0
+
+            if salida:
+                yield salida
+
+        yield terminar()
+    finally:
+        cerrar = getattr(fragmentos, "close", None)
+        if cerrar:
+            cerrar()
+
+
+@app.after_request
+def comprimir_respuesta(response):
+    # El 304 lleva el mismo ETag que tendría la respuesta completa
+    if response.status_code == 304 and elegir_codificacion() is not None:
+        response.vary.add("Accept-Encoding")
+        debilitar_etag(response)
+        return response
+
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or not (response.mimetype or "").startswith(TIPOS_COMPRIMIBLES)
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    codificacion = elegir_codificacion()
+    if codificacion is None:
+        return response
+
+    if response.is_streamed:
+        response.response = comprimir_fragmentos(response.response, codificacion)
+        response.headers.pop("Content-Length", None)
+    else:
+        cuerpo = response.get_data()
+        if len(cuerpo) < COMPRESION_MIN_BYTES:
+            return response
+
+        if response.status_code == 200 and (response.get_etag()[0] or g.get("respuesta_cacheable")):
+            comprimido = comprimir_cacheado(cuerpo, codificacion)
+        else:
+            comprimido = comprimir(cuerpo, codificacion)
+        if len(comprimido) >= len(cuerpo):
+            return response
+        response.set_data(comprimido)
+
+    response.headers["Content-Encoding"] = codificacion
+    debilitar_etag(response)
+    return response
+
+
 # ============================================
 # HEALTH CHECK
 # ============================================
@@ -0,0 +1,110 @@
+-- Esquema mínimo para los benchmarks: solo las tablas y columnas que usa
+-- app.py. Lo aplica benchmarks/sembrar.py sobre una base de pruebas; no es
+-- el esquema de producción.
+
+DROP PROCEDURE IF EXISTS InformationGeneral;
+DROP TABLE IF EXISTS resumen_inventario;
+DROP TABLE IF EXISTS movimientos_inventario;
+DROP TABLE IF EXISTS password_resets;
+DROP TABLE IF EXISTS usuarios;
+DROP TABLE IF EXISTS variantes;
+DROP TABLE IF EXISTS productos;
+DROP TABLE IF EXISTS tallas;
+DROP TABLE IF EXISTS estilos;
+DROP TABLE IF EXISTS marcas;
+DROP TABLE IF EXISTS colores;
+DROP TABLE IF EXISTS generos;
+DROP TABLE IF EXISTS categorias;
+
+CREATE TABLE categorias (
+    id_categoria INT AUTO_INCREMENT PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    id_estado INT NOT NULL DEFAULT 1
+);
+
+CREATE TABLE generos (
+    id_genero INT AUTO_INCREMENT PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    id_estado INT NOT NULL DEFAULT 1
+);
+
+CREATE TABLE colores (
+    id_color INT AUTO_INCREMENT PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    id_estado INT NOT NULL DEFAULT 1
+);
+
+CREATE TABLE marcas (
+    id_marca INT AUTO_INCREMENT PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    id_categoria INT NULL,
+    id_estado INT NOT NULL DEFAULT 1
+);
+
+CREATE TABLE estilos (
+    id_estilo INT AUTO_INCREMENT PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    id_marca INT NULL,
+    id_estado INT NOT NULL DEFAULT 1
+);
+
+CREATE TABLE tallas (
+    id_talla INT AUTO_INCREMENT PRIMARY KEY,
+    valor VARCHAR(20) NOT NULL,
+    id_categoria INT NOT NULL,
+    id_genero INT NOT NULL,
+    id_estado INT NOT NULL DEFAULT 1,
+    KEY idx_tallas_categoria_genero (id_categoria, id_genero, valor)
+);
+
+CREATE TABLE productos (
+    id_producto INT AUTO_INCREMENT PRIMARY KEY,
+    nombre VARCHAR(150) NOT NULL,
+    id_marca INT NULL,
+    id_estilo INT NULL,
+    id_categoria INT NOT NULL,
+    id_genero INT NOT NULL,
+    id_estado INT NOT NULL DEFAULT 1,
+    KEY idx_productos_nombre (nombre, id_categoria, id_genero)
+);
+
+CREATE TABLE variantes (
+    id_variante INT AUTO_INCREMENT PRIMARY KEY,
+    id_producto INT NOT NULL,
+    id_color INT NOT NULL,
+    id_talla INT NOT NULL,
+    precio DECIMAL(12, 2) NOT NULL,
+    stock INT NOT NULL DEFAULT 0,
+    id_estado INT NOT NULL DEFAULT 1,
+    KEY idx_variantes_producto (id_producto, id_color, id_talla)
+);
+
+CREATE TABLE movimientos_inventario (
+    id_movimiento INT AUTO_INCREMENT PRIMARY KEY,
+    id_variante INT NOT NULL,
+    tipo VARCHAR(10) NOT NULL,
+    cantidad INT NOT NULL,
+    stock_anterior INT NOT NULL,
+    stock_nuevo INT NOT NULL,
+    fecha DATETIME NOT NULL,
+    precio_venta DECIMAL(12, 2) NULL,
+    fecha_venta DATETIME NULL,
+    total_venta DECIMAL(14, 2) NULL,
+    KEY idx_movimientos_variante (id_variante)
+);
+
+CREATE TABLE usuarios (
+    idUsuario INT AUTO_INCREMENT PRIMARY KEY,
+    usuario VARCHAR(100) NOT NULL UNIQUE,
+    password VARCHAR(255) NOT NULL,
+    email VARCHAR(150) NULL,
+    id_estado INT NOT NULL DEFAULT 1
+);
+
+CREATE TABLE password_resets (
+    idPasswordResets INT AUTO_INCREMENT PRIMARY KEY,
+    idUsuario INT NOT NULL UNIQUE,
+    token VARCHAR(64) NOT NULL,
+    expira DATETIME NOT NULL,
+    id_estado INT NOT NULL
+);
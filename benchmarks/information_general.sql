@@ -0,0 +1,38 @@
+-- Sustituto del procedimiento InformationGeneral para los benchmarks (el
+-- real no está en el repositorio): mismos cinco filtros por nombre y las
+-- columnas Cantidad / Total que usan los reportes. Se ejecuta como una
+-- sola sentencia, sin DELIMITER.
+CREATE PROCEDURE InformationGeneral(
+    IN p_categoria VARCHAR(100),
+    IN p_genero VARCHAR(100),
+    IN p_producto VARCHAR(150),
+    IN p_talla VARCHAR(20),
+    IN p_estilo VARCHAR(100)
+)
+BEGIN
+    SELECT
+        cat.nombre AS Categoria,
+        g.nombre AS Genero,
+        p.nombre AS Producto,
+        e.nombre AS Estilo,
+        t.valor AS Talla,
+        c.nombre AS Color,
+        SUM(v.stock) AS Cantidad,
+        CONCAT('$ ', FORMAT(SUM(v.stock * v.precio), 0, 'de_DE')) AS Total
+    FROM variantes v
+    JOIN productos p ON v.id_producto = p.id_producto
+    JOIN categorias cat ON p.id_categoria = cat.id_categoria
+    JOIN generos g ON p.id_genero = g.id_genero
+    LEFT JOIN estilos e ON p.id_estilo = e.id_estilo
+    JOIN tallas t ON v.id_talla = t.id_talla
+    JOIN colores c ON v.id_color = c.id_color
+    WHERE v.id_estado = 1
+      AND p.id_estado = 1
+      AND (p_categoria IS NULL OR cat.nombre = p_categoria)
+      AND (p_genero IS NULL OR g.nombre = p_genero)
+      AND (p_producto IS NULL OR p.nombre = p_producto)
+      AND (p_talla IS NULL OR t.valor = p_talla)
+      AND (p_estilo IS NULL OR e.nombre = p_estilo)
+    GROUP BY cat.nombre, g.nombre, p.nombre, e.nombre, t.valor, c.nombre
+    ORDER BY cat.nombre, g.nombre, p.nombre, t.valor, c.nombre;
+END
@@ -0,0 +1,97 @@
+# Compara los motores del PDF del resumen general (HTML + xhtml2pdf contra
+# el escritor directo) con filas sintéticas, sin base de datos.
+#
+#   python benchmarks/reporte_pdf.py
+#   python benchmarks/reporte_pdf.py --filas 1000 10000 --motores directo --memoria
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app  # noqa: E402
+
+
+COLUMNAS = ["Categoria", "Genero", "Producto", "Estilo", "Talla", "Color", "Cantidad", "Precio", "Total"]
+
+
+def filas_sinteticas(cantidad, semilla=7):
+    azar = random.Random(semilla)
+    filas = []
+    for i in range(cantidad):
+        cantidad_fila = azar.randint(0, 80)
+        precio = azar.choice([18000, 25000, 35000, 42000, 56000])
+        filas.append({
+            "Categoria": azar.choice(["Camisas", "Pantalones", "Chaquetas", "Overoles", "Batas"]),
+            "Genero": azar.choice(["Hombre", "Mujer", "Niño", "Unisex"]),
+            "Producto": f"Producto {i % 500}",
+            "Estilo": azar.choice(["Clásico", "Slim fit", "Manga larga", "Con reflectivo", None]),
+            "Talla": azar.choice(["S", "M", "L", "XL", "6", "8", "10", "32", "34"]),
+            "Color": azar.choice(["Azul", "Negro", "Blanco", "Gris", "Verde"]),
+            "Cantidad": cantidad_fila,
+            "Precio": Decimal(precio),
+            "Total": app.format_currency_es(cantidad_fila * precio)
+        })
+    return filas
+
+
+def contexto(filas):
+    totales = app.calcular_totales_reporte(filas)
+    context = app.build_reporte_encabezado((None, None, None, None, None))
+    context.update({
+        "columnas": COLUMNAS,
+        "filas": filas,
+        "cantidad_total": totales["cantidad_total"],
+        "valor_total": totales["valor_total"]
+    })
+    return context
+
+
+def generar(motor, context):
+    if motor == "directo":
+        return b"".join(app.generar_pdf_tabular(context))
+    return app.convertir_html_a_pdf(app.render_reporte_html(context))
+
+
+def medir(motor, context, memoria):
+    # tracemalloc vuelve todo más lento: el tiempo se mide en otra pasada
+    inicio = time.perf_counter()
+    pdf = generar(motor, context)
+    segundos = time.perf_counter() - inicio
+
+    pico = None
+    if memoria:
+        tracemalloc.start()
+        generar(motor, context)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return segundos, pico, len(pdf)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de los motores del PDF del resumen general")
+    parser.add_argument("--filas", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--motores", nargs="+", default=list(app.MOTORES_REPORTE_PDF),
+                        choices=app.MOTORES_REPORTE_PDF)
+    parser.add_argument("--memoria", action="store_true", help="mide también el pico de memoria")
+    args = parser.parse_args()
+
+    if "html" in args.motores and app.pisa is None:
+        sys.exit("xhtml2pdf no está instalado; usa --motores directo")
+
+    print(f"{'filas':>8} {'motor':>8} {'segundos':>10} {'pico MB':>9} {'PDF KB':>9}")
+    for cantidad in args.filas:
+        context = contexto(filas_sinteticas(cantidad))
+        for motor in args.motores:
+            segundos, pico, tamano = medir(motor, context, args.memoria)
+            pico = "-" if pico is None else f"{pico / 1048576:.1f}"
+            print(f"{cantidad:>8} {motor:>8} {segundos:>10.2f} {pico:>9} {tamano / 1024:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
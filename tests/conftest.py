@@ -0,0 +1,144 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Directorios compartidos entre workers en una carpeta temporal, antes de
+# importar la app
+_TEMPORAL = tempfile.mkdtemp(prefix="dotaciones_tests_")
+for _variable in ("VERSIONES_DIR", "METRICAS_DIR", "REPORTES_DIR"):
+    os.environ.setdefault(_variable, os.path.join(_TEMPORAL, _variable.lower()))
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app as aplicacion  # noqa: E402
+
+
+class CursorFalso:
+    # Cursor de mysql-connector en memoria. Las filas salen de
+    # BaseFalsa.responder; si son dicts y el cursor no es dictionary=True se
+    # devuelven como tuplas en el orden de sus claves.
+
+    def __init__(self, conexion, dictionary=False, **opciones):
+        self.conexion = conexion
+        self.dictionary = dictionary
+        self.filas = []
+        self.column_names = ()
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def _cargar(self, filas):
+        filas = list(filas or [])
+        if filas and isinstance(filas[0], dict):
+            self.column_names = tuple(filas[0])
+            if not self.dictionary:
+                filas = [tuple(fila.values()) for fila in filas]
+        self.filas = filas
+
+    def execute(self, sql, params=None, multi=False):
+        sql = " ".join(sql.split())
+        self.conexion.ejecutadas.append((sql, params))
+        self.rowcount = -1
+        self._cargar(self.conexion.base.responder(sql, params, self))
+        if self.rowcount == -1:
+            self.rowcount = len(self.filas)
+
+    def executemany(self, sql, filas):
+        filas = list(filas)
+        sql = " ".join(sql.split())
+        self.conexion.ejecutadas.append((sql, filas))
+        self._cargar(self.conexion.base.responder(sql, filas, self))
+        self.rowcount = len(filas)
+
+    def fetchone(self):
+        return self.filas.pop(0) if self.filas else None
+
+    def fetchmany(self, size=1):
+        filas, self.filas = self.filas[:size], self.filas[size:]
+        return filas
+
+    def fetchall(self):
+        filas, self.filas = self.filas, []
+        return filas
+
+    def close(self):
+        pass
+
+
+class ConexionFalsa:
+
+    def __init__(self, base):
+        self.base = base
+        self.ejecutadas = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.pings = 0
+        self.cerrada = False
+        self.falla_ping = False
+
+    def cursor(self, **opciones):
+        return CursorFalso(self, **opciones)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if self.falla_ping:
+            raise RuntimeError("conexión perdida")
+
+    def close(self):
+        self.cerrada = True
+
+
+class BaseFalsa:
+    # base["fragmento de SQL"] = filas, o una función (sql, params, cursor)
+    # que devuelve las filas y puede fijar rowcount / lastrowid
+
+    def __init__(self):
+        self.respuestas = {}
+        self.conexiones = []
+
+    def __setitem__(self, fragmento, respuesta):
+        self.respuestas[fragmento] = respuesta
+
+    def responder(self, sql, params, cursor):
+        for fragmento, respuesta in self.respuestas.items():
+            if fragmento in sql:
+                return respuesta(sql, params, cursor) if callable(respuesta) else respuesta
+        return []
+
+    def conectar(self):
+        conexion = ConexionFalsa(self)
+        self.conexiones.append(conexion)
+        return conexion
+
+    @property
+    def ejecutadas(self):
+        return [sentencia for conexion in self.conexiones for sentencia in conexion.ejecutadas]
+
+    def buscar(self, fragmento):
+        return [(sql, params) for sql, params in self.ejecutadas if fragmento in sql]
+
+
+@pytest.fixture
+def app():
+    return aplicacion
+
+
+@pytest.fixture
+def base_falsa(monkeypatch):
+    # Cada prueba con su propia base y un pool vacío que se conecta a ella
+    base = BaseFalsa()
+    monkeypatch.setattr(aplicacion, "get_connection", base.conectar)
+    monkeypatch.setattr(aplicacion, "pool_db", aplicacion.PoolConexiones(2, 0.2, 60, 30))
+    return base
+
+
+@pytest.fixture
+def cliente(base_falsa):
+    return aplicacion.app.test_client()
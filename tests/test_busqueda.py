@@ -0,0 +1,104 @@
+import pytest
+
+
+@pytest.fixture
+def indice(app, base_falsa):
+    base_falsa["FROM productos"] = [
+        {"id": 1, "nombre": "Camisa Oxford"},
+        {"id": 2, "nombre": "camisa  oxford"},
+        {"id": 3, "nombre": "Pantalón Cargo"},
+        {"id": 4, "nombre": "Overol Antifluido"},
+    ]
+    base_falsa["FROM estilos"] = [{"id": 10, "nombre": "Clásico"}]
+    base_falsa["FROM marcas"] = [{"id": 20, "nombre": "Camisería Andina"}]
+    return app.IndiceBusqueda()
+
+
+def nombres(resultados):
+    return [(r["tipo"], r["nombre"]) for r in resultados]
+
+
+def test_normalizar_quita_tildes_mayusculas_y_espacios(app):
+    assert app.normalizar_busqueda("  Pantalón   CARGO ") == "pantalon cargo"
+    assert app.normalizar_busqueda(None) == ""
+
+
+def test_agrupa_nombres_iguales_con_sus_ids(indice, app):
+    resultados = indice.buscar("camisa oxford", ["producto"], 10)
+    assert len(resultados) == 1
+    assert resultados[0]["ids"] == [1, 2]
+    assert resultados[0]["puntaje"] == app.PUNTAJE_EXACTO
+
+
+def test_prefijo_sin_tildes_y_por_tipo(indice, app):
+    resultados = indice.buscar("pantalon", list(app.CONSULTAS_BUSQUEDA), 10)
+    assert nombres(resultados) == [("producto", "Pantalón Cargo")]
+
+    resultados = indice.buscar("clasi", ["estilo"], 10)
+    assert nombres(resultados) == [("estilo", "Clásico")]
+    assert indice.buscar("clasi", ["producto"], 10) == []
+
+
+def test_palabras_en_cualquier_orden(indice):
+    resultados = indice.buscar("oxford cami", ["producto"], 10)
+    assert nombres(resultados) == [("producto", "Camisa Oxford")]
+
+
+def test_nombre_completo_antes_que_palabra(indice, app):
+    resultados = indice.buscar("cami", list(app.CONSULTAS_BUSQUEDA), 10)
+    assert [r["puntaje"] for r in resultados] == [app.PUNTAJE_PREFIJO_NOMBRE] * 2
+    assert {r["tipo"] for r in resultados} == {"producto", "marca"}
+
+
+def test_tolera_errores_de_tipeo(indice):
+    resultados = indice.buscar("antifluydo", ["producto"], 10)
+    assert nombres(resultados) == [("producto", "Overol Antifluido")]
+    assert 0 < resultados[0]["puntaje"] < 1
+
+
+def test_limite(indice, app):
+    assert len(indice.buscar("c", list(app.CONSULTAS_BUSQUEDA), 1)) == 1
+
+
+def test_actualizar_agrega_y_quita(indice):
+    indice.buscar("camisa", ["producto"], 10)
+
+    indice.actualizar(agregar=[("producto", 5, "Chaqueta Térmica")])
+    assert nombres(indice.buscar("chaqueta", ["producto"], 10)) == [("producto", "Chaqueta Térmica")]
+
+    indice.actualizar(quitar=[("producto", 5), ("producto", 1)])
+    assert indice.buscar("chaqueta", ["producto"], 10) == []
+    assert indice.buscar("camisa oxford", ["producto"], 10)[0]["ids"] == [2]
+
+
+def test_actualizar_cambia_la_version_con_el_lock(indice, app, monkeypatch):
+    indice.buscar("camisa", ["producto"], 10)
+    original = app.versiones_datos.incrementar_desde
+    con_lock = []
+
+    def incrementar_desde(nombre):
+        con_lock.append(indice._lock.locked())
+        return original(nombre)
+
+    monkeypatch.setattr(app.versiones_datos, "incrementar_desde", incrementar_desde)
+    indice.actualizar(agregar=[("producto", 5, "Chaqueta")])
+
+    assert con_lock == [True]
+    assert indice._version == app.versiones_datos.actual(app.VERSION_BUSQUEDA)
+
+
+def test_actualizar_con_error_fuerza_reconstruir(indice, app, base_falsa, monkeypatch):
+    indice.buscar("camisa", ["producto"], 10)
+
+    def fallar(nombre):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(app.versiones_datos, "incrementar_desde", fallar)
+    indice.actualizar(agregar=[("producto", 5, "Chaqueta")])
+
+    assert indice._version is None
+    assert not indice._lock.locked()
+    lecturas = len(base_falsa.buscar("FROM productos"))
+    indice._verificado = 0
+    indice.buscar("camisa", ["producto"], 10)
+    assert len(base_falsa.buscar("FROM productos")) == lecturas + 1
@@ -0,0 +1,109 @@
+import gzip
+import json
+import zlib
+
+import pytest
+from flask import Response, g
+
+CUERPO = json.dumps([{"id_variante": i, "nomproducto": f"Camisa {i}"} for i in range(200)])
+
+
+def respuesta(cuerpo=CUERPO, mimetype="application/json", status=200, etag=None):
+    response = Response(cuerpo, status=status, mimetype=mimetype)
+    if etag:
+        response.set_etag(etag)
+    return response
+
+
+@pytest.fixture
+def peticion(app):
+    def crear(encoding=None):
+        headers = {"Accept-Encoding": encoding} if encoding is not None else {}
+        return app.app.test_request_context("/", headers=headers)
+    return crear
+
+
+@pytest.mark.parametrize("encoding, esperada", [
+    (None, None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, deflate", "gzip"),
+    ("gzip;q=0", None),
+    ("br;q=0.5, gzip", "gzip"),
+])
+def test_elegir_codificacion(app, peticion, encoding, esperada):
+    with peticion(encoding):
+        assert app.elegir_codificacion() == esperada
+
+
+@pytest.mark.parametrize("brotli_instalado", [True, False])
+def test_brotli_solo_si_esta_instalado(app, peticion, monkeypatch, brotli_instalado):
+    monkeypatch.setattr(app, "brotli", object() if brotli_instalado else None)
+    with peticion("gzip, br"):
+        assert app.elegir_codificacion() == ("br" if brotli_instalado else "gzip")
+
+
+def test_comprime_con_gzip_y_debilita_etag(app, peticion):
+    with peticion("gzip"):
+        response = app.comprimir_respuesta(respuesta(etag="catalogo-1"))
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.vary
+    assert response.get_etag() == ("catalogo-1", True)
+    assert gzip.decompress(response.get_data()).decode("utf-8") == CUERPO
+
+
+def test_sin_accept_encoding_no_cambia(app, peticion):
+    with peticion():
+        response = app.comprimir_respuesta(respuesta(etag="catalogo-1"))
+
+    assert "Content-Encoding" not in response.headers
+    assert "Accept-Encoding" in response.vary
+    assert response.get_etag() == ("catalogo-1", False)
+    assert response.get_data(as_text=True) == CUERPO
+
+
+@pytest.mark.parametrize("response", [
+    respuesta(cuerpo='{"ok": true}'),
+    respuesta(mimetype="application/pdf"),
+    respuesta(status=204, cuerpo=""),
+])
+def test_no_comprime_pequenos_ni_binarios(app, peticion, response):
+    with peticion("gzip"):
+        assert "Content-Encoding" not in app.comprimir_respuesta(response).headers
+
+
+def test_304_lleva_el_etag_debil(app, peticion):
+    with peticion("gzip"):
+        response = app.comprimir_respuesta(respuesta(cuerpo="", status=304, etag="catalogo-1"))
+
+    assert response.status_code == 304
+    assert response.get_etag() == ("catalogo-1", True)
+
+
+def test_streaming(app, peticion):
+    partes = [CUERPO[i:i + 500] for i in range(0, len(CUERPO), 500)]
+    with peticion("gzip"):
+        response = app.comprimir_respuesta(respuesta(cuerpo=iter(partes)))
+        comprimido = b"".join(response.response)
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert zlib.decompress(comprimido, 31).decode("utf-8") == CUERPO
+
+
+def test_cache_solo_para_respuestas_cacheables(app, peticion, monkeypatch):
+    cache = app.CacheBytes(1024 * 1024)
+    monkeypatch.setattr(app, "cache_comprimidos", cache)
+
+    with peticion("gzip"):
+        app.comprimir_respuesta(respuesta())
+    assert len(cache._datos) == 0
+
+    with peticion("gzip"):
+        app.comprimir_respuesta(respuesta(etag="catalogo-1"))
+    assert len(cache._datos) == 1
+
+    with peticion("gzip"):
+        g.respuesta_cacheable = True
+        app.comprimir_respuesta(respuesta(cuerpo=CUERPO + " "))
+    assert len(cache._datos) == 2
@@ -0,0 +1,86 @@
+import queue
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def envios(app, monkeypatch):
+    # envios["fallos"][email] = cuántas veces falla antes de enviarse
+    envios = {"fallos": {}, "intentos": [], "enviados": [], "sesiones": set()}
+    lock = threading.Lock()
+
+    def enviar(email, token, sesion=None):
+        with lock:
+            envios["intentos"].append(email)
+            envios["sesiones"].add(id(sesion))
+            if envios["fallos"].get(email, 0) > 0:
+                envios["fallos"][email] -= 1
+                raise RuntimeError("SMTP caído")
+            envios["enviados"].append((email, token))
+
+    monkeypatch.setattr(app, "enviar_correo", enviar)
+    return envios
+
+
+def test_envia_en_segundo_plano(app, envios):
+    cola = app.ColaCorreos(reintentos=3, backoff=0.01, max_pendientes=10)
+    cola.encolar("a@x.com", "t1")
+    cola.encolar("b@x.com", "t2")
+    cola.esperar_pendientes(2)
+
+    assert envios["enviados"] == [("a@x.com", "t1"), ("b@x.com", "t2")]
+    # una sola sesión HTTP reutilizada por el hilo
+    assert len(envios["sesiones"]) == 1
+
+
+def test_reintenta_sin_bloquear_los_demas(app, envios):
+    envios["fallos"]["a@x.com"] = 2
+    cola = app.ColaCorreos(reintentos=3, backoff=0.2, max_pendientes=10)
+    cola.encolar("a@x.com", "t1")
+    cola.encolar("b@x.com", "t2")
+
+    for _ in range(100):
+        if len(envios["enviados"]) == 2:
+            break
+        time.sleep(0.02)
+
+    # b sale mientras a espera su reintento
+    assert envios["enviados"] == [("b@x.com", "t2"), ("a@x.com", "t1")]
+    assert envios["intentos"].count("a@x.com") == 3
+
+
+def test_se_rinde_tras_los_reintentos(app, envios):
+    envios["fallos"]["a@x.com"] = 10
+    cola = app.ColaCorreos(reintentos=2, backoff=0.01, max_pendientes=10)
+    cola.encolar("a@x.com", "t1")
+
+    for _ in range(50):
+        time.sleep(0.02)
+        if len(envios["intentos"]) >= 2:
+            break
+    time.sleep(0.1)
+
+    assert envios["intentos"] == ["a@x.com", "a@x.com"]
+    assert not envios["enviados"]
+
+
+def test_cola_llena(app, envios, monkeypatch):
+    cola = app.ColaCorreos(reintentos=1, backoff=0.01, max_pendientes=1)
+    monkeypatch.setattr(cola, "_asegurar_hilo", lambda: None)
+    cola.encolar("a@x.com", "t1")
+
+    with pytest.raises(queue.Full):
+        cola.encolar("b@x.com", "t2")
+
+
+def test_tras_fork_arranca_vacia(app, envios, monkeypatch):
+    cola = app.ColaCorreos(reintentos=1, backoff=0.01, max_pendientes=10)
+    monkeypatch.setattr(cola, "_asegurar_hilo", lambda: None)
+    cola.encolar("a@x.com", "t1")
+
+    cola.reiniciar_tras_fork()
+
+    assert cola._cola.qsize() == 0 and cola._hilo is None
+    cola.esperar_pendientes(0.1)
@@ -0,0 +1,74 @@
+import pytest
+
+
+@pytest.fixture
+def stock(base_falsa):
+    stock = {10: 5, 20: 0}
+    base_falsa["FOR UPDATE"] = lambda sql, params, cursor: [
+        {"id_variante": i, "stock": stock[i]} for i in params if i in stock
+    ]
+    return stock
+
+
+def entrada(cliente, *items):
+    return cliente.post("/EntradaStockLote", json={"items": [
+        {"id_variante": id_variante, "cantidad": cantidad} for id_variante, cantidad in items
+    ]})
+
+
+def test_lote_en_tres_sentencias(cliente, base_falsa, stock):
+    response = entrada(cliente, (20, 3), (10, 1), (20, 2))
+
+    assert response.get_json() == {"ok": True, "lineas": 3}
+    select, update, insert = base_falsa.ejecutadas
+    assert select[1] == [10, 20]
+    # una variante repetida se suma una sola vez en el CASE
+    assert "CASE id_variante" in update[0]
+    assert update[1] == [20, 5, 10, 1, 10, 20]
+    # los movimientos encadenan el stock en el orden del pedido
+    assert insert[1] == [(20, 3, 0, 3), (10, 1, 5, 6), (20, 2, 3, 5)]
+    assert base_falsa.conexiones[0].commits == 1
+
+
+def test_variante_inexistente_no_escribe(cliente, base_falsa, stock):
+    response = entrada(cliente, (10, 1), (99, 1), (98, 2))
+
+    assert response.status_code == 404
+    assert response.get_json()["ids"] == [98, 99]
+    assert len(base_falsa.ejecutadas) == 1
+    assert base_falsa.conexiones[0].rollbacks >= 1
+
+
+@pytest.mark.parametrize("item, error", [
+    ({"id_variante": 10}, "Datos incompletos"),
+    ({"id_variante": "x", "cantidad": 1}, "Variante inválida"),
+    ({"id_variante": 10, "cantidad": -2}, "Cantidad inválida"),
+])
+def test_lote_valida_antes_de_conectar(cliente, base_falsa, item, error):
+    response = cliente.post("/EntradaStockLote", json={"items": [item]})
+
+    assert response.status_code == 400
+    assert response.get_json()["error"] == error
+    assert not base_falsa.conexiones
+
+
+def test_entrada_individual(cliente, base_falsa, stock):
+    response = cliente.post("/EntradaStock", json={"id_variante": "10", "cantidad": 4})
+
+    assert response.get_json() == {"ok": True}
+    _, movimientos = base_falsa.buscar("INSERT INTO movimientos_inventario")[0]
+    assert movimientos == [(10, 4, 5, 9)]
+
+
+@pytest.mark.parametrize("ruta, cuerpo", [
+    ("/EntradaStockLote", [1, 2]),
+    ("/EntradaStockLote", {"items": ["10"]}),
+    ("/EntradaStock", [10, 1]),
+    ("/EntradaStock", "10"),
+])
+def test_json_que_no_es_objeto(cliente, base_falsa, ruta, cuerpo):
+    response = cliente.post(ruta, json=cuerpo)
+
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Datos incompletos"
+    assert not base_falsa.conexiones
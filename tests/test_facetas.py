@@ -0,0 +1,71 @@
+import pytest
+
+
+# id_variante, id_producto, nomproducto, categoria, genero, marca, estilo,
+# color, talla, precio, stock
+FILAS = [
+    (1, 1, "Camisa", "Camisas", "Hombre", "Andina", None, "Azul", "M", 35000, 4),
+    (2, 1, "Camisa", "Camisas", "Hombre", "Andina", None, "Azul", "L", 35000, 0),
+    (3, 1, "Camisa", "Camisas", "Hombre", "Andina", None, "Negro", "M", 35000, 2),
+    (4, 2, "Bota", "Botas", "Mujer", None, "Clásico", "Negro", "38", 89000, 1),
+    (5, 3, "Gorra", "Gorras", "Unisex", "Andina", None, "Blanco", "U", 18000, 0),
+]
+
+
+@pytest.fixture
+def indice(app, base_falsa):
+    base_falsa["FROM variantes v"] = FILAS
+    return app.IndiceFacetas()
+
+
+def ids(data):
+    return [item["id_variante"] for item in data["items"]]
+
+
+def test_posiciones_bits(app):
+    assert list(app.posiciones_bits(0)) == []
+    assert list(app.posiciones_bits(0b101001)) == [0, 3, 5]
+    assert list(app.posiciones_bits(1 << 200)) == [200]
+
+
+def test_sin_filtros(indice):
+    _, data = indice.consultar({}, False, 0, 100)
+    assert data["total"] == 5
+    assert ids(data) == [1, 2, 3, 4, 5]
+    assert data["facetas"]["categoria"] == {"Camisas": 3, "Botas": 1, "Gorras": 1}
+    assert data["facetas"]["estilo"] == {"Clásico": 1}
+
+
+def test_or_dentro_de_faceta_y_and_entre_facetas(indice):
+    _, data = indice.consultar({"color": ["Azul", "Negro"], "talla": ["M"]}, False, 0, 100)
+    assert ids(data) == [1, 3]
+
+
+def test_conteos_ignoran_la_propia_faceta(indice):
+    _, data = indice.consultar({"categoria": ["Camisas"]}, False, 0, 100)
+    assert data["total"] == 3
+    # las otras categorías siguen visibles con su conteo
+    assert data["facetas"]["categoria"] == {"Camisas": 3, "Botas": 1, "Gorras": 1}
+    assert data["facetas"]["color"] == {"Azul": 2, "Negro": 1}
+
+
+def test_valores_sin_distinguir_mayusculas_y_pedidos_inexistentes(indice):
+    _, data = indice.consultar({"color": ["azul ", "Rosado"]}, False, 0, 100)
+    assert ids(data) == [1, 2]
+    assert data["facetas"]["color"]["Rosado"] == 0
+
+
+def test_en_stock(indice):
+    _, data = indice.consultar({}, True, 0, 100)
+    assert ids(data) == [1, 3, 4]
+    assert data["facetas"]["categoria"] == {"Camisas": 2, "Botas": 1}
+
+
+def test_paginacion_y_columnar(indice, app):
+    _, data = indice.consultar({}, False, 1, 2)
+    assert data["total"] == 5
+    assert ids(data) == [2, 3]
+
+    _, data = indice.consultar({}, False, 1, 2, columnar=True)
+    assert data["columns"] == list(app.COLUMNAS_FACETAS)
+    assert data["rows"] == [FILAS[1], FILAS[2]]
@@ -0,0 +1,270 @@
+import io
+
+import pytest
+
+
+class Catalogo:
+    # Tablas mínimas para ImportadorProductos: lo insertado se puede releer
+
+    def __init__(self, base):
+        self.categorias = [{"id": 1, "nombre": "Camisas", "id_estado": 1}]
+        self.generos = [{"id": 2, "nombre": "Hombre", "id_estado": 1}]
+        self.colores = [{"id": 3, "nombre": "Azul", "id_estado": 1}]
+        self.marcas = []
+        self.estilos = []
+        self.tallas = [{"id_talla": 7, "valor": "M", "id_categoria": 1, "id_genero": 2, "id_estado": 1}]
+        self.productos = []
+        self.variantes = []
+        self.falla_variantes = False
+
+        base["INSERT INTO colores"] = self._insertar(self.colores)
+        base["INSERT INTO marcas"] = self._insertar(self.marcas)
+        base["INSERT INTO estilos"] = self._insertar(self.estilos)
+        base["FROM colores"] = self._leer(self.colores)
+        base["FROM marcas"] = self._leer(self.marcas)
+        base["FROM estilos"] = self._leer(self.estilos)
+        base["FROM categorias"] = self._leer(self.categorias)
+        base["FROM generos"] = self._leer(self.generos)
+        base["INSERT INTO tallas"] = self._insertar_tallas
+        base["FROM tallas"] = self._leer_tallas
+        base["INSERT INTO productos"] = self._insertar_productos
+        base["FROM productos"] = lambda sql, params, cursor: [dict(p) for p in self.productos]
+        base["INSERT INTO variantes"] = self._insertar_variantes
+
+    @staticmethod
+    def _insertar(tabla):
+        def responder(sql, filas, cursor):
+            for fila in filas:
+                tabla.append({"id": 100 + len(tabla), "nombre": fila[0], "id_estado": fila[-1]})
+            return []
+        return responder
+
+    @staticmethod
+    def _leer(tabla):
+        def responder(sql, params, cursor):
+            filas = [f for f in tabla if f["id_estado"] == 1 or "id_estado = 1" not in sql]
+            if params:
+                filas = [f for f in filas if f["nombre"] in params]
+            return [{"id": f["id"], "nombre": f["nombre"]} for f in filas]
+        return responder
+
+    def _insertar_tallas(self, sql, filas, cursor):
+        for valor, id_categoria, id_genero, estado in filas:
+            self.tallas.append({
+                "id_talla": 100 + len(self.tallas), "valor": valor,
+                "id_categoria": id_categoria, "id_genero": id_genero, "id_estado": estado
+            })
+        return []
+
+    def _leer_tallas(self, sql, params, cursor):
+        filas = self.tallas
+        if params:
+            id_categoria, id_genero, *valores = params
+            filas = [
+                t for t in filas
+                if (t["id_categoria"], t["id_genero"]) == (id_categoria, id_genero) and t["valor"] in valores
+            ]
+        return [{k: t[k] for k in ("id_talla", "valor", "id_categoria", "id_genero")} for t in filas]
+
+    def _insertar_productos(self, sql, filas, cursor):
+        for nombre, id_marca, id_estilo, id_categoria, id_genero, estado in filas:
+            self.productos.append({
+                "id_producto": 500 + len(self.productos), "nombre": nombre,
+                "id_categoria": id_categoria, "id_genero": id_genero,
+                "id_marca": id_marca, "id_estilo": id_estilo, "id_estado": estado
+            })
+        return []
+
+    def _insertar_variantes(self, sql, filas, cursor):
+        if self.falla_variantes:
+            raise RuntimeError("Deadlock found")
+        self.variantes.extend(filas)
+        return []
+
+
+@pytest.fixture
+def catalogo(base_falsa):
+    return Catalogo(base_falsa)
+
+
+def importar(cliente, cuerpo, tipo="text/csv", query=""):
+    return cliente.post(f"/ImportarProductos{query}", data=cuerpo.encode("utf-8"), content_type=tipo)
+
+
+CSV = (
+    "﻿Nombre;Categoria;Genero;Color;Talla;Precio;Stock;Marca\n"
+    "Camisa Oxford;camisas;Hombre;Azul;M;35000;10;Andina\n"
+    "Camisa Oxford;Camisas;Hombre;Verde;L;35000;4;Andina\n"
+)
+
+
+def test_leer_filas_csv(app):
+    filas = list(app.leer_filas_importacion(io.BytesIO(CSV.encode("utf-8")), "csv"))
+
+    assert [numero for numero, _, _ in filas] == [2, 3]
+    assert filas[0][1]["nombre"] == "Camisa Oxford"
+    assert filas[1][1]["color"] == "Verde"
+
+
+def test_leer_filas_ndjson(app):
+    texto = '{"nombre": "a"}\n\nno es json\n[1, 2]\n'
+    filas = list(app.leer_filas_importacion(io.BytesIO(texto.encode("utf-8")), "ndjson"))
+
+    assert filas == [
+        (1, {"nombre": "a"}, None),
+        (3, None, "JSON inválido"),
+        (4, None, "Se esperaba un objeto JSON"),
+    ]
+
+
+def test_importa_y_crea_lo_que_falta(cliente, base_falsa, catalogo):
+    data = importar(cliente, CSV).get_json()
+
+    assert data == {"ok": True, "importadas": 2, "total_errores": 0, "errores": []}
+    assert [c["nombre"] for c in catalogo.colores] == ["Azul", "Verde"]
+    assert [m["nombre"] for m in catalogo.marcas] == ["Andina"]
+    assert [t["valor"] for t in catalogo.tallas] == ["M", "L"]
+    # las dos filas son el mismo producto
+    assert len(catalogo.productos) == 1
+    assert [v[1:4] for v in catalogo.variantes] == [(500, 3, 7), (500, 101, 101)]
+
+
+def test_errores_por_fila(cliente, catalogo):
+    cuerpo = (
+        "nombre,categoria,genero,talla,precio,stock\n"
+        "Camisa,Camisas,Hombre,M,100,1\n"
+        ",Camisas,Hombre,M,100,1\n"
+        "Camisa,Botas,Hombre,M,100,1\n"
+        "Camisa,Camisas,Hombre,M,-1,1\n"
+        "Camisa,Camisas,Hombre,,100,1\n"
+    )
+    data = importar(cliente, cuerpo).get_json()
+
+    assert data["ok"] is False
+    assert data["importadas"] == 1
+    assert data["errores"] == [
+        {"fila": 3, "error": "Nombre requerido"},
+        {"fila": 4, "error": "Valor inválido para categoria: Botas"},
+        {"fila": 5, "error": "Precio o stock inválido"},
+        {"fila": 6, "error": "Talla requerida"},
+    ]
+
+
+def test_confirma_por_lotes(app, cliente, base_falsa, catalogo, monkeypatch):
+    monkeypatch.setattr(app, "IMPORT_LOTE", 2)
+    filas = "".join(
+        f'{{"nombre": "Camisa {i}", "id_categoria": 1, "id_genero": 2, "talla": "M", "precio": 1, "stock": 1}}\n'
+        for i in range(5)
+    )
+    data = importar(cliente, filas, tipo="application/x-ndjson").get_json()
+
+    assert data["importadas"] == 5
+    assert base_falsa.conexiones[0].commits == 3
+    assert len(base_falsa.buscar("INSERT INTO variantes")) == 3
+
+
+def test_lote_fallido_se_reporta_por_fila(cliente, base_falsa, catalogo):
+    catalogo.falla_variantes = True
+    data = importar(cliente, CSV).get_json()
+
+    assert data["importadas"] == 0
+    assert data["errores"] == [
+        {"fila": 2, "error": "Error guardando lote: Deadlock found"},
+        {"fila": 3, "error": "Error guardando lote: Deadlock found"},
+    ]
+    assert base_falsa.conexiones[0].rollbacks >= 1
+
+
+def test_no_mapea_inactivos_con_el_mismo_nombre(cliente, catalogo):
+    catalogo.colores.append({"id": 9, "nombre": "Verde", "id_estado": 0})
+    importar(cliente, CSV)
+
+    # El color inactivo no se reutiliza: se crea uno nuevo y se usa ese
+    nuevo = catalogo.colores[-1]
+    assert nuevo["nombre"] == "Verde" and nuevo["id_estado"] == 1
+    assert catalogo.variantes[1][2] == nuevo["id"]
+
+
+def test_formato_no_soportado(cliente, catalogo):
+    response = importar(cliente, "x", query="?format=xlsx")
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("precio, stock", [
+    ("nan", "1"),
+    ("inf", "1"),
+    ("100", "inf"),
+    ("100", "-Infinity"),
+    ("100", "1e400"),
+])
+def test_precio_o_stock_no_finito(cliente, catalogo, precio, stock):
+    cuerpo = f"nombre,categoria,genero,talla,precio,stock\nCamisa,Camisas,Hombre,M,{precio},{stock}\n"
+    response = importar(cliente, cuerpo)
+
+    assert response.status_code == 200
+    assert response.get_json()["errores"] == [{"fila": 2, "error": "Precio o stock inválido"}]
+    assert not catalogo.variantes
+
+
+def test_ids_no_finitos_en_ndjson(cliente, catalogo):
+    # json.loads convierte 1e400 en inf
+    filas = (
+        '{"nombre": "a", "id_categoria": 1e400, "id_genero": 2, "talla": "M", "precio": 1, "stock": 1}\n'
+        '{"nombre": "a", "id_categoria": 1, "id_genero": 2, "id_color": 1e400, "talla": "M", "precio": 1, "stock": 1}\n'
+    )
+    data = importar(cliente, filas, tipo="application/x-ndjson").get_json()
+
+    assert data["errores"] == [
+        {"fila": 1, "error": "Valor inválido para id_categoria: inf"},
+        {"fila": 2, "error": "Color inválido"},
+    ]
+
+
+def test_id_inexistente_se_reporta(cliente, catalogo):
+    catalogo.generos.append({"id": 4, "nombre": "Mujer", "id_estado": 0})
+    filas = (
+        '{"nombre": "a", "id_categoria": 99, "id_genero": 2, "talla": "M", "precio": 1, "stock": 1}\n'
+        '{"nombre": "a", "id_categoria": 1, "id_genero": 4, "talla": "M", "precio": 1, "stock": 1}\n'
+        '{"nombre": "a", "id_categoria": "1", "id_genero": 2, "talla": "M", "precio": 1, "stock": 1}\n'
+    )
+    data = importar(cliente, filas, tipo="application/x-ndjson").get_json()
+
+    assert data["importadas"] == 1
+    assert data["errores"] == [
+        {"fila": 1, "error": "Valor inválido para id_categoria: 99"},
+        {"fila": 2, "error": "Valor inválido para id_genero: 4"},
+    ]
+    assert catalogo.productos[0]["id_categoria"] == 1
+
+
+NDJSON = '{"nombre": "a", "id_categoria": 1, "id_genero": 2, "talla": "M", "precio": 1, "stock": 1}\n'
+
+
+@pytest.mark.parametrize("nombre, tipo, esperado", [
+    ("productos.ndjson", "application/octet-stream", "ndjson"),
+    ("productos.JSONL", None, "ndjson"),
+    ("productos.csv", "application/json", "csv"),
+    (None, "application/x-ndjson", "ndjson"),
+    ("productos", "text/plain", "csv"),
+])
+def test_formato_importacion(app, nombre, tipo, esperado):
+    assert app.formato_importacion(nombre, tipo) == esperado
+
+
+def test_multipart_usa_el_nombre_del_archivo(cliente, catalogo):
+    response = cliente.post("/ImportarProductos", data={
+        "archivo": (io.BytesIO(NDJSON.encode("utf-8")), "productos.jsonl", "application/octet-stream")
+    }, content_type="multipart/form-data")
+
+    assert response.get_json()["importadas"] == 1
+
+
+def test_multipart_sin_archivo(cliente, catalogo):
+    response = cliente.post("/ImportarProductos", data={"x": "1"}, content_type="multipart/form-data")
+    assert response.status_code == 400
+
+
+def test_cuerpo_crudo_no_se_consume_como_formulario(cliente, catalogo):
+    # Con este content type, request.files parsearía el cuerpo como formulario
+    response = importar(cliente, CSV, tipo="application/x-www-form-urlencoded")
+    assert response.get_json()["importadas"] == 2
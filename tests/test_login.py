@@ -0,0 +1,28 @@
+import pytest
+
+
+@pytest.fixture
+def usuarios(app, base_falsa):
+    hash_clave = app.bcrypt.generate_password_hash("secreta", 4).decode("utf-8")
+    base_falsa["FROM usuarios"] = lambda sql, params, cursor: (
+        [{"idUsuario": 1, "password": hash_clave}] if params == ("ana",) else []
+    )
+
+
+def test_login_correcto(cliente, usuarios):
+    response = cliente.post("/Login", json={"usuario": "ana", "password": "secreta"})
+
+    assert response.status_code == 200
+    assert cliente.get("/CheckSession").get_json() == {"ok": True, "usuario": "ana"}
+
+
+def test_credenciales_invalidas_siempre_401(cliente, usuarios):
+    for _ in range(5):
+        response = cliente.post("/Login", json={"usuario": "ana", "password": "otra"})
+        assert response.status_code == 401
+
+    assert cliente.post("/Login", json={"usuario": "ana", "password": "secreta"}).status_code == 200
+
+
+def test_login_incompleto(cliente, usuarios):
+    assert cliente.post("/Login", json={"usuario": "ana"}).status_code == 400
@@ -0,0 +1,171 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def metricas(app, tmp_path):
+    return app.MetricasProceso(str(tmp_path), intervalo=60)
+
+
+def escribir_otro_worker(directorio, nombre, contadores=(), histogramas=(), consultas=(), lentas=()):
+    datos = {
+        "contadores": [list(c) for c in contadores],
+        "histogramas": [list(h) for h in histogramas],
+        "consultas": [list(c) for c in consultas],
+        "lentas": list(lentas),
+    }
+    (directorio / nombre).write_text(json.dumps(datos), encoding="utf-8")
+
+
+def archivos(directorio):
+    return sorted(p.name for p in directorio.iterdir() if p.name.endswith(".json"))
+
+
+def test_contar_y_observar(app, metricas):
+    etiquetas = (("ruta", "/GetProductos"),)
+    metricas.contar("http_requests_total", etiquetas)
+    metricas.contar("http_requests_total", etiquetas, 2)
+    metricas.observar("http_request_duration_seconds", etiquetas, 0.02)
+    metricas.observar("http_request_duration_seconds", etiquetas, 100)
+
+    contadores, histogramas = metricas.agregadas()
+    assert contadores[("http_requests_total", etiquetas)] == 3
+    cubetas = histogramas[("http_request_duration_seconds", etiquetas)]
+    assert cubetas[app.BUCKETS_SEGUNDOS.index(0.025)] == 1
+    # la penúltima es +Inf y la última la suma
+    assert cubetas[-2] == 1 and cubetas[-1] == 100.02
+
+
+def test_volcar_respeta_el_intervalo(metricas, tmp_path):
+    metricas.volcar()
+    assert archivos(tmp_path) == []
+
+    metricas.contar("http_requests_total")
+    metricas.volcar()
+    assert archivos(tmp_path) == []
+
+    metricas.volcar(forzar=True)
+    assert len(archivos(tmp_path)) == 1
+
+
+def test_suma_los_demas_workers_sin_contarse_dos_veces(metricas, tmp_path):
+    etiquetas = [["ruta", "/x"]]
+    metricas.contar("http_requests_total", (("ruta", "/x"),), 2)
+    metricas.volcar(forzar=True)
+    escribir_otro_worker(tmp_path, f"{os.getppid()}.json", contadores=[["http_requests_total", etiquetas, 5]])
+
+    contadores, _ = metricas.agregadas()
+    assert contadores[("http_requests_total", (("ruta", "/x"),))] == 7
+
+
+def test_ignora_histogramas_con_otras_cubetas(metricas, tmp_path):
+    escribir_otro_worker(tmp_path, f"{os.getppid()}.json", histogramas=[
+        ["http_request_duration_seconds", [], [1, 2, 3]],
+        ["metrica_retirada", [], [1]],
+    ])
+
+    _, histogramas = metricas.agregadas()
+    assert histogramas == {}
+
+
+def test_archivos_ilegibles_no_rompen(metricas, tmp_path):
+    (tmp_path / f"{os.getppid()}.json").write_text("{no es json")
+    metricas.contar("http_requests_total")
+
+    contadores, _ = metricas.agregadas()
+    assert contadores[("http_requests_total", ())] == 1
+
+
+def test_consultas_agregadas(app, metricas, tmp_path):
+    metricas.registrar_consulta("SELECT ?", 0.5, 10, "SELECT 1")
+    metricas.registrar_lenta({"fecha": "2026-01-02T00:00:00", "huella": "SELECT ?"})
+    escribir_otro_worker(
+        tmp_path, f"{os.getppid()}.json",
+        consultas=[["SELECT ?", 3, 0.3, 0.2, 6, "SELECT 2"]],
+        lentas=[{"fecha": "2026-01-03T00:00:00", "huella": "SELECT ?"}]
+    )
+
+    consultas, lentas = metricas.consultas_agregadas()
+    assert consultas["SELECT ?"] == [4, 0.8, 0.5, 16, "SELECT 1"]
+    assert [lenta["fecha"][:10] for lenta in lentas] == ["2026-01-03", "2026-01-02"]
+
+
+def test_tras_fork_arranca_en_cero(metricas):
+    metricas.contar("http_requests_total")
+    metricas.reiniciar_tras_fork()
+
+    assert metricas.instantanea()["contadores"] == []
+
+
+def test_endpoint_metrics(app, cliente, monkeypatch, metricas):
+    monkeypatch.setattr(app, "metricas", metricas)
+    metricas.contar("http_requests_total", (("metodo", "GET"), ("ruta", "/x"), ("estado", "200")))
+
+    texto = cliente.get("/metrics").get_data(as_text=True)
+    assert '# TYPE http_requests_total counter' in texto
+    assert 'http_requests_total{metodo="GET",ruta="/x",estado="200"} 1' in texto
+
+    monkeypatch.setattr(app, "METRICAS_TOKEN", "secreto")
+    assert cliente.get("/metrics").status_code == 401
+    assert cliente.get("/metrics", headers={"Authorization": "Bearer secreto"}).status_code == 200
+
+
+def pid_muerto():
+    proceso = subprocess.Popen([sys.executable, "-c", "pass"])
+    proceso.wait()
+    return proceso.pid
+
+
+def test_un_pid_reutilizado_no_pisa_el_archivo_anterior(metricas, tmp_path):
+    metricas.contar("http_requests_total")
+    metricas.volcar(forzar=True)
+    # mismo pid, otro proceso: como un worker nuevo que recibe un pid reciclado
+    metricas.reiniciar_tras_fork()
+    metricas.contar("http_requests_total")
+    metricas.volcar(forzar=True)
+
+    assert len(archivos(tmp_path)) == 2
+    contadores, _ = metricas.agregadas()
+    assert contadores[("http_requests_total", ())] == 2
+
+
+def test_consolida_los_workers_terminados(metricas, tmp_path):
+    contador = [["http_requests_total", [], 5]]
+    escribir_otro_worker(tmp_path, f"{pid_muerto()}-1.json", contadores=contador,
+                         consultas=[["SELECT ?", 1, 0.1, 0.1, 1, "SELECT 1"]])
+    escribir_otro_worker(tmp_path, f"{os.getppid()}-1.json", contadores=contador)
+    (tmp_path / f"{pid_muerto()}-2.json.7.tmp").write_text("{")
+
+    metricas.volcar(forzar=True)
+
+    # el vivo se conserva; el muerto y su temporal quedan sumados o borrados
+    assert archivos(tmp_path) == [f"{os.getppid()}-1.json", "terminados.json"]
+    assert not list(tmp_path.glob("*.tmp"))
+    contadores, _ = metricas.agregadas()
+    assert contadores[("http_requests_total", ())] == 10
+
+    # un segundo worker terminado se suma a lo ya consolidado
+    escribir_otro_worker(tmp_path, f"{pid_muerto()}-3.json", contadores=contador)
+    metricas.volcar(forzar=True)
+
+    contadores, _ = metricas.agregadas()
+    assert contadores[("http_requests_total", ())] == 15
+    consultas, _ = metricas.consultas_agregadas()
+    assert consultas["SELECT ?"][0] == 1
+    assert archivos(tmp_path) == [f"{os.getppid()}-1.json", "terminados.json"]
+
+
+@pytest.mark.parametrize("nombre, pid", [
+    ("123-1700000000.json", 123),
+    ("123.json", 123),
+    ("123-17.json.99.tmp", 123),
+    ("terminados.json", None),
+    ("terminados.json.5.tmp", None),
+    ("metricas.lock", None),
+])
+def test_pid_archivo_metricas(app, nombre, pid):
+    assert app.pid_archivo_metricas(nombre) == pid
@@ -0,0 +1,99 @@
+import pytest
+
+
+def nuevo_pool(app, tamano=2, timeout=0.1, vida_maxima=60, intervalo_ping=30):
+    return app.PoolConexiones(tamano, timeout, vida_maxima, intervalo_ping)
+
+
+def test_reutiliza_la_conexion_devuelta(app, base_falsa):
+    pool = nuevo_pool(app)
+    conn = pool.obtener()
+    pool.devolver(conn)
+
+    assert pool.obtener() is conn
+    assert len(base_falsa.conexiones) == 1
+    # la transacción implícita se cierra al devolverla
+    assert conn.rollbacks == 1
+
+
+def test_pool_agotado(app, base_falsa):
+    pool = nuevo_pool(app, tamano=1)
+    conn = pool.obtener()
+
+    with pytest.raises(app.ErrorConexionDB, match="agotado"):
+        pool.obtener()
+
+    pool.devolver(conn)
+    assert pool.obtener() is conn
+
+
+def test_error_al_conectar_libera_el_cupo(app, monkeypatch):
+    monkeypatch.setattr(app, "get_connection", lambda: None)
+    pool = nuevo_pool(app, tamano=1)
+
+    for _ in range(3):
+        with pytest.raises(app.ErrorConexionDB, match="No se pudo conectar"):
+            pool.obtener()
+
+
+def test_descarta_conexiones_vencidas(app, base_falsa):
+    pool = nuevo_pool(app, vida_maxima=0)
+    conn = pool.obtener()
+    pool.devolver(conn)
+
+    assert conn.cerrada
+    assert pool.obtener() is not conn
+
+
+def test_ping_tras_inactividad(app, base_falsa):
+    pool = nuevo_pool(app, intervalo_ping=0)
+    conn = pool.obtener()
+    pool.devolver(conn)
+
+    assert pool.obtener() is conn
+    assert conn.pings == 1
+
+    pool.devolver(conn)
+    conn.falla_ping = True
+    otra = pool.obtener()
+    assert otra is not conn
+    assert conn.cerrada
+
+
+def test_descartar_cierra_sin_reutilizar(app, base_falsa):
+    pool = nuevo_pool(app)
+    conn = pool.obtener()
+    pool.devolver(conn, descartar=True)
+
+    assert conn.cerrada
+    assert pool.obtener() is not conn
+
+
+def test_tras_fork_no_cierra_ni_reutiliza_las_heredadas(app, base_falsa):
+    pool = nuevo_pool(app, tamano=1)
+    libre = pool.obtener()
+    pool.devolver(libre)
+    prestada = pool.obtener()
+
+    pool.reiniciar_tras_fork()
+
+    # Cerrar enviaría COM_QUIT por el socket que sigue usando el padre
+    assert not libre.cerrada and not prestada.cerrada
+    nueva = pool.obtener()
+    assert nueva is not libre and nueva is not prestada
+
+    # Devolver una prestada antes del fork no toca el pool del hijo
+    pool.devolver(prestada)
+    assert not prestada.cerrada
+    with pytest.raises(app.ErrorConexionDB):
+        pool.obtener()
+
+
+def test_conexion_db_devuelve_la_conexion_ante_errores(app, base_falsa):
+    with pytest.raises(ValueError):
+        with app.conexion_db() as conn:
+            raise ValueError("falla en la ruta")
+
+    assert conn.rollbacks == 1
+    with app.conexion_db() as otra:
+        assert otra is conn
@@ -0,0 +1,84 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+
+
+def consulta(app, **args):
+    return app.construir_consulta_productos(MultiDict(args))
+
+
+def test_sin_parametros_devuelve_todas_las_columnas(app):
+    sql, params, campos, limite = consulta(app)
+    assert campos == list(app.COLUMNAS_PRODUCTOS)
+    assert params == []
+    assert limite is None
+    assert "LIMIT" not in sql
+    for join in app.JOINS_PRODUCTOS.values():
+        assert join in sql
+
+
+def test_campos_pedidos_solo_unen_las_tablas_necesarias(app):
+    sql, _, campos, _ = consulta(app, fields="nomproducto, color")
+    assert campos == ["nomproducto", "color"]
+    assert "c.nombre AS color" in sql
+    assert app.JOINS_PRODUCTOS["c"] in sql
+    assert app.JOINS_PRODUCTOS["m"] not in sql
+
+
+def test_campo_desconocido(app):
+    with pytest.raises(ValueError, match="Campos no soportados: clave"):
+        consulta(app, fields="nomproducto,clave")
+
+
+def test_filtros_convierten_valores_y_agregan_joins(app):
+    sql, params, _, _ = consulta(app, fields="nomproducto", id_categoria="3", talla="M", precio_min="1000.5")
+    assert "p.id_categoria = %s" in sql
+    assert "t.valor = %s" in sql and app.JOINS_PRODUCTOS["t"] in sql
+    assert params == [3, "M", 1000.5]
+
+
+def test_filtro_invalido(app):
+    with pytest.raises(ValueError, match="id_color"):
+        consulta(app, id_color="azul")
+
+
+def test_paginado_agrega_id_variante_y_limita(app):
+    sql, params, campos, limite = consulta(app, fields="nomproducto", limit="5000")
+    assert campos == ["nomproducto"]
+    assert "v.id_variante AS id_variante" in sql
+    assert sql.rstrip().endswith("ORDER BY v.id_variante\nLIMIT %s")
+    assert limite == app.PRODUCTOS_LIMITE_MAX
+    assert params == [limite + 1]
+
+
+def test_cursor_ida_y_vuelta(app):
+    token = app.codificar_cursor_productos(42)
+    assert app.decodificar_cursor_productos(token) == 42
+
+    sql, params, _, limite = consulta(app, fields="nomproducto", cursor=token)
+    assert "v.id_variante > %s" in sql
+    assert limite == app.PRODUCTOS_LIMITE_DEFECTO
+    assert params == [42, limite + 1]
+
+
+@pytest.mark.parametrize("token", ["", "basura", "eyJ2Ijo0Mn0.AAAA.BBBB"])
+def test_cursor_invalido(app, token):
+    with pytest.raises(ValueError, match="Cursor inválido"):
+        app.decodificar_cursor_productos(token)
+
+
+def test_cursor_de_otro_uso_no_sirve(app):
+    token = app.serializer.dumps({"v": 42}, salt="otro")
+    with pytest.raises(ValueError):
+        app.decodificar_cursor_productos(token)
+
+
+@pytest.mark.parametrize("valor", ["nan", "inf", "-Infinity", "1e400"])
+def test_precio_no_finito(app, valor):
+    with pytest.raises(ValueError, match="precio_max"):
+        consulta(app, precio_max=valor)
+
+
+def test_precio_no_finito_responde_400(cliente):
+    response = cliente.get("/GetProductos?precio_min=nan")
+    assert response.status_code == 400
+    assert response.get_json() == {"ok": False, "error": "Valor inválido para precio_min"}
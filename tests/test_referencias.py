@@ -0,0 +1,84 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_vacia(app):
+    app.cache_referencias.limpiar()
+
+
+@pytest.fixture
+def categorias(base_falsa):
+    filas = [{"id_categoria": 1, "nombre": "Camisas"}]
+    base_falsa["FROM categorias"] = lambda sql, params, cursor: list(filas)
+    return filas
+
+
+def lecturas(base_falsa):
+    return len(base_falsa.buscar("FROM categorias"))
+
+
+def test_segunda_lectura_sale_de_la_cache(cliente, base_falsa, categorias):
+    primera = cliente.get("/GetCategorias")
+    segunda = cliente.get("/GetCategorias")
+
+    assert primera.get_json() == segunda.get_json() == categorias
+    assert lecturas(base_falsa) == 1
+
+
+def test_agregar_invalida(cliente, base_falsa, categorias):
+    cliente.get("/GetCategorias")
+
+    assert cliente.post("/AddCategoria", json={"nombre": "Botas"}).get_json() == {"ok": True}
+    categorias.append({"id_categoria": 2, "nombre": "Botas"})
+
+    assert cliente.get("/GetCategorias").get_json() == categorias
+    assert lecturas(base_falsa) == 2
+
+
+def test_cambio_en_otro_worker_invalida(app, cliente, base_falsa, categorias):
+    cliente.get("/GetCategorias")
+
+    # Otro worker solo puede avisar por el archivo de versión compartido
+    app.versiones_datos.incrementar(app.VERSION_REFERENCIAS)
+
+    cliente.get("/GetCategorias")
+    assert lecturas(base_falsa) == 2
+
+
+def test_parametros_distintos_no_se_mezclan(cliente, base_falsa):
+    base_falsa["FROM tallas"] = lambda sql, params, cursor: [{"id_talla": params[0], "valor": "M"}]
+
+    uno = cliente.get("/GetTallasPorCategoriaGenero?id_categoria=1&id_genero=1").get_json()
+    dos = cliente.get("/GetTallasPorCategoriaGenero?id_categoria=2&id_genero=1").get_json()
+    assert uno != dos
+
+
+def test_errores_no_se_guardan(app, cliente, base_falsa):
+    assert cliente.get("/GetEstilosUnicos?format=xml").status_code == 400
+    assert not app.cache_referencias._datos
+
+
+def test_ttl_y_version(app):
+    cache = app.CacheReferencias(ttl=60, max_entradas=10)
+    cache.guardar("/GetColores", "v1", b"[]")
+
+    assert cache.obtener("/GetColores", "v1") == b"[]"
+    assert cache.obtener("/GetColores", "v2") is None
+    # la entrada vieja se descarta al detectar el cambio
+    assert cache.obtener("/GetColores", "v1") is None
+
+    vencida = app.CacheReferencias(ttl=0, max_entradas=10)
+    vencida.guardar("/GetColores", "v1", b"[]")
+    assert vencida.obtener("/GetColores", "v1") is None
+
+
+def test_descarta_la_menos_usada(app):
+    cache = app.CacheReferencias(ttl=60, max_entradas=2)
+    cache.guardar("a", "v", b"1")
+    cache.guardar("b", "v", b"2")
+    cache.obtener("a", "v")
+    cache.guardar("c", "v", b"3")
+
+    assert cache.obtener("b", "v") is None
+    assert cache.obtener("a", "v") == b"1"
+    assert cache.obtener("c", "v") == b"3"
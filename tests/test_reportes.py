@@ -0,0 +1,170 @@
+import re
+import zipfile
+import zlib
+from io import BytesIO
+
+import pytest
+
+COLUMNAS = ["Categoria", "Producto", "Talla", "Cantidad", "Total"]
+FILAS = [
+    {"Categoria": "Camisas", "Producto": "Camisa Oxford", "Talla": "M", "Cantidad": 3, "Total": "$ 105.000"},
+    {"Categoria": "Botas", "Producto": "Bota <Ñandú> & co", "Talla": "38", "Cantidad": 2, "Total": 178000},
+]
+FILTROS = ("Camisas", None, None, None, None)
+
+
+def contexto(app, filas):
+    context = app.build_reporte_encabezado(FILTROS)
+    context.update({"columnas": COLUMNAS, "filas": filas, **app.calcular_totales_reporte(filas)})
+    return context
+
+
+def textos_pdf(pdf):
+    # Operaciones de dibujo de todas las páginas, ya descomprimidas
+    flujos = re.findall(rb"/FlateDecode >>\nstream\n(.*?)\nendstream", pdf, re.S)
+    return b"".join(zlib.decompress(flujo) for flujo in flujos).decode("latin-1")
+
+
+def revisar_estructura_pdf(pdf):
+    assert pdf.startswith(b"%PDF-1.4")
+    assert pdf.endswith(b"%%EOF\n")
+
+    # Cada entrada de la tabla xref apunta al inicio de su objeto
+    inicio_xref = int(re.search(rb"startxref\n(\d+)", pdf).group(1))
+    assert pdf[inicio_xref:].startswith(b"xref")
+    offsets = re.findall(rb"(\d{10}) 00000 n", pdf[inicio_xref:])
+    assert offsets
+    for numero, offset in enumerate(offsets, start=1):
+        assert pdf[int(offset):].startswith(b"%d 0 obj" % numero)
+
+
+def test_totales_reporte(app):
+    totales = app.calcular_totales_reporte(FILAS)
+    assert totales["cantidad_total_num"] == 5
+    assert totales["valor_total_num"] == 283000
+    assert totales["valor_total"] == "$ 283.000"
+
+
+def test_pdf_completo(app):
+    pdf = b"".join(app.generar_pdf_tabular(contexto(app, FILAS)))
+    revisar_estructura_pdf(pdf)
+
+    texto = textos_pdf(pdf)
+    assert "2 registros generados" in texto
+    assert "Camisa Oxford" in texto
+    assert "$ 283.000" in texto
+
+
+def test_pdf_por_lotes_varias_paginas(app):
+    filas = [dict(FILAS[0], Producto=f"Producto {i}") for i in range(400)]
+    lotes = [filas[i:i + 50] for i in range(0, len(filas), 50)]
+
+    pdf = b"".join(app.generar_pdf_tabular(contexto(app, []), iter(lotes)))
+    revisar_estructura_pdf(pdf)
+
+    paginas = int(re.search(rb"/Count (\d+)", pdf).group(1))
+    assert paginas > 1
+    assert pdf.count(b"/Type /Page ") == paginas
+
+    texto = textos_pdf(pdf)
+    assert "400 registros generados" in texto
+    assert "Producto 0" in texto and "Producto 399" in texto
+
+
+def test_pdf_por_lotes_no_lee_todo_antes_de_entregar(app):
+    leidos = []
+
+    def lotes():
+        for i in range(20):
+            leidos.append(i)
+            yield [dict(FILAS[0], Producto=f"Producto {i}-{j}") for j in range(50)]
+
+    partes = app.generar_pdf_tabular(contexto(app, []), lotes())
+    # hasta la primera página llena solo se leen los lotes que caben en ella
+    next(p for p in partes if b"/Type /Page " in p)
+    assert len(leidos) < 20
+    assert sum(1 for _ in partes) > 1
+    assert len(leidos) == 20
+
+
+def test_pdf_vacio(app):
+    pdf = b"".join(app.generar_pdf_tabular(contexto(app, [])))
+    revisar_estructura_pdf(pdf)
+
+
+def test_escapar_texto_pdf(app):
+    assert app.escapar_texto_pdf("Talla (M) \\ Ñandú €") == "Talla \\(M\\) \\\\ \xd1and\xfa \x80"
+    assert app.escapar_texto_pdf("中") == "?"
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    (None, "<c/>"),
+    (3, "<c><v>3</v></c>"),
+    (True, '<c t="inlineStr"><is><t xml:space="preserve">True</t></is></c>'),
+    ("a<b>&\x01c", '<c t="inlineStr"><is><t xml:space="preserve">a&lt;b&gt;&amp;c</t></is></c>'),
+])
+def test_celda_xlsx(app, valor, esperado):
+    assert app.celda_xlsx(valor) == esperado
+
+
+def test_xlsx(app, monkeypatch):
+    def iterar_datos_reporte(filtros, fuente):
+        yield COLUMNAS, iter([FILAS[:1], FILAS[1:]])
+
+    monkeypatch.setattr(app, "iterar_datos_reporte", iterar_datos_reporte)
+    contenido = b"".join(app.stream_reporte_xlsx(FILTROS))
+
+    with zipfile.ZipFile(BytesIO(contenido)) as libro:
+        assert libro.testzip() is None
+        assert set(libro.namelist()) >= {
+            "[Content_Types].xml", "_rels/.rels", "xl/workbook.xml",
+            "xl/_rels/workbook.xml.rels", "xl/worksheets/sheet1.xml"
+        }
+        hoja = libro.read("xl/worksheets/sheet1.xml").decode("utf-8")
+
+    filas = re.findall(r"<row>.*?</row>", hoja)
+    # encabezado, dos filas, separador y dos filas de totales
+    assert len(filas) == 6
+    assert "Categoria" in filas[0]
+    assert "Bota &lt;Ñandú&gt; &amp; co" in filas[2]
+    assert "<v>178000</v>" in filas[2]
+    assert "Valor total" in filas[5] and "<v>283000</v>" in filas[5]
+
+
+def test_csv(app, monkeypatch):
+    def iterar_datos_reporte(filtros, fuente):
+        yield COLUMNAS, iter([FILAS[:1], FILAS[1:]])
+
+    monkeypatch.setattr(app, "iterar_datos_reporte", iterar_datos_reporte)
+    partes = list(app.stream_reporte_csv(FILTROS))
+
+    # una parte por lote más la de totales
+    assert len(partes) == 3
+    lineas = "".join(partes).splitlines()
+    assert lineas[0] == "\ufeffCategoria;Producto;Talla;Cantidad;Total"
+    assert lineas[2] == "Botas;Bota <Ñandú> & co;38;2;178000"
+    assert lineas[-2:] == ["Cantidad total;5", "Valor total;283000"]
+
+
+@pytest.mark.parametrize("totales, esperado", [
+    ((5.0, 283000.0), ["Valor total", 283000]),
+    ((2.0, 0.1 + 0.2 + 1000), ["Valor total", 1000.3]),
+    ((0, 0), ["Valor total", 0]),
+])
+def test_valor_total_conserva_los_centavos(app, totales, esperado):
+    assert app.filas_totales_exportacion(totales)[-1] == esperado
+
+
+def test_csv_con_centavos(app, monkeypatch):
+    def iterar_datos_reporte(filtros, fuente):
+        yield COLUMNAS, iter([[dict(FILAS[1], Total=1999.99), dict(FILAS[1], Total=0.01)]])
+
+    monkeypatch.setattr(app, "iterar_datos_reporte", iterar_datos_reporte)
+    lineas = "".join(app.stream_reporte_csv(FILTROS)).splitlines()
+
+    assert lineas[-1] == "Valor total;2000"
+
+    monkeypatch.setattr(app, "iterar_datos_reporte", lambda filtros, fuente: iter([
+        (COLUMNAS, iter([[dict(FILAS[1], Total=1999.5)]]))
+    ]))
+    assert "".join(app.stream_reporte_csv(FILTROS)).splitlines()[-1] == "Valor total;1999.5"
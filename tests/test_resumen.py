@@ -0,0 +1,130 @@
+from decimal import Decimal
+
+import pytest
+
+
+@pytest.fixture
+def resumen(app, monkeypatch):
+    monkeypatch.setattr(app, "RESUMEN_INVENTARIO", True)
+
+
+@pytest.fixture
+def cursor(base_falsa):
+    return base_falsa.conectar().cursor(dictionary=True)
+
+
+@pytest.fixture
+def variantes(base_falsa):
+    # id_variante 3 es inactiva: el SELECT no la devuelve
+    filas = {
+        1: {"id_variante": 1, "id_producto": 5, "id_talla": 7, "precio": 1000,
+            "id_categoria": 1, "id_genero": 2, "id_estilo": None},
+        2: {"id_variante": 2, "id_producto": 4, "id_talla": 0, "precio": 500,
+            "id_categoria": 1, "id_genero": 2, "id_estilo": 9},
+        4: {"id_variante": 4, "id_producto": 5, "id_talla": 7, "precio": 1200,
+            "id_categoria": 1, "id_genero": 2, "id_estilo": None},
+    }
+    base_falsa["COALESCE(v.id_talla, 0) AS id_talla, v.precio"] = lambda sql, params, cursor: [
+        filas[i] for i in params if i in filas
+    ]
+    return filas
+
+
+def test_apagado_no_escribe(app, base_falsa, cursor):
+    app.sumar_resumen(cursor, [(1, 3)])
+    app.recalcular_resumen(cursor, [5])
+    assert base_falsa.ejecutadas == []
+
+
+def test_suma_por_producto_y_talla_en_orden(app, base_falsa, cursor, resumen, variantes):
+    app.sumar_resumen(cursor, [(1, -2), (2, 4), (3, 1), (4, 1), (1, 5)])
+
+    select, insert = base_falsa.ejecutadas
+    assert select[1] == [1, 2, 3, 4]
+    assert "ON DUPLICATE KEY UPDATE" in insert[0]
+    # llaves ordenadas; la variante inactiva se ignora
+    assert insert[1] == [
+        (4, 0, 1, 2, 9, 4, 2000),
+        (5, 7, 1, 2, None, 4, 4200),
+    ]
+
+
+def test_deltas_de_variantes_inactivas_no_escriben(app, base_falsa, cursor, resumen, variantes):
+    app.sumar_resumen(cursor, [(3, 1)])
+    assert not base_falsa.buscar("INSERT INTO resumen_inventario")
+
+
+def test_venta_actualiza_el_resumen_en_su_transaccion(cliente, base_falsa, resumen, variantes):
+    def descontar(sql, params, cursor):
+        cursor.rowcount = 1
+        cursor.lastrowid = 7
+        return []
+
+    base_falsa["SET stock = LAST_INSERT_ID"] = descontar
+    response = cliente.post("/RegistrarVenta", json={"items": [
+        {"id_variante": 1, "cantidad": 3, "precio_venta": 1000}
+    ]})
+
+    assert response.get_json()["ok"] is True
+    (_, filas), = base_falsa.buscar("INSERT INTO resumen_inventario")
+    assert filas == [(5, 7, 1, 2, None, -3, -3000)]
+    assert base_falsa.conexiones[0].commits == 1
+
+
+def test_recalcular_productos(app, base_falsa, cursor, resumen):
+    app.recalcular_resumen(cursor, [8, 5, 8])
+
+    borrar, insertar = base_falsa.ejecutadas
+    assert borrar == ("DELETE FROM resumen_inventario WHERE id_producto IN (%s,%s)", [5, 8])
+    assert "AND p.id_producto IN (%s,%s)" in insertar[0] and insertar[1] == [5, 8]
+
+
+def test_recalcular_todo(app, base_falsa, cursor):
+    # La reconstrucción completa corre aunque el resumen no esté activo
+    app.recalcular_resumen(cursor)
+
+    borrar, insertar = base_falsa.ejecutadas
+    assert borrar[0] == "DELETE FROM resumen_inventario"
+    assert "GROUP BY" in insertar[0] and insertar[1] is None
+
+
+@pytest.mark.parametrize("dictionary", [True, False])
+def test_consultar_convierte_el_total(app, base_falsa, dictionary):
+    base_falsa["FROM resumen_inventario r"] = [
+        {"Categoria": "Camisas", "Producto": "Oxford", "Cantidad": 3, "Total": Decimal("3000.50")}
+    ]
+    cursor = base_falsa.conectar().cursor(dictionary=dictionary)
+
+    columnas, filas = app.consultar_resumen_inventario(cursor, ("Camisas", None, None, None, None))
+
+    assert columnas == ["Categoria", "Producto", "Cantidad", "Total"]
+    total = filas[0]["Total"] if dictionary else filas[0][3]
+    assert total == 3000.5 and isinstance(total, float)
+    sql, params = base_falsa.ejecutadas[0]
+    assert "WHERE cat.nombre = %s" in sql and params == ["Camisas"]
+
+
+def test_diferencias(app):
+    fila = {"id_categoria": 1, "id_genero": 2, "id_estilo": None, "cantidad": 3, "valor": 30}
+    calculado = {(5, 7): fila, (6, 0): fila}
+    guardado = {
+        (5, 7): dict(fila, cantidad=2),
+        (9, 0): dict(fila, cantidad=0, valor=0),
+    }
+
+    assert app.diferencias_resumen(calculado, guardado) == [
+        ((5, 7), fila, guardado[(5, 7)]),
+        ((6, 0), fila, None),
+    ]
+
+
+def test_cli_verificar(app, base_falsa):
+    fila = {"id_producto": 5, "id_talla": 7, "id_categoria": 1, "id_genero": 2,
+            "id_estilo": None, "cantidad": 3, "valor": 30}
+    base_falsa["FROM resumen_inventario"] = [fila]
+    base_falsa["FROM variantes v"] = [dict(fila, cantidad=4)]
+
+    resultado = app.app.test_cli_runner().invoke(args=["resumen-verificar"])
+
+    assert resultado.exit_code == 1
+    assert "1 diferencias" in resultado.output
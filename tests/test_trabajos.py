@@ -0,0 +1,169 @@
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+
+class EjecutorFalso:
+    # Ejecuta el trabajo en el mismo proceso al enviarlo, o lo deja
+    # pendiente si inmediato=False
+
+    def __init__(self, inmediato=True, roto=False):
+        self.inmediato = inmediato
+        self.roto = roto
+        self.futuros = []
+        self.cerrado = False
+
+    def submit(self, funcion, *args):
+        if self.roto:
+            raise BrokenProcessPool("un hijo murió")
+        futuro = Future()
+        if self.inmediato:
+            futuro.set_result(funcion(*args))
+        self.futuros.append(futuro)
+        return futuro
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.cerrado = True
+
+
+@pytest.fixture
+def reportes(app, monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "REPORTES_DIR", str(tmp_path))
+    monkeypatch.setattr(app, "generar_reporte_general", lambda formato, filtros: b"<html>ok</html>")
+    return tmp_path
+
+
+@pytest.fixture
+def ejecutor(app, monkeypatch, reportes):
+    pool = app.PoolReportes(1, 2)
+    ejecutor = EjecutorFalso()
+    monkeypatch.setattr(pool, "_obtener_executor", lambda: ejecutor)
+    monkeypatch.setattr(app, "pool_reportes", pool)
+    return ejecutor
+
+
+def solicitar(cliente):
+    response = cliente.post("/SolicitarReporte", json={"format": "html"})
+    return response, (response.get_json() or {}).get("id_trabajo")
+
+
+def test_trabajo_completo(cliente, ejecutor):
+    response, id_trabajo = solicitar(cliente)
+    assert response.status_code == 202
+
+    estado = cliente.get(f"/EstadoReporte?id={id_trabajo}").get_json()
+    assert estado["estado"] == "listo" and estado["format"] == "html"
+
+    descarga = cliente.get(f"/DescargarReporte?id={id_trabajo}")
+    assert descarga.status_code == 200
+    assert descarga.data == b"<html>ok</html>"
+
+
+def test_error_del_trabajo_queda_en_el_estado(app, cliente, ejecutor, monkeypatch):
+    def fallar(formato, filtros):
+        raise RuntimeError("sin conexión")
+
+    monkeypatch.setattr(app, "generar_reporte_general", fallar)
+    _, id_trabajo = solicitar(cliente)
+
+    assert cliente.get(f"/EstadoReporte?id={id_trabajo}").get_json()["error"] == "sin conexión"
+    descarga = cliente.get(f"/DescargarReporte?id={id_trabajo}")
+    assert descarga.status_code == 500
+
+
+def test_pendiente_no_se_descarga(cliente, ejecutor):
+    ejecutor.inmediato = False
+    _, id_trabajo = solicitar(cliente)
+
+    assert cliente.get(f"/EstadoReporte?id={id_trabajo}").get_json()["estado"] == "pendiente"
+    assert cliente.get(f"/DescargarReporte?id={id_trabajo}").status_code == 409
+
+
+def test_limite_de_pendientes(cliente, ejecutor, reportes):
+    ejecutor.inmediato = False
+    solicitar(cliente)
+    solicitar(cliente)
+
+    response, _ = solicitar(cliente)
+    assert response.status_code == 429
+    # el estado del rechazado no queda en disco
+    assert len(list(reportes.glob("*.json"))) == 2
+
+    ejecutor.futuros[0].set_result(None)
+    assert solicitar(cliente)[0].status_code == 202
+
+
+def test_pool_roto_se_reemplaza(app, monkeypatch, reportes):
+    pool = app.PoolReportes(1, 2)
+    ejecutores = [EjecutorFalso(roto=True), EjecutorFalso()]
+    pool._executor = ejecutores[0]
+    monkeypatch.setattr(app, "ProcessPoolExecutor", lambda **opciones: ejecutores.pop())
+
+    assert pool.enviar("a" * 32, "html", {}, time.time())
+    assert pool._executor is not None and not pool._executor.roto
+
+
+def test_hijo_muerto_marca_error(app, reportes):
+    pool = app.PoolReportes(1, 2)
+    futuro = Future()
+    futuro.set_exception(BrokenProcessPool("un hijo murió"))
+
+    pool._al_terminar(futuro, "b" * 32, "html", 0)
+
+    assert app.leer_estado_trabajo("b" * 32)["estado"] == "error"
+
+
+@pytest.mark.parametrize("id_trabajo", ["../secreto", "A" * 32, ""])
+def test_id_invalido(cliente, reportes, id_trabajo):
+    assert cliente.get(f"/EstadoReporte?id={id_trabajo}").status_code == 404
+    assert cliente.get(f"/DescargarReporte?id={id_trabajo}").status_code == 404
+
+
+def test_limpia_los_vencidos(app, reportes):
+    viejo = reportes / ("c" * 32 + ".json")
+    nuevo = reportes / ("d" * 32 + ".json")
+    viejo.write_text("{}")
+    nuevo.write_text("{}")
+    os.utime(viejo, (0, 0))
+
+    app.limpiar_trabajos_vencidos()
+
+    assert not viejo.exists() and nuevo.exists()
+
+
+def pid_muerto():
+    proceso = subprocess.Popen([sys.executable, "-c", "pass"])
+    proceso.wait()
+    return proceso.pid
+
+
+@pytest.mark.parametrize("estado", ["pendiente", "procesando"])
+def test_trabajo_de_un_proceso_muerto_pasa_a_error(app, cliente, reportes, estado):
+    id_trabajo = "e" * 32
+    app.escribir_estado_trabajo(id_trabajo, estado=estado, format="html", creado=time.time(), pid=pid_muerto())
+
+    data = cliente.get(f"/EstadoReporte?id={id_trabajo}").get_json()
+    assert data["estado"] == "error" and "pid" not in data
+    assert cliente.get(f"/DescargarReporte?id={id_trabajo}").status_code == 500
+    # queda guardado para los demás workers
+    assert app.leer_estado_trabajo(id_trabajo)["estado"] == "error"
+
+
+def test_trabajo_vencido_pasa_a_error(app, cliente, reportes):
+    id_trabajo = "f" * 32
+    app.escribir_estado_trabajo(id_trabajo, estado="pendiente", format="html", creado=0, pid=os.getpid())
+
+    assert cliente.get(f"/DescargarReporte?id={id_trabajo}").status_code == 500
+
+
+def test_trabajo_vivo_sigue_pendiente(app, cliente, reportes):
+    id_trabajo = "0" * 32
+    app.escribir_estado_trabajo(id_trabajo, estado="pendiente", format="html", creado=time.time(), pid=os.getpid())
+
+    data = cliente.get(f"/EstadoReporte?id={id_trabajo}").get_json()
+    assert data["estado"] == "pendiente" and "pid" not in data
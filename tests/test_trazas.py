@@ -0,0 +1,21 @@
+def test_huella_reemplaza_literales_y_marcadores(app):
+    huella = app.huella_sql("SELECT * FROM productos WHERE nombre = 'Camisa' AND id_estado = 1 AND id = %s")
+    assert huella == "SELECT * FROM productos WHERE nombre = ? AND id_estado = ? AND id = ?"
+
+
+def test_huella_normaliza_espacios_y_comentarios(app):
+    a = app.huella_sql("SELECT id\n    FROM  variantes -- comentario\n WHERE stock > 0")
+    b = app.huella_sql("SELECT id FROM variantes /* otro */ WHERE stock > 5")
+    assert a == b == "SELECT id FROM variantes WHERE stock > ?"
+
+
+def test_huella_agrupa_listas_de_cualquier_largo(app):
+    corta = app.huella_sql("SELECT * FROM variantes WHERE id_variante IN (%s)")
+    larga = app.huella_sql("SELECT * FROM variantes WHERE id_variante IN (%s, %s, %s)")
+    assert corta == larga == "SELECT * FROM variantes WHERE id_variante IN (?+)"
+
+
+def test_huella_agrupa_inserts_multifila(app):
+    una = app.huella_sql("INSERT INTO colores (nombre, id_estado) VALUES (%s, %s)")
+    varias = app.huella_sql("INSERT INTO colores (nombre, id_estado) VALUES (%s, %s), (%s, %s), ('Azul', 1)")
+    assert una == varias == "INSERT INTO colores (nombre, id_estado) VALUES (?+)"
@@ -0,0 +1,98 @@
+import pytest
+
+
+@pytest.fixture
+def cursor(base_falsa):
+    return base_falsa.conectar().cursor(dictionary=True)
+
+
+def tallas_existentes(*existentes):
+    # Responde el SELECT de tallas con las que ya "existen" o se
+    # insertaron, comparando sin mayúsculas como la collation de MySQL
+    tabla = {valor.lower(): (id_talla, valor) for valor, id_talla in existentes}
+
+    def responder(sql, params, cursor):
+        if sql.startswith("INSERT"):
+            for valor, *_ in params:
+                tabla[valor.rstrip().lower()] = (101 + len(tabla), valor)
+            return []
+        pedidas = {v.rstrip().lower() for v in params[2:]}
+        return [{"id_talla": tabla[v][0], "valor": tabla[v][1]} for v in pedidas if v in tabla]
+
+    return responder
+
+
+def test_resolver_tallas_crea_solo_las_faltantes(app, base_falsa, cursor):
+    base_falsa["tallas"] = tallas_existentes(("M", 7))
+
+    ids = app.resolver_tallas(cursor, 1, 2, ["M", "l", "L ", "XL"])
+
+    assert ids == {"m": 7, "l": 102, "xl": 103}
+    inserts = base_falsa.buscar("INSERT INTO tallas")
+    assert len(inserts) == 1
+    assert inserts[0][1] == [("l", 1, 2, 1), ("XL", 1, 2, 1)]
+    assert len(base_falsa.buscar("SELECT id_talla, valor FROM tallas")) == 2
+
+
+def test_resolver_tallas_sin_faltantes_no_inserta(app, base_falsa, cursor):
+    base_falsa["tallas"] = tallas_existentes(("M", 7), ("L", 8))
+
+    assert app.resolver_tallas(cursor, 1, 2, ["m", "L"]) == {"m": 7, "l": 8}
+    assert not base_falsa.buscar("INSERT INTO tallas")
+
+
+def test_upsert_variantes_en_dos_sentencias(app, base_falsa, cursor):
+    base_falsa["FROM variantes"] = [
+        {"id_variante": 40, "id_producto": 5, "id_color": 1, "id_talla": 7},
+    ]
+
+    app.upsert_variantes(cursor, [
+        (5, 1, 7, 35000, 10),
+        (5, 1, 8, 36000, 4),
+        (5, 2, 7, 35000, 1),
+    ])
+
+    select, insert = base_falsa.ejecutadas
+    assert "FROM variantes" in select[0]
+    assert select[1][:2] == [5, 1] and sorted(select[1][2:4]) == [7, 8]
+    assert select[1][4:] == [5, 2, 7]
+    assert "ON DUPLICATE KEY UPDATE" in insert[0]
+    assert insert[1] == [
+        (40, 5, 1, 7, 35000, 10, 1),
+        (None, 5, 1, 8, 36000, 4, 1),
+        (None, 5, 2, 7, 35000, 1, 1),
+    ]
+
+
+def test_upsert_variantes_vacio(app, base_falsa, cursor):
+    app.upsert_variantes(cursor, [])
+    assert base_falsa.ejecutadas == []
+
+
+def test_add_producto_con_muchas_variantes(cliente, base_falsa):
+    def insertar_producto(sql, params, cursor):
+        cursor.lastrowid = 5
+        return []
+
+    base_falsa["INSERT INTO productos"] = insertar_producto
+    base_falsa["tallas"] = tallas_existentes()
+
+    response = cliente.post("/AddProducto", json={
+        "id_categoria": 1,
+        "id_genero": 2,
+        "id_color": 3,
+        "nombre": "Camisa",
+        "variantes": [
+            {"talla": "M", "precio": 1000, "stock": 1},
+            {"talla": "m", "precio": 2000, "stock": 2},
+        ] + [{"talla": str(talla), "precio": 500, "stock": 1} for talla in range(30)]
+    })
+
+    assert response.get_json() == {"ok": True}
+    # La cantidad de sentencias no depende de la cantidad de variantes
+    assert len(base_falsa.buscar("variantes")) == 2
+    _, filas = base_falsa.buscar("INSERT INTO variantes")[0]
+    assert len(filas) == 31
+    # talla repetida: se crea la primera con el precio y stock de la última
+    assert filas[0] == (None, 5, 3, 101, 2000, 2, 1)
+    assert base_falsa.conexiones[0].commits == 1
@@ -0,0 +1,99 @@
+import pytest
+
+
+@pytest.fixture
+def stock(base_falsa):
+    # {id_variante: stock}; el UPDATE condicional se resuelve como en MySQL
+    stock = {10: 5, 20: 1}
+
+    def descontar(sql, params, cursor):
+        cantidad, id_variante, minimo = params
+        if id_variante in stock and stock[id_variante] >= minimo:
+            stock[id_variante] -= cantidad
+            cursor.rowcount = 1
+            cursor.lastrowid = stock[id_variante]
+        else:
+            cursor.rowcount = 0
+        return []
+
+    def leer(sql, params, cursor):
+        return [{"stock": stock[params[0]]}] if params[0] in stock else []
+
+    base_falsa["SET stock = LAST_INSERT_ID"] = descontar
+    base_falsa["SELECT stock FROM variantes"] = leer
+    return stock
+
+
+def vender(cliente, *items):
+    return cliente.post("/RegistrarVenta", json={"items": [
+        {"id_variante": id_variante, "cantidad": cantidad, "precio_venta": 1000}
+        for id_variante, cantidad in items
+    ]})
+
+
+def test_descontar_stock_es_un_update_condicional(app, base_falsa, stock):
+    cursor = base_falsa.conectar().cursor(dictionary=True)
+
+    assert app.descontar_stock(cursor, 10, 2) == 3
+    assert app.descontar_stock(cursor, 20, 2) is None
+    # quedar en 0 (lastrowid 0) no se confunde con un rechazo
+    assert app.descontar_stock(cursor, 10, 3) == 0
+
+    sql, params = base_falsa.ejecutadas[0]
+    assert "stock >= %s" in sql and params == (2, 10, 2)
+    assert not base_falsa.buscar("SELECT")
+
+
+def test_venta_ordena_los_bloqueos_y_escribe_un_insert(cliente, base_falsa, stock):
+    response = vender(cliente, (20, 1), (10, 2))
+
+    assert response.get_json() == {"ok": True, "lineas": 2, "total_venta": 3000}
+    assert stock == {10: 3, 20: 0}
+    updates = base_falsa.buscar("SET stock = LAST_INSERT_ID")
+    assert [params[1] for _, params in updates] == [10, 20]
+
+    (_, movimientos), = base_falsa.buscar("INSERT INTO movimientos_inventario")
+    assert movimientos == [(10, 2, 5, 3, 1000, 2000), (20, 1, 1, 0, 1000, 1000)]
+    assert base_falsa.conexiones[0].commits == 1
+
+
+@pytest.mark.parametrize("items, status, error", [
+    ([(10, 1), (20, 2)], 400, "Cantidad inválida"),
+    ([(10, 1), (99, 1)], 404, "Variante no encontrada"),
+])
+def test_venta_rechazada_no_escribe(cliente, base_falsa, stock, items, status, error):
+    response = vender(cliente, *items)
+
+    assert response.status_code == status
+    assert response.get_json()["error"] == error
+    assert not base_falsa.buscar("INSERT INTO movimientos_inventario")
+    assert base_falsa.conexiones[0].commits == 0
+    assert base_falsa.conexiones[0].rollbacks >= 1
+
+
+@pytest.mark.parametrize("item, error", [
+    ({"id_variante": 10, "cantidad": 1}, "Datos incompletos"),
+    ({"id_variante": "x", "cantidad": 1, "precio_venta": 1}, "Variante inválida"),
+    ({"id_variante": 10, "cantidad": 0, "precio_venta": 1}, "Cantidad inválida"),
+    ({"id_variante": 10, "cantidad": 1.5, "precio_venta": 1}, "Cantidad inválida"),
+    ({"id_variante": 10, "cantidad": True, "precio_venta": 1}, "Cantidad inválida"),
+])
+def test_venta_valida_antes_de_conectar(cliente, base_falsa, stock, item, error):
+    response = cliente.post("/RegistrarVenta", json={"items": [item]})
+
+    assert response.status_code == 400
+    assert response.get_json()["error"] == error
+    assert not base_falsa.conexiones
+
+
+def test_venta_sin_items(cliente, base_falsa):
+    assert cliente.post("/RegistrarVenta", json={"items": []}).status_code == 400
+
+
+@pytest.mark.parametrize("cuerpo", [[1, 2], "venta", 7, {"items": [10]}, {"items": [None]}])
+def test_venta_con_json_que_no_es_objeto(cliente, base_falsa, cuerpo):
+    response = cliente.post("/RegistrarVenta", json=cuerpo)
+
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Datos incompletos"
+    assert not base_falsa.conexiones